@@ -0,0 +1,40 @@
+"""
+Measures how long one vectorized exit-rule pass over the PositionTable takes for
+different numbers of open positions.
+
+Run from the repository root: python benchmarks/bench_exit_rules.py
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pieces.position_table import PositionTable
+
+POSITION_COUNTS = [100, 1_000, 10_000]
+TOKENS_PER_POSITIONS = 10  # One token for every 10 positions
+TICKS = 200
+
+def build_table(count, rng):
+    tokens = [f'0x{i:040x}' for i in range(max(1, count // TOKENS_PER_POSITIONS))]
+    table = PositionTable()
+    for i in range(count):
+        # Wide thresholds so positions stay open for the whole run
+        table.add(i, rng.choice(tokens), 1.0, 1000 * 10 ** 18, 0.0, 10.0, 0.99, 0.1, True, 0.0001, 5)
+    return table, tokens
+
+if __name__ == '__main__':
+    rng = random.Random(1)
+    print(f"{'positions':>10} {'us/update':>12} {'ns/position':>12}")
+    for count in POSITION_COUNTS:
+        table, tokens = build_table(count, rng)
+        prices = {token: 1.0 for token in tokens}
+        begin = time.perf_counter()
+        for tick in range(TICKS):
+            for token in tokens:
+                prices[token] *= 1 + rng.uniform(-0.01, 0.01)
+            table.evaluate(tick * 3.0, prices)
+        elapsed = (time.perf_counter() - begin) / TICKS
+        print(f"{count:>10} {elapsed * 1e6:>12.1f} {elapsed * 1e9 / count:>12.1f}")
@@ -0,0 +1,133 @@
+"""
+Measures webhook filtering throughput in messages per second: the original per-call
+regex compilation, list lookups and open/append/close archive writes (a verbatim copy
+of the first version of pieces/filters.py) against the precompiled patterns, set
+lookups and background archive writer in pieces/filters.py. Both archive every message.
+The input mixes Uniswap and Banana Gun buys, sells and other wallet activity.
+Filter logging is disabled for both so only the filtering work itself is timed.
+
+Run from the repository root: python benchmarks/bench_filters.py
+"""
+import os
+import re
+import sys
+import time
+import random
+import logging
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pieces import filters
+from pieces.archive import LineArchive
+
+MESSAGES = 50_000
+WATCHED_NAMES = [f'wallet{i}' for i in range(20)]
+OTHER_NAMES = [f'other{i}' for i in range(200)]
+ACTION_TEXT_FILE = None  # The legacy archive, set to a temporary file below
+
+def build_messages(rng):
+    messages = []
+    for i in range(MESSAGES):
+        token = f'0x{rng.getrandbits(160):040x}'
+        kind = rng.random()
+        if kind < 0.3:
+            text = f'Swapped 0.{i % 9 + 1} ETH For 1,000,000 TKN https://etherscan.io/token/{token} on Uniswap'
+        elif kind < 0.45:
+            text = f'Swapped 0.{i % 9 + 1} ETH \u2329$1,500\u232a for 1,000,000 TKN https://etherscan.io/token/{token} on Banana Gun'
+        elif kind < 0.75:
+            text = f'Swapped 1,000 TKN https://etherscan.io/token/{token} For 0.5 ETH on Uniswap'
+        else:
+            text = f'Sent 1,000 TKN https://etherscan.io/token/{token} to 0x{rng.getrandbits(160):040x}'
+        name = rng.choice(WATCHED_NAMES) if rng.random() < 0.3 else rng.choice(OTHER_NAMES)
+        messages.append({'from_name': name, 'action_text': text.replace('/', '\\/'), 'tx_hash': f'0x{i:064x}'})
+    return messages
+
+def legacy_filter_message(data, filter_from_names):
+    from_name = data.get('from_name')
+    action_text = data.get('action_text')
+    passed_filters = []
+
+    # Remove backslashes from action_text
+    action_text_cleaned = action_text.replace('\\', '')
+
+    # Save the cleaned action text to a file
+    legacy_save_action_text(action_text_cleaned)
+
+    # Check if from_name matches any of the names in filter_from_names
+    if from_name in filter_from_names:
+        logging.info(f"FILTER 1 — 'from_name' : '{from_name}' — PASSED")
+        passed_filters.append("'from_name'")
+    else:
+        logging.info(f"FILTER 1 — 'from_name': '{from_name}' — FAILED")
+        return False
+
+    # Check if action_text_cleaned includes 'ETH For' (Uniswap) or 'ETH (xyz) for' (Banana Gun)
+    if 'ETH For' in action_text_cleaned or re.search(r'ETH \〈[^\)]+\〉 for', action_text_cleaned):
+        logging.info(f"FILTER 2 — 'action_text' includes 'ETH For' or 'ETH (xyz) for' — PASSED")
+        passed_filters.append("'action_text'")
+        return True
+
+    logging.info(f"FILTER 2 — 'action_text' does not include 'ETH For' or 'ETH (xyz) for' — FAILED")
+    return False
+
+def legacy_extract_token_address(action_text):
+    # Use regex to find the token address in the action text after 'ETH For' or 'ETH 〈xyz〉 for'
+    eth_for_index = action_text.find('ETH For')
+    if eth_for_index == -1:
+        eth_for_index = action_text.find('ETH 〈')
+        if eth_for_index == -1:
+            return None
+        eth_for_index = action_text.find(' for', eth_for_index)
+        if eth_for_index == -1:
+            return None
+    action_text_after_eth_for = action_text[eth_for_index:]
+    match = re.search(r'https://etherscan.io/token/0x[0-9a-fA-F]{40}', action_text_after_eth_for)
+    if match:
+        token_address = match.group().split('/')[-1]
+        return token_address
+    return None
+
+def legacy_save_action_text(action_text_cleaned):
+    """Save the cleaned action text to a file."""
+    with open(ACTION_TEXT_FILE, 'a') as file:
+        file.write(action_text_cleaned + '\n')
+
+def run_legacy(messages):
+    bought = []
+    for data in messages:
+        if legacy_filter_message(data, WATCHED_NAMES):
+            bought.append(legacy_extract_token_address(data['action_text'].replace('\\', '')))
+    return bought
+
+def run_compiled(messages):
+    watched = frozenset(WATCHED_NAMES)
+    bought = []
+    for data in messages:
+        if filters.filter_message(data, watched):
+            bought.append(filters.extract_token_address(data['action_text'].replace('\\', '')))
+    filters.action_text_archive.flush()
+    return bought
+
+def measure(label, run, *args):
+    begin = time.perf_counter()
+    bought = run(*args)
+    elapsed = time.perf_counter() - begin
+    print(f"{label:>10} {MESSAGES / elapsed:>14,.0f}")
+    return bought
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    messages = build_messages(random.Random(1))
+    with tempfile.TemporaryDirectory() as directory:
+        filters.action_text_archive = LineArchive(os.path.join(directory, 'compiled.log'), filters.format_action_text)
+        print(f"{'pipeline':>10} {'messages/sec':>14}")
+        ACTION_TEXT_FILE = os.path.join(directory, 'legacy.log')
+        legacy_bought = measure('legacy', run_legacy, messages)
+        compiled_bought = measure('compiled', run_compiled, messages)
+        # Both pipelines must buy the same tokens and archive every message
+        assert compiled_bought == legacy_bought, 'The pipelines selected different buys'
+        for name in ('legacy.log', 'compiled.log'):
+            with open(os.path.join(directory, name)) as file:
+                assert sum(1 for _ in file) == MESSAGES, f'{name} does not hold every message'
+        print(f"{len(legacy_bought)} buys selected by both")
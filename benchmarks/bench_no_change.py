@@ -0,0 +1,115 @@
+"""
+Compares the per-tick cost of the incremental no-change window in PositionTable with
+the original full-history scan of check_no_change_threshold, and checks both make the
+same decisions. The table's cost is per evaluate() call, shared by every open position,
+so with the single position used here it is mostly NumPy call overhead; what matters
+is that it stays flat as the history grows.
+
+Run from the repository root: python benchmarks/bench_no_change.py
+"""
+import os
+import sys
+import time
+import random
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pieces.position_table import PositionTable, EXIT_NO_CHANGE
+
+NO_CHANGE_THRESHOLD_PERCENT = 0.005  # Fraction
+NO_CHANGE_TIME_MINUTES = 5
+TOKEN = '0x0000000000000000000000000000000000000001'
+TICK_SECONDS = 3
+SAMPLE_COUNTS = [1_000, 10_000, 50_000]
+
+def legacy_check(start_time, price_history, current_time):
+    # The original list-scanning implementation, kept here as the reference
+    intervals_passed = (current_time - start_time) // timedelta(minutes=NO_CHANGE_TIME_MINUTES)
+    for interval in range(intervals_passed):
+        interval_start_time = start_time + timedelta(minutes=interval * NO_CHANGE_TIME_MINUTES)
+        interval_end_time = interval_start_time + timedelta(minutes=NO_CHANGE_TIME_MINUTES)
+        interval_prices = [price for timestamp, price in price_history if interval_start_time <= timestamp < interval_end_time]
+        if not interval_prices:
+            continue
+        initial_price = interval_prices[0]
+        price_increase = (max(interval_prices) - initial_price) / initial_price
+        price_decrease = (initial_price - min(interval_prices)) / initial_price
+        if abs(price_increase) < NO_CHANGE_THRESHOLD_PERCENT and abs(price_decrease) < NO_CHANGE_THRESHOLD_PERCENT:
+            return True, start_time
+        return False, interval_end_time
+    return None, start_time
+
+def price_path(count, seed=1, quiet_after=None):
+    # Random walk that keeps moving enough to never trigger a no-change sell, optionally going flat later
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    price = 1.0
+    for i in range(count):
+        if quiet_after is not None and i >= quiet_after:
+            yield start + timedelta(seconds=i * TICK_SECONDS), price * (1 + rng.uniform(-0.001, 0.001))
+            continue
+        price *= 1 + rng.uniform(-0.01, 0.01)
+        if i % 100 == 0:
+            price *= 1.02 if rng.random() < 0.5 else 0.98
+        yield start + timedelta(seconds=i * TICK_SECONDS), price
+
+def no_change_table(start_time):
+    """A PositionTable holding one position whose only active exit rule is the no-change rule."""
+    table = PositionTable(capacity=1)
+    table.add('position', TOKEN, 1.0, 10 ** 18, start_time.timestamp(), float('inf'), float('inf'), 0.0,
+              True, NO_CHANGE_THRESHOLD_PERCENT, NO_CHANGE_TIME_MINUTES)
+    return table
+
+def table_decision(table, timestamp, price):
+    """Like legacy_check: True when a completed window stayed flat, False when it moved, None otherwise."""
+    exits = table.evaluate(timestamp.timestamp(), {TOKEN: price})
+    if exits:
+        return exits[0]['reason'] == EXIT_NO_CHANGE
+    return False if table.rolled else None
+
+def check_decisions(count):
+    samples = list(price_path(count, seed=7, quiet_after=count // 2))
+    start_time = samples[0][0]
+    table = no_change_table(start_time)
+    history = []
+    for timestamp, price in samples:
+        history.append((timestamp, price))
+        expected, start_time = legacy_check(start_time, history, timestamp)
+        actual = table_decision(table, timestamp, price)
+        assert actual == expected, f"Decision mismatch at {timestamp}: {actual} != {expected}"
+        if expected:
+            return
+    raise AssertionError("The quiet stretch never triggered a no-change decision")
+
+def time_per_tick(count):
+    """Runs `count` ticks through both implementations; returns (mean, worst) seconds per tick for each."""
+    samples = list(price_path(count))
+
+    legacy_times = []
+    history = []
+    start_time = samples[0][0]
+    for timestamp, price in samples:
+        begin = time.perf_counter()
+        history.append((timestamp, price))
+        _, start_time = legacy_check(start_time, history, timestamp)
+        legacy_times.append(time.perf_counter() - begin)
+
+    incremental_times = []
+    table = no_change_table(samples[0][0])
+    for timestamp, price in samples:
+        begin = time.perf_counter()
+        table.evaluate(timestamp.timestamp(), {TOKEN: price})
+        incremental_times.append(time.perf_counter() - begin)
+
+    # Only the last 1,000 ticks, so the figures reflect the cost once the history is large
+    legacy_times, incremental_times = legacy_times[-1000:], incremental_times[-1000:]
+    return (sum(legacy_times) / len(legacy_times), max(legacy_times)), (sum(incremental_times) / len(incremental_times), max(incremental_times))
+
+if __name__ == '__main__':
+    check_decisions(20_000)
+    print("Decisions match the original implementation.")
+    print(f"{'samples':>10} {'list scan mean/worst (us)':>28} {'incremental mean/worst (us)':>30}")
+    for count in SAMPLE_COUNTS:
+        (legacy_mean, legacy_worst), (incremental_mean, incremental_worst) = time_per_tick(count)
+        print(f"{count:>10} {legacy_mean * 1e6:>16.1f} / {legacy_worst * 1e6:>9.1f} {incremental_mean * 1e6:>18.2f} / {incremental_worst * 1e6:>9.2f}")
@@ -0,0 +1,147 @@
+"""
+Measures the local swap quotes in pieces/quoting.py in microseconds per quote (V2
+getAmountOut, V3 within one tick, V3 crossing initialized ticks) on synthetic pools.
+The quote math itself is tested in tests/test_quoting.py against values from the
+Uniswap core test suites.
+
+Run from the repository root: python benchmarks/bench_quoting.py [recorded_quotes.jsonl]
+
+No recorded quotes are committed. With a node, the router's getAmountsOut and QuoterV2
+results for some pools can be recorded at one block, as JSON lines holding each pool's
+state and the output returned for it:
+
+    python benchmarks/bench_quoting.py record <pool address>[,...] <output.jsonl>
+
+Passing such a file reports how many local quotes match the recorded ones to the wei.
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pieces.quoting import v2_amount_out, v3_amount_out, get_sqrt_ratio_at_tick, fetch_v3_ticks, V3_TICK_SPACINGS
+from pieces.trading import UNISWAP_V2_ROUTER_ADDRESS
+
+QUOTES = 20_000
+UNISWAP_V3_QUOTER_V2_ADDRESS = '0x61fFE014bA17989E743c5F6cB21bF9697530B21e'
+QUOTER_V2_ABI = [{
+    'name': 'quoteExactInputSingle', 'type': 'function', 'stateMutability': 'nonpayable',
+    'inputs': [{'name': 'params', 'type': 'tuple', 'components': [
+        {'name': 'tokenIn', 'type': 'address'}, {'name': 'tokenOut', 'type': 'address'}, {'name': 'amountIn', 'type': 'uint256'},
+        {'name': 'fee', 'type': 'uint24'}, {'name': 'sqrtPriceLimitX96', 'type': 'uint160'},
+    ]}],
+    'outputs': [{'name': 'amountOut', 'type': 'uint256'}, {'name': 'sqrtPriceX96After', 'type': 'uint160'},
+                {'name': 'initializedTicksCrossed', 'type': 'uint32'}, {'name': 'gasEstimate', 'type': 'uint256'}],
+}]
+
+def build_v3_pool(rng, fee=3000):
+    """A pool around tick 0 with liquidity added and removed at random initialized ticks below and above it."""
+    spacing = V3_TICK_SPACINGS[fee]
+    liquidity = 10 ** 22
+    ticks = {}
+    for _ in range(40):
+        lower = -rng.randrange(1, 600) * spacing
+        upper = rng.randrange(1, 600) * spacing
+        amount = rng.randrange(10 ** 20, 10 ** 22)
+        ticks[lower] = ticks.get(lower, 0) + amount
+        ticks[upper] = ticks.get(upper, 0) - amount
+        liquidity += amount
+    return {'sqrt_price_x96': get_sqrt_ratio_at_tick(0), 'tick': 0, 'liquidity': liquidity, 'fee': fee, 'ticks': ticks}
+
+def measure(label, quote, amounts):
+    begin = time.perf_counter()
+    for amount in amounts:
+        quote(amount)
+    elapsed = time.perf_counter() - begin
+    print(f"{label:>22} {elapsed / len(amounts) * 1e6:>12.2f}")
+
+def run_benchmark():
+    rng = random.Random(1)
+    amounts = [rng.randrange(10 ** 15, 10 ** 20) for _ in range(QUOTES)]
+    pool = build_v3_pool(rng)
+    reserves = (500 * 10 ** 18, 10 ** 27)
+
+    print(f"{'quote':>22} {'us/quote':>12}")
+    measure('v2', lambda amount: v2_amount_out(amount, reserves[0], reserves[1]), amounts)
+    measure('v3 single tick', lambda amount: v3_amount_out(amount, True, pool['sqrt_price_x96'], pool['liquidity'], pool['tick'], pool['fee']), amounts)
+    measure('v3 crossing ticks', lambda amount: v3_amount_out(amount * 1000, True, pool['sqrt_price_x96'], pool['liquidity'], pool['tick'], pool['fee'], pool['ticks']), amounts)
+
+    # Without initialized ticks in range both V3 paths must agree exactly
+    mismatches = sum(
+        v3_amount_out(amount, True, pool['sqrt_price_x96'], pool['liquidity'], pool['tick'], pool['fee'])
+        != v3_amount_out(amount, True, pool['sqrt_price_x96'], pool['liquidity'], pool['tick'], pool['fee'], {})
+        for amount in amounts[:1000]
+    )
+    print(f"single/multi tick mismatches: {mismatches}")
+
+def local_quote(recorded):
+    if recorded['kind'] == 'v2':
+        return v2_amount_out(recorded['amount_in'], recorded['reserve_in'], recorded['reserve_out'])
+    ticks = {int(tick): net for tick, net in recorded['ticks'].items()}
+    return v3_amount_out(recorded['amount_in'], recorded['zero_for_one'], recorded['sqrt_price_x96'], recorded['liquidity'], recorded['tick'], recorded['fee'], ticks)
+
+def validate(path):
+    with open(path) as file:
+        recorded_quotes = [json.loads(line) for line in file if line.strip()]
+    exact = 0
+    for recorded in recorded_quotes:
+        quoted = local_quote(recorded)
+        if quoted == recorded['expected_out']:
+            exact += 1
+        else:
+            print(f"{recorded['kind']} {recorded['pool']} in {recorded['amount_in']}: local {quoted}, on-chain {recorded['expected_out']}")
+    print(f"{exact}/{len(recorded_quotes)} recorded quotes matched exactly")
+
+def record(pool_addresses, output_path):
+    from web3 import Web3
+    from pieces.rpc import web3
+    from pieces.contracts import contract, contract_registry
+    contract_registry.register('IQuoterV2', QUOTER_V2_ABI)
+
+    block = web3.eth.block_number
+    router = contract(web3, 'IUniswapV2Router02', Web3.to_checksum_address(UNISWAP_V2_ROUTER_ADDRESS))
+    quoter = contract(web3, 'IQuoterV2', UNISWAP_V3_QUOTER_V2_ADDRESS)
+    with open(output_path, 'a') as output:
+        for address in pool_addresses:
+            address = Web3.to_checksum_address(address)
+            functions = contract(web3, 'IUniswapV3Pool', address).functions
+            token0 = functions.token0().call(block_identifier=block)
+            token1 = functions.token1().call(block_identifier=block)
+            try:
+                fee = functions.fee().call(block_identifier=block)
+            except Exception:
+                fee = None
+            for zero_for_one in (True, False):
+                token_in, token_out = (token0, token1) if zero_for_one else (token1, token0)
+                if fee is None:
+                    reserves = contract(web3, 'IUniswapV2Pair', address).functions.getReserves().call(block_identifier=block)
+                    reserve_in, reserve_out = (reserves[0], reserves[1]) if zero_for_one else (reserves[1], reserves[0])
+                    state = {'kind': 'v2', 'reserve_in': reserve_in, 'reserve_out': reserve_out}
+                else:
+                    slot0 = functions.slot0().call(block_identifier=block)
+                    liquidity = functions.liquidity().call(block_identifier=block)
+                    state = {'kind': 'v3', 'zero_for_one': zero_for_one, 'sqrt_price_x96': slot0[0], 'tick': slot0[1], 'liquidity': liquidity, 'fee': fee}
+                    ticks = fetch_v3_ticks(web3, address, slot0[1], fee, zero_for_one)
+                    state['ticks'] = {str(tick): net for tick, net in ticks.items()}
+                for fraction in (10 ** -6, 10 ** -4, 10 ** -2):
+                    reserve = state['reserve_in'] if fee is None else max(liquidity, 1)
+                    amount_in = max(1, int(reserve * fraction))
+                    if fee is None:
+                        expected_out = router.functions.getAmountsOut(amount_in, [token_in, token_out]).call(block_identifier=block)[-1]
+                    else:
+                        expected_out = quoter.functions.quoteExactInputSingle((token_in, token_out, amount_in, fee, 0)).call(block_identifier=block)[0]
+                    output.write(json.dumps(dict(state, pool=address, block=block, amount_in=amount_in, expected_out=expected_out)) + '\n')
+    print(f"Recorded quotes of {len(pool_addresses)} pools at block {block} to {output_path}")
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    if len(sys.argv) == 4 and sys.argv[1] == 'record':
+        record(sys.argv[2].split(','), sys.argv[3])
+    else:
+        run_benchmark()
+        if len(sys.argv) == 2:
+            validate(sys.argv[1])
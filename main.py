@@ -1,21 +1,38 @@
 import asyncio
-from flask import Flask, request, jsonify
+import sys
+import itertools
+from quart import Quart, request, jsonify
 import os
 import json
+import time
 import logging
 from web3 import Web3
 from dotenv import load_dotenv
-from asgiref.wsgi import WsgiToAsgi
 from datetime import datetime, timezone
-from pieces.filters import filter_message, extract_token_address, get_token_details
-from pieces.uniswap import get_uniswap_v2_price, get_uniswap_v3_price
-from pieces.text_utils import insert_zero_width_space
-from pieces.telegram_utils import send_telegram_message
-from pieces.market_cap import calculate_market_cap
-from pieces.price_change_checker import check_no_change_threshold
-from pieces.trading import buy_token, sell_token, log_transaction_details  # Import the trading functions
-
-app = Flask(__name__)
+from pieces.filters import filter_message, extract_token_address, get_token_details, action_text_archive
+from pieces.uniswap import get_uniswap_prices, venue_selector
+from pieces.quoting import quote_swap
+from pieces.text_utils import insert_zero_width_space, format_token_amount
+from pieces.telegram_utils import send_telegram_message, telegram_dispatcher
+from pieces.market_cap import get_token_snapshot, fetch_eth_price_in_usd
+from pieces.cache import eth_price_cache, token_metadata_cache
+from pieces.trading import buy_token, sell_token, prepare_exit, tokens_received, get_wallet_address, fee_oracle, nonce_manager, get_chain_id  # Import the trading functions
+from pieces.receipt_watcher import ReceiptWatcher
+from pieces.price_engine import PriceEngine
+from pieces.async_rpc import run_rpc, get_rpc_latency_stats
+from pieces.rpc import web3, rpc_pool
+from pieces.contracts import contract
+from pieces.position_supervisor import PositionSupervisor
+from pieces.position_table import PositionTable, EXIT_PRICE_INCREASE, EXIT_PRICE_DECREASE
+from pieces.position_store import position_store, POSITION_OPEN, POSITION_CANCELLED
+from pieces.tick_recorder import tick_recorder
+from pieces.ingestion import IngestionQueue, ACCEPTED, QUEUE_FULL, DUPLICATE, INVALID
+from pieces.metrics import registry, timed, stage_seconds, attribute_to_position, forget_position, probe_event_loop_lag
+from pieces.profiler import profiler
+from pieces.sharding import ShardCoordinator, MONITOR_WORKERS, MONITOR_SOCKET_PATH, MONITOR_HEARTBEAT_SECONDS, read_message, write_message
+from pieces.runtime_config import runtime_config, parse_bool, RUNTIME_CONFIG_WATCH_SECONDS
+
+app = Quart(__name__)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -27,63 +44,140 @@ logger.addHandler(file_handler)
 # Load environment variables
 load_dotenv()
 
-# Parse environment variables
-FILTER_FROM_NAMES = [name.strip() for name in os.getenv('FILTER_FROM_NAME').split(',')]
-FILTER_FROM_ADDRESSES = [addr.strip() for addr in os.getenv('FILTER_FROM_ADDRESS').split(',')]
-INFURA_URL = os.getenv('INFURA_URL')
+# Parse environment variables; watchlists, thresholds and feature switches are in runtime_config and can change without a restart
 WETH_ADDRESS = '0xC02aaA39b223FE8D0A0E5C4F27eAD9083C756Cc2'
 UNISWAP_V2_FACTORY_ADDRESS = '0x5C69bEe701ef814a2B6a3EDD4B1652CB9cc5aA6f'
 UNISWAP_V3_FACTORY_ADDRESS = '0x1F98431c8aD98523631AE4a59f267346ea31F984'  # Uniswap V3 Factory Address
-AMOUNT_OF_ETH = float(os.getenv('AMOUNT_OF_ETH'))
-PRICE_INCREASE_THRESHOLD = float(os.getenv('PRICE_INCREASE_THRESHOLD')) / 100  # Convert to fraction
-PRICE_DECREASE_THRESHOLD = float(os.getenv('PRICE_DECREASE_THRESHOLD')) / 100  # Convert to fraction
-NO_CHANGE_THRESHOLD_PERCENT = float(os.getenv('NO_CHANGE_THRESHOLD_PERCENT')) / 100  # Convert to fraction
-NO_CHANGE_TIME_MINUTES = int(os.getenv('NO_CHANGE_TIME_MINUTES'))  # Time in minutes
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
-MOONBAG = float(os.getenv('MOONBAG', 0)) / 100  # Convert to fraction
-MIN_MARKET_CAP = float(os.getenv('MIN_MARKET_CAP'))  # Minimum market cap in USD
-MAX_MARKET_CAP = float(os.getenv('MAX_MARKET_CAP'))  # Maximum market cap in USD
-
-# Additional options
-SEND_TELEGRAM_MESSAGES = True  # Set to True to enable sending Telegram messages
-ALLOW_MULTIPLE_TRANSACTIONS = True  # Set to True to allow multiple concurrent transactions
-ENABLE_MARKET_CAP_FILTER = True  # Set to True to enable the Market Cap Filter
-ENABLE_PRICE_CHANGE_CHECKER = True  # Set to True to enable the Price Change Checker
-ENABLE_TRADING = False  # Set to True to enable trading
-
-# Create a dictionary mapping names to addresses
-NAME_TO_ADDRESS = dict(zip(FILTER_FROM_NAMES, FILTER_FROM_ADDRESSES))
-
-# Initialize web3
-web3 = Web3(Web3.HTTPProvider(INFURA_URL))
-
-# Load the Uniswap V2 Factory ABI
-with open('abis/IUniswapV2Factory.json') as file:
-    uniswap_v2_factory_abi = json.load(file)["abi"]
-
-# Load the Uniswap V2 Pair ABI
-with open('abis/IUniswapV2Pair.json') as file:
-    uniswap_v2_pair_abi = json.load(file)["abi"]
-
-# Load the Uniswap V2 ERC20 ABI
-with open('abis/IUniswapV2ERC20.json') as file:
-    uniswap_v2_erc20_abi = json.load(file)["abi"]
-
-# Load the Uniswap V3 Factory ABI
-with open('abis/IUniswapV3Factory.json') as file:
-    uniswap_v3_factory_abi = json.load(file)
-
-# Load the Uniswap V3 Pool ABI
-with open('abis/IUniswapV3Pool.json') as file:
-    uniswap_v3_pool_abi = json.load(file)
-
-# Create factory contract instances
-uniswap_v2_factory = web3.eth.contract(address=Web3.to_checksum_address(UNISWAP_V2_FACTORY_ADDRESS), abi=uniswap_v2_factory_abi)
-uniswap_v3_factory = web3.eth.contract(address=Web3.to_checksum_address(UNISWAP_V3_FACTORY_ADDRESS), abi=uniswap_v3_factory_abi)
-
-def calculate_token_amount(eth_amount, token_price):
-    return eth_amount / token_price
+EXIT_RULES_LOG_EVERY = int(os.getenv('EXIT_RULES_LOG_EVERY', 20))  # Log one in this many exit rule passes; every tick is in the tick recorder
+
+# Exit rule parameters kept per position; each can be overridden for a single position
+RULE_FIELDS = ('increase_threshold', 'decrease_threshold', 'moonbag', 'no_change_enabled', 'no_change_threshold', 'no_change_minutes')
+
+# Create factory contract instances from the shared compiled ABI fragments
+uniswap_v2_factory = contract(web3, 'IUniswapV2Factory', Web3.to_checksum_address(UNISWAP_V2_FACTORY_ADDRESS))
+uniswap_v3_factory = contract(web3, 'IUniswapV3Factory', Web3.to_checksum_address(UNISWAP_V3_FACTORY_ADDRESS))
+
+# Shared price engine that all monitored positions subscribe to; its new-block probe also keeps the fee oracle current
+price_engine = PriceEngine(web3, uniswap_v2_factory, uniswap_v3_factory, WETH_ADDRESS, block_source=fee_oracle.poll)
+
+# Registry of the monitor tasks for all open positions
+position_supervisor = PositionSupervisor()
+
+# Exit rules of all open positions, evaluated together on every price update
+position_table = PositionTable()
+exit_decisions = {}  # tx_hash -> future resolved with the exit decision
+open_rules = {}  # tx_hash -> exit rules in force for the positions monitored in this process
+opening_positions = set()  # tx_hash of messages buying between the one-position check and start_monitor
+
+evaluations = 0
+
+def evaluate_exit_rules(timestamp, prices):
+    global evaluations
+    with timed('exit_rules'):
+        exits = position_table.evaluate(timestamp.timestamp(), prices)
+    triggered_at = time.perf_counter()
+    if position_table.rolled:
+        position_store.save_windows({position_id: position_table.window(position_id) for position_id in position_table.rolled})
+    # Every tick goes to the tick recorder, so the text log only needs a sample of them
+    tick_recorder.record(
+        timestamp.timestamp(), prices,
+        {token: venue['address'] for token, venue in venue_selector.venues().items()},
+        {decision['token_address'].lower(): decision['reason'] for decision in exits},
+    )
+    evaluations += 1
+    if exits or evaluations % EXIT_RULES_LOG_EVERY == 0:
+        logging.info(f"Evaluated exit rules for {len(position_table) + len(exits)} positions across {len(prices)} tokens — {len(exits)} to sell.")
+    for decision in exits:
+        exit_decision = exit_decisions.pop(decision['position_id'], None)
+        if exit_decision is not None and not exit_decision.done():
+            decision['triggered_at'] = triggered_at
+            exit_decision.set_result(decision)
+
+price_engine.add_listener(evaluate_exit_rules)
+
+# Single background task that waits for all of our transactions to be mined
+receipt_watcher = ReceiptWatcher(web3)
+
+# Keep references to fire-and-forget tasks so they are not garbage collected
+background_tasks = set()
+
+def start_background_task(coroutine):
+    task = asyncio.create_task(coroutine)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+async def prepare_exit_in_background(token_address):
+    try:
+        approve_tx_hash = await run_rpc(prepare_exit, token_address)
+    except Exception as e:
+        logging.error(f"Could not prepare exit for {token_address}: {e}")
+        return
+    if approve_tx_hash is not None:
+        await wait_for_receipt(approve_tx_hash, 'approve')
+
+async def wait_for_receipt(tx_hash, label):
+    """The receipt details of a transaction once mined, or None if it was not mined in time."""
+    try:
+        receipt = await receipt_watcher.track(tx_hash, label)
+    except TimeoutError as e:
+        logging.error(str(e))
+        return None
+    if receipt['status'] != 1:
+        logging.error(f"The {label} transaction {tx_hash} failed on-chain.")
+    return receipt
+
+async def settle_buy(transaction_details):
+    """
+    Replace a position's quoted token amount with the base units its buy transaction
+    actually received, so the sell size and profit or loss use it. A buy that received
+    nothing cancels the position.
+    """
+    position_id = transaction_details['tx_hash']
+    buy_tx_hash = transaction_details['buy_tx_hash']
+    symbol, decimals = transaction_details['symbol'], transaction_details['token_decimals']
+    quoted = format_token_amount(transaction_details['token_amount'], decimals)
+    receipt = await wait_for_receipt(buy_tx_hash, 'buy')
+    if receipt is None:
+        logging.error(f"Monitoring {position_id[:8]} — Keeping the quoted amount of {quoted} {symbol}, the buy was not mined in time.")
+        return
+    received = 0
+    if receipt['status'] == 1:
+        received = tokens_received(receipt['logs'], transaction_details['token_address'], get_wallet_address())
+    if received == 0:
+        logging.error(f"Monitoring {position_id[:8]} — The buy {buy_tx_hash} received no tokens, cancelling the position.")
+        cancelled = monitor_shards.cancel(position_id) if monitor_shards is not None else position_supervisor.cancel(position_id)
+        if cancelled:
+            await asyncio.to_thread(position_store.close, position_id, POSITION_CANCELLED)
+        return
+    logging.info(f"Monitoring {position_id[:8]} — Received {format_token_amount(received, decimals)} {symbol}, quoted {quoted}.")
+    transaction_details['token_amount'] = received
+    await asyncio.to_thread(position_store.set_token_amount, position_id, transaction_details)
+    if monitor_shards is not None:
+        monitor_shards.send_token_amount(position_id, received)
+    else:
+        set_position_token_amount(position_id, received)
+
+def set_position_token_amount(position_id, token_amount):
+    """Correct the token amount of a position monitored in this process; returns False if its exit rules are no longer evaluated."""
+    position = position_supervisor.positions.get(position_id)
+    if position is not None:
+        position['details']['token_amount'] = token_amount
+    return position_table.set_token_amount(position_id, token_amount)
+
+def calculate_token_amount(eth_amount, token_price, token_decimals):
+    """Base units of a token worth `eth_amount` ETH at `token_price` ETH per whole token."""
+    return int(eth_amount / token_price * (10 ** token_decimals))
+
+async def quote_trade(token_address, amount_in, buying, v2_only):
+    """Quote a swap against the cached pool state; real trades go through the V2 router, so pass `v2_only` for them."""
+    try:
+        return await run_rpc(quote_swap, web3, uniswap_v2_factory, token_address, WETH_ADDRESS, amount_in, buying, v2_only)
+    except Exception as e:
+        logging.error(f"Could not quote the {'buy' if buying else 'sell'} of {token_address}: {e}")
+        return None
 
 def format_large_number(number):
     if number >= 1_000_000_000:
@@ -95,134 +189,297 @@ def format_large_number(number):
     else:
         return str(number)
 
-async def monitor_price(token_address, initial_price, token_decimals, transaction_details):
+def exit_rules(config=None, overrides=None):
+    """
+    Exit rule parameters of a position under `config` (the current configuration by default)
+    with the position's own `overrides` on top; stored with each position so a restart keeps them.
+    """
+    config = config or runtime_config.current()
+    rules = {
+        'increase_threshold': config['PRICE_INCREASE_THRESHOLD'],
+        'decrease_threshold': config['PRICE_DECREASE_THRESHOLD'],
+        'moonbag': config['MOONBAG'],
+        'no_change_enabled': config['ENABLE_PRICE_CHANGE_CHECKER'],
+        'no_change_threshold': config['NO_CHANGE_THRESHOLD_PERCENT'],
+        'no_change_minutes': config['NO_CHANGE_TIME_MINUTES'],
+        'config_version': config['version'],
+    }
+    if overrides:
+        rules.update(overrides)
+        rules['overrides'] = overrides
+    return rules
+
+def parse_rule_overrides(data):
+    """Validate per-position exit rule overrides, in the units of exit_rules(); None clears an override."""
+    if not isinstance(data, dict) or not data:
+        raise ValueError("Expected a JSON object of exit rules.")
+    unknown = set(data) - set(RULE_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown exit rules: {', '.join(sorted(unknown))}")
+    overrides = {}
+    for field, value in data.items():
+        if value is None:
+            overrides[field] = None
+        elif field == 'no_change_enabled':
+            overrides[field] = parse_bool(value)
+        elif field == 'no_change_minutes':
+            overrides[field] = int(value)
+            if overrides[field] <= 0:
+                raise ValueError("no_change_minutes must be positive.")
+        else:
+            overrides[field] = float(value)
+    return overrides
+
+def set_position_rules(position_id, rules):
+    """Switch a position monitored in this process to new exit rules, effective from the next price update."""
+    if not position_table.set_rules(position_id, *(rules[field] for field in RULE_FIELDS)):
+        # Not monitored here, or its exit already triggered
+        return False
+    open_rules[position_id] = rules
+    return True
+
+def override_position_rules(position_id, overrides):
+    """Apply per-position overrides on top of the current configuration; returns the new rules, or None for an unknown position."""
+    rules = open_rules.get(position_id)
+    if rules is None:
+        return None
+    merged = {field: value for field, value in {**rules.get('overrides', {}), **overrides}.items() if value is not None}
+    updated = exit_rules(runtime_config.current(), merged)
+    if not set_position_rules(position_id, updated):
+        return None
+    start_background_task(asyncio.to_thread(position_store.save_rules, {position_id: updated}))
+    logging.info(f"Monitoring {position_id[:8]} — Exit rules overridden: {merged}")
+    return updated
+
+def apply_config(previous, config):
+    """
+    Move every position monitored in this process onto a new configuration, keeping its
+    own overrides. Runs between two price updates, so no update sees a mix of versions
+    and no monitor has to be restarted.
+    """
+    changed = {}
+    for position_id, rules in list(open_rules.items()):
+        updated = exit_rules(config, rules.get('overrides'))
+        if set_position_rules(position_id, updated):
+            changed[position_id] = updated
+    if changed:
+        start_background_task(asyncio.to_thread(position_store.save_rules, changed))
+        logging.info(f"Moved {len(changed)} open positions to configuration version {config['version']}.")
+
+runtime_config.add_listener(apply_config)
+
+async def monitor_price(token_address, initial_price, token_decimals, transaction_details, restored=None):
+    """
+    Monitors a position until its exit rules fire and sells it. `restored` is the
+    (rules, window) of a position loaded from the position store after a restart.
+    """
+    decision, rules = await wait_for_exit(token_address, initial_price, token_decimals, transaction_details, restored)
+    exit = await price_exit(token_address, token_decimals, transaction_details, decision, rules)
+    await execute_exit(token_address, token_decimals, transaction_details, exit)
+
+async def wait_for_exit(token_address, initial_price, token_decimals, transaction_details, restored=None):
+    """Registers a position with the price engine and returns (decision, rules) once its exit rules fire."""
+    tx_hash = transaction_details['tx_hash']
+    token_amount = transaction_details['token_amount']
+    rules, window = restored if restored is not None else (exit_rules(), None)
+    attribute_to_position(tx_hash)
+
+    # Register the position in the shared table; the price engine evaluates its exit rules on every update
+    exit_decision = asyncio.get_running_loop().create_future()
+    position_table.add(
+        tx_hash, token_address, initial_price, token_amount, transaction_details['start_time'],
+        rules['increase_threshold'], rules['decrease_threshold'], rules['moonbag'],
+        rules['no_change_enabled'], rules['no_change_threshold'], rules['no_change_minutes'], window,
+    )
+    exit_decisions[tx_hash] = exit_decision
+    open_rules[tx_hash] = rules
+    price_engine.track(token_address, token_decimals)
+
+    try:
+        if restored is None:
+            await asyncio.to_thread(position_store.open, tx_hash, transaction_details, rules, position_table.window(tx_hash))
+            await asyncio.to_thread(
+                position_store.record_trade, timestamp=transaction_details['start_time'], position_id=tx_hash, side='buy',
+                token_address=token_address, venue=transaction_details.get('pair_address'), token_amount=transaction_details['token_amount'],
+                eth_amount=transaction_details['amount_eth'], price=initial_price, from_name=transaction_details['from_name'], tx_hash=transaction_details.get('buy_tx_hash'),
+            )
+        # The rules may have changed since the position was opened
+        return await exit_decision, open_rules[tx_hash]
+    finally:
+        price_engine.untrack(token_address)
+        position_table.remove(tx_hash)
+        exit_decisions.pop(tx_hash, None)
+        open_rules.pop(tx_hash, None)
+        if token_address.lower() not in price_engine.subscriptions:
+            tick_recorder.forget(token_address)
+        forget_position(tx_hash)
+
+async def price_exit(token_address, token_decimals, transaction_details, decision, rules):
+    """
+    Quotes the sale an exit decision calls for and works out its profit or loss. Returns
+    a JSON-serializable dict, so monitor workers can hand it to the server process.
+    """
+    monitoring_id = transaction_details['tx_hash'][:8]  # Create a short identifier for the transaction
+    token_amount = transaction_details['token_amount']
+    # Positions stored before the amount was recorded with them were bought with the configured amount
+    amount_eth = transaction_details.get('amount_eth') or runtime_config.current()['AMOUNT_OF_ETH']
+    current_price = decision['price']
+    token_amount_to_sell = decision['token_amount_to_sell']
+    percent_change = decision['price_change'] * 100
+    if decision['reason'] == EXIT_PRICE_INCREASE:
+        logging.info(f"Monitoring {monitoring_id} — Current price: {current_price} ETH ({percent_change:.2f}%). — Token price increased by {percent_change:.2f}%. Selling the token.")
+        sell_reason = f'Price increased by {percent_change:.2f}%'
+    elif decision['reason'] == EXIT_PRICE_DECREASE:
+        logging.info(f"Monitoring {monitoring_id} — Current price: {current_price} ETH ({percent_change:.2f}%). — Token price decreased by {-percent_change:.2f}%. Selling the token.")
+        sell_reason = f'Price decreased by {-percent_change:.2f}%'
+    else:
+        threshold_percent = rules['no_change_threshold'] * 100
+        no_change_minutes = rules['no_change_minutes']
+        logging.info(f"Monitoring {monitoring_id} — No significant price change — {threshold_percent:.2f}%. — detected in a {no_change_minutes} minutes interval. Selling the token.")
+        sell_reason = f'Price did not change significantly — {threshold_percent:.2f}%. — in a {no_change_minutes} minutes interval.'
+
+    # Calculate and print the amount of ETH received from the sale, including its price impact
+    quote = await quote_trade(token_address, token_amount_to_sell, buying=False, v2_only=bool(transaction_details.get('buy_tx_hash')))
+    eth_received = quote['expected_out'] / 1e18 if quote is not None else token_amount_to_sell / (10 ** token_decimals) * current_price
+    profit_or_loss = eth_received - (amount_eth * (token_amount_to_sell / token_amount))
+    return {
+        'decision': decision,
+        'sell_reason': sell_reason,
+        'quote': quote,
+        'eth_received': eth_received,
+        'profit_or_loss': profit_or_loss,
+    }
+
+async def execute_exit(token_address, token_decimals, transaction_details, exit):
+    """
+    Sends the sale priced by price_exit(), reports it and closes the position in the store.
+    Positions that were really bought are sold even if trading has been switched off since.
+    """
+    config = runtime_config.current()
+    # Before anything is broadcast, so a monitor restarted after a crash below does not sell again
+    await asyncio.to_thread(position_store.mark_selling, transaction_details['tx_hash'])
     from_name = transaction_details['from_name']
     tx_hash = transaction_details['tx_hash']
     symbol = transaction_details['symbol']
     token_amount = transaction_details['token_amount']
-    from_address = NAME_TO_ADDRESS[from_name]
-    
-    monitoring_id = tx_hash[:8]  # Create a short identifier for the transaction
-
-    start_time = datetime.now(timezone.utc)
-    sell_reason = ''
-    price_history = []
-
-    while True:
-        current_price, _ = get_uniswap_v2_price(web3, uniswap_v2_factory, token_address, WETH_ADDRESS, token_decimals, uniswap_v2_pair_abi)
-        if current_price is None:
-            current_price, _ = get_uniswap_v3_price(web3, uniswap_v3_factory, token_address, WETH_ADDRESS, token_decimals, uniswap_v3_pool_abi)
-            if current_price is None:
-                logging.info("Failed to fetch the current price.")
-                await asyncio.sleep(5)
-                continue
-
-        price_history.append((datetime.now(timezone.utc), current_price))
-
-        price_increase = (current_price - initial_price) / initial_price
-        price_decrease = (initial_price - current_price) / initial_price
-        percent_change = ((current_price - initial_price) / initial_price) * 100
-
-        if price_increase >= PRICE_INCREASE_THRESHOLD:
-            logging.info(f"Monitoring {monitoring_id} — Current price: {current_price} ETH ({percent_change:.2f}%). — Token price increased by {price_increase * 100:.2f}%. Selling the token.")
-            token_amount_to_sell = token_amount * (1 - MOONBAG)
-            sell_reason = f'Price increased by {price_increase * 100:.2f}%'
-            break
-        elif price_decrease >= PRICE_DECREASE_THRESHOLD:
-            logging.info(f"Monitoring {monitoring_id} — Current price: {current_price} ETH ({percent_change:.2f}%). — Token price decreased by {price_decrease * 100:.2f}%. Selling the token.")
-            token_amount_to_sell = token_amount
-            sell_reason = f'Price decreased by {price_decrease * 100:.2f}%'
-            break
-
-        if ENABLE_PRICE_CHANGE_CHECKER:
-            no_change, token_amount_to_sell, sell_reason, start_time = check_no_change_threshold(start_time, price_history, monitoring_id, symbol, token_amount)
-            if no_change:
-                break
-
-        logging.info(f"Monitoring {monitoring_id} — Current price: {current_price} ETH ({percent_change:.2f}%). — {token_amount} {symbol}.")
-        await asyncio.sleep(3)
-
-    if token_amount_to_sell is not None:
-        # Calculate and print the amount of ETH received from the sale
-        eth_received = token_amount_to_sell * current_price
-        profit_or_loss = eth_received - (AMOUNT_OF_ETH * (token_amount_to_sell / token_amount))
-        
-        profit_or_loss_display = f"🏆 {profit_or_loss} ETH" if profit_or_loss > 0 else f"{profit_or_loss} ETH"
-
-        # LOG the profit or loss and the from_name
-        logging.info(f"LOG—Profit/Loss: {profit_or_loss_display}")
-        logging.info(f"LOG—From: {from_name}")
-
-        # If trading is enabled, execute the sell transaction
-        if ENABLE_TRADING:
-            sell_tx_hash = sell_token(token_address, token_amount_to_sell)
-            logging.info(f"Monitoring {monitoring_id} — Sell transaction sent with hash: {sell_tx_hash}")
-            log_transaction_details(sell_tx_hash)
-            messageS = (
-                f'🟢 *SELL!* 🟢\n\n'
-                f'*From:*\n[{from_name}](https://etherscan.io/address/{from_address})\n\n'
-                f'*Original Transaction Hash:*\n[{tx_hash}](https://etherscan.io/tx/{tx_hash})\n\n'
-                f'*Sell Transaction Hash:*\n[{sell_tx_hash}](https://etherscan.io/tx/{sell_tx_hash})\n\n'
-                f'*Action:*\nSold {token_amount_to_sell} [{symbol}](https://etherscan.io/token/{token_address}) for approximately {eth_received} ETH.\n\n'
-                f'*Reason:*\n{sell_reason}\n\n'
-                f'*Profit/Loss:*\n{profit_or_loss_display}.\n\n'
-            )
-        else:
-            logging.info(f"Monitoring {monitoring_id} — Sold {token_amount_to_sell} for approximately {eth_received} ETH.")
-            messageS = (
-                f'🟢 *SELL!* 🟢\n\n'
-                f'*From:*\n[{from_name}](https://etherscan.io/address/{from_address})\n\n'
-                f'*Original Transaction Hash:*\n[{tx_hash}](https://etherscan.io/tx/{tx_hash})\n\n'
-                f'*Action:*\nSold {token_amount_to_sell} [{symbol}](https://etherscan.io/token/{token_address}) for approximately {eth_received} ETH.\n\n'
-                f'*Reason:*\n{sell_reason}\n\n'
-                f'*Profit/Loss:*\n{profit_or_loss_display}.\n\n'
-            )
-        if token_amount_to_sell != token_amount:
-            messageS += f'*Moonbag:*\n{token_amount * MOONBAG} {symbol}'
-        send_telegram_message(insert_zero_width_space(messageS))
+    from_address = config['NAME_TO_ADDRESS'].get(from_name, '')
+    monitoring_id = tx_hash[:8]
+    decision, quote = exit['decision'], exit['quote']
+    token_amount_to_sell = decision['token_amount_to_sell']
+    sold = format_token_amount(token_amount_to_sell, token_decimals)
+    sell_reason, eth_received, profit_or_loss = exit['sell_reason'], exit['eth_received'], exit['profit_or_loss']
+
+    profit_or_loss_display = f"🏆 {profit_or_loss} ETH" if profit_or_loss > 0 else f"{profit_or_loss} ETH"
+
+    # LOG the profit or loss and the from_name
+    logging.info(f"LOG—Profit/Loss: {profit_or_loss_display}")
+    logging.info(f"LOG—From: {from_name}")
+
+    # If the position was bought on-chain, execute the sell transaction
+    sell_tx_hash = None
+    if transaction_details.get('buy_tx_hash'):
+        sell_tx_hash = await run_rpc(sell_token, token_address, token_amount_to_sell, decision['triggered_at'], quote['min_out'] if quote is not None else 0)
+        logging.info(f"Monitoring {monitoring_id} — Sell transaction sent with hash: {sell_tx_hash}")
+        start_background_task(wait_for_receipt(sell_tx_hash, 'sell'))
+        messageS = (
+            f'🟢 *SELL!* 🟢\n\n'
+            f'*From:*\n[{from_name}](https://etherscan.io/address/{from_address})\n\n'
+            f'*Original Transaction Hash:*\n[{tx_hash}](https://etherscan.io/tx/{tx_hash})\n\n'
+            f'*Sell Transaction Hash:*\n[{sell_tx_hash}](https://etherscan.io/tx/{sell_tx_hash})\n\n'
+            f'*Action:*\nSold {sold} [{symbol}](https://etherscan.io/token/{token_address}) for approximately {eth_received} ETH.\n\n'
+            f'*Reason:*\n{sell_reason}\n\n'
+            f'*Profit/Loss:*\n{profit_or_loss_display}.\n\n'
+        )
     else:
-        logging.info(f"Monitoring {monitoring_id} — Continuing to monitor price changes after initial period.")
-
-@app.route('/transaction', methods=['POST'])
-async def transaction():
-    data = request.json
+        logging.info(f"Monitoring {monitoring_id} — Sold {sold} for approximately {eth_received} ETH.")
+        messageS = (
+            f'🟢 *SELL!* 🟢\n\n'
+            f'*From:*\n[{from_name}](https://etherscan.io/address/{from_address})\n\n'
+            f'*Original Transaction Hash:*\n[{tx_hash}](https://etherscan.io/tx/{tx_hash})\n\n'
+            f'*Action:*\nSold {sold} [{symbol}](https://etherscan.io/token/{token_address}) for approximately {eth_received} ETH.\n\n'
+            f'*Reason:*\n{sell_reason}\n\n'
+            f'*Profit/Loss:*\n{profit_or_loss_display}.\n\n'
+        )
+    if token_amount_to_sell != token_amount:
+        messageS += f'*Moonbag:*\n{format_token_amount(token_amount - token_amount_to_sell, token_decimals)} {symbol}'
+    if config['SEND_TELEGRAM_MESSAGES']:
+        send_telegram_message(insert_zero_width_space(messageS))
+    await asyncio.to_thread(
+        position_store.record_trade, position_id=tx_hash, side='sell', token_address=token_address,
+        venue=quote['venue'] if quote is not None else None, token_amount=token_amount_to_sell, eth_amount=eth_received,
+        price=decision['price'], profit_or_loss=profit_or_loss, reason=decision['reason'], from_name=from_name, tx_hash=sell_tx_hash,
+    )
+    await asyncio.to_thread(position_store.close, tx_hash, token_amount_left=token_amount - token_amount_to_sell, sell_tx_hash=sell_tx_hash)
+
+async def process_transaction(data):
+    received_at = time.perf_counter()
     logging.info('—————————————————————————————————————————————————————————————————————————————————————————————————————————')
     logging.info(f"Received transaction data: {data}")
-    if filter_message(data, FILTER_FROM_NAMES):
+    # One configuration version for the whole message, even if it is reloaded meanwhile
+    config = runtime_config.current()
+    amount_of_eth = config['AMOUNT_OF_ETH']
+    with timed('filter_message'):
+        passed = filter_message(data, config['FILTER_FROM_NAME_SET'])
+    if passed:
         logging.info("Yes, it passes the filters")
-        action_text_cleaned = data.get('action_text').replace('\\', '')
-        token_address = extract_token_address(action_text_cleaned)
+        with timed('extract_token_address'):
+            action_text_cleaned = data.get('action_text').replace('\\', '')
+            token_address = extract_token_address(action_text_cleaned)
         if token_address:
             logging.info(f"Extracted token address: {token_address}")
 
-            if ENABLE_MARKET_CAP_FILTER:
-                # Check market cap
-                market_cap_usd = calculate_market_cap(token_address)
+            if config['ENABLE_MARKET_CAP_FILTER']:
+                # Check market cap; the snapshot also carries the token details and price so they are not fetched twice
+                with timed('market_cap'):
+                    snapshot = await run_rpc(get_token_snapshot, token_address)
+                market_cap_usd = snapshot['market_cap_usd'] if snapshot is not None else None
+                # Recorded so the replay engine can try other market cap bounds on this message
+                start_background_task(asyncio.to_thread(position_store.record_snapshot, token_address, market_cap_usd, snapshot['token_price'] if snapshot is not None else None))
                 if market_cap_usd is None:
                     logging.info("Market cap not available. Skipping the buy.")
-                    return jsonify({'status': 'failed', 'reason': 'Market cap not available'}), 400
+                    return
                 
-                if market_cap_usd < MIN_MARKET_CAP or market_cap_usd > MAX_MARKET_CAP:
+                if market_cap_usd < config['MIN_MARKET_CAP'] or market_cap_usd > config['MAX_MARKET_CAP']:
                     logging.info(f"Market cap {market_cap_usd} USD not within the specified range. Skipping the buy.")
-                    return jsonify({'status': 'failed', 'reason': f'Market cap {market_cap_usd} USD not within the specified range'}), 200
-
-            name, symbol, decimals = get_token_details(web3, token_address, uniswap_v2_erc20_abi)
-            logging.info(f"Token name: {name}")
-            logging.info(f"Token symbol: {symbol}")
-            initial_price, pair_address = get_uniswap_v2_price(web3, uniswap_v2_factory, token_address, WETH_ADDRESS, decimals, uniswap_v2_pair_abi)
-            if initial_price is None:
-                initial_price, pair_address = get_uniswap_v3_price(web3, uniswap_v3_factory, token_address, WETH_ADDRESS, decimals, uniswap_v3_pool_abi)
+                    return
+
+                name, symbol, decimals = snapshot['name'], snapshot['symbol'], snapshot['decimals']
+                initial_price, pair_address = snapshot['token_price'], snapshot['pair_address']
+                logging.info(f"Token name: {name}")
+                logging.info(f"Token symbol: {symbol}")
+            else:
+                with timed('token_details'):
+                    name, symbol, decimals = await run_rpc(get_token_details, web3, token_address)
+                logging.info(f"Token name: {name}")
+                logging.info(f"Token symbol: {symbol}")
+                # Priced from the deepest of the token's V2/V3 venues
+                with timed('price_lookup'):
+                    prices = await run_rpc(get_uniswap_prices, web3, uniswap_v2_factory, uniswap_v3_factory, {token_address: decimals}, WETH_ADDRESS)
+                initial_price, pair_address, _ = prices[token_address]
             
             if initial_price is not None:
                 logging.info(f"Pair/Pool address: {pair_address}")
                 logging.info(f"Token price: {initial_price} ETH")
-                token_amount = calculate_token_amount(AMOUNT_OF_ETH, initial_price)
-                logging.info(f"Approximately {token_amount} {symbol} would be purchased for {AMOUNT_OF_ETH} ETH.")
+                with timed('quote'):
+                    quote = await quote_trade(token_address, Web3.to_wei(amount_of_eth, 'ether'), buying=True, v2_only=config['ENABLE_TRADING'])
+                # Token amounts are kept in base units from here on, so sells and moonbags are exact
+                if quote is not None and quote['expected_out'] > 0:
+                    token_amount = quote['expected_out']
+                else:
+                    quote = None
+                    token_amount = calculate_token_amount(amount_of_eth, initial_price, decimals)
+                logging.info(f"Approximately {format_token_amount(token_amount, decimals)} {symbol} would be purchased for {amount_of_eth} ETH.")
 
-                # Send Telegram message for buy
                 from_name = data.get('from_name')
                 tx_hash = data.get('tx_hash')
-                from_address = NAME_TO_ADDRESS[from_name]
+                if not config['ALLOW_MULTIPLE_TRANSACTIONS'] and (opening_positions or open_position_count()):
+                    logging.info("A position is already open and ALLOW_MULTIPLE_TRANSACTIONS is off. Skipping the buy.")
+                    return
+                # Hold the slot until the position is monitored, so concurrent workers cannot both buy
+                opening_positions.add(tx_hash)
+
+                # Send Telegram message for buy
+                from_address = config['NAME_TO_ADDRESS'][from_name]
                 tx_hash_link = f"[{tx_hash}](https://etherscan.io/tx/{tx_hash})"
                 from_name_link = f"[{from_name}](https://etherscan.io/address/{from_address})"
                 messageB = (
@@ -230,23 +487,30 @@ async def transaction():
                     f'*From:*\n{from_name_link}\n\n'
                     f'*Copied Transaction Hash:*\n{tx_hash_link}\n\n'
                 )
-                if ENABLE_MARKET_CAP_FILTER:
+                if config['ENABLE_MARKET_CAP_FILTER']:
                     messageB += f'*Market Cap:*\n{format_large_number(market_cap_usd)} USD\n\n'
 
                 # If trading is enabled, execute the buy transaction
-                if ENABLE_TRADING:
-                    buy_tx_hash = buy_token(token_address, AMOUNT_OF_ETH)
+                buy_tx_hash = None
+                if config['ENABLE_TRADING']:
+                    try:
+                        with timed('buy'):
+                            buy_tx_hash = await run_rpc(buy_token, token_address, amount_of_eth, quote['min_out'] if quote is not None else 0)
+                    except Exception:
+                        opening_positions.discard(tx_hash)
+                        raise
+                    stage_seconds.observe(time.perf_counter() - received_at, 'webhook_to_buy')
                     logging.info(f"Buy transaction sent with hash: {buy_tx_hash}")
-                    log_transaction_details(buy_tx_hash)
+                    # Approve and pre-build the sell now so the exit does not have to
+                    start_background_task(prepare_exit_in_background(token_address))
                     messageB += f'*Transaction Hash:*\n[{buy_tx_hash}](https://etherscan.io/tx/{buy_tx_hash})\n\n'
-                    # Update the token amount with the actual amount bought
-                    token_amount = calculate_token_amount(AMOUNT_OF_ETH, initial_price)
 
                 messageB += (
-                    f'*Action:*\nApproximately {token_amount} [{symbol}](https://etherscan.io/token/{token_address}) purchased for {AMOUNT_OF_ETH} ETH.\n'
+                    f'*Action:*\nApproximately {format_token_amount(token_amount, decimals)} [{symbol}](https://etherscan.io/token/{token_address}) purchased for {amount_of_eth} ETH.\n'
                 )
 
-                send_telegram_message(insert_zero_width_space(messageB))
+                if config['SEND_TELEGRAM_MESSAGES']:
+                    send_telegram_message(insert_zero_width_space(messageB))
 
                 # Prepare transaction details for monitoring
                 transaction_details = {
@@ -256,26 +520,374 @@ async def transaction():
                     'token_amount': token_amount,
                     'token_address': token_address,
                     'initial_price': initial_price,
-                    'token_decimals': decimals
+                    'token_decimals': decimals,
+                    'pair_address': pair_address,
+                    'buy_tx_hash': buy_tx_hash,
+                    'amount_eth': amount_of_eth,
+                    'start_time': datetime.now(timezone.utc).timestamp(),
                 }
 
-                if ALLOW_MULTIPLE_TRANSACTIONS:
-                    asyncio.create_task(monitor_price(token_address, initial_price, decimals, transaction_details))
-                else:
-                    await monitor_price(token_address, initial_price, decimals, transaction_details)
+                start_monitor(tx_hash, transaction_details)
+                opening_positions.discard(tx_hash)
+                if buy_tx_hash is not None:
+                    # The position holds the quoted amount until the buy is mined
+                    start_background_task(settle_buy(transaction_details))
             else:
                 logging.info("Token price not available on either Uniswap V2 or V3.")
         else:
             logging.info("Token address not found in the action text.")
     else:
         logging.info("No, it does not pass the filters")
-    return jsonify({'status': 'success'}), 200
 
-def run_server():
-    app.run(host='0.0.0.0', port=5000)
+def open_position_count():
+    return len(monitor_shards.positions) if monitor_shards is not None else len(position_supervisor.positions)
 
-if __name__ == '__main__':
-    asgi_app = WsgiToAsgi(app)
-    import uvicorn
-    uvicorn.run(asgi_app, host='0.0.0.0', port=5000, timeout_keep_alive=0)
+def transaction_priority(data):
+    # Wallets listed first in FILTER_FROM_NAME are handled first when messages queue up
+    config = runtime_config.current()
+    return config['FROM_NAME_PRIORITY'].get(data.get('from_name'), len(config['FILTER_FROM_NAMES']))
 
+# Webhook messages are acknowledged immediately and processed by a pool of workers
+ingestion_queue = IngestionQueue(process_transaction, priority=transaction_priority)
+
+@app.route('/transaction', methods=['POST'])
+async def transaction():
+    data = await request.get_json()
+    result = ingestion_queue.submit(data)
+    if result == INVALID:
+        return jsonify({'status': 'failed', 'reason': 'Expected a JSON object with a string tx_hash'}), 400
+    if result == QUEUE_FULL:
+        return jsonify({'status': 'failed', 'reason': 'Ingestion queue is full'}), 503
+    if result == DUPLICATE:
+        return jsonify({'status': 'duplicate'}), 200
+    return jsonify({'status': 'accepted'}), 200
+
+@app.route('/transactions', methods=['POST'])
+async def transactions():
+    """
+    Accepts a batch of webhook messages as NDJSON (one JSON object per line). Lines are
+    queued as they arrive, so processing starts before the whole body has been read.
+    Rejected messages are not remembered by the deduplication, so a sender that gets a
+    503 can safely resend the whole batch.
+    """
+    results = {ACCEPTED: 0, DUPLICATE: 0, QUEUE_FULL: 0, INVALID: 0}
+
+    def submit_line(line):
+        if not line.strip():
+            return
+        try:
+            data = json.loads(line)
+        except ValueError:
+            results[INVALID] += 1
+            return
+        results[ingestion_queue.submit(data)] += 1
+
+    pending = b''
+    async for chunk in request.body:
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        for line in lines:
+            submit_line(line)
+    submit_line(pending)
+
+    status = 503 if results[QUEUE_FULL] else 200
+    return jsonify({'status': 'failed' if status == 503 else 'accepted', **results}), status
+
+@app.route('/ingestion', methods=['GET'])
+async def ingestion():
+    return jsonify(ingestion_queue.stats()), 200
+
+@app.route('/rpc_latency', methods=['GET'])
+async def rpc_latency():
+    return jsonify(get_rpc_latency_stats()), 200
+
+@app.route('/rpc_endpoints', methods=['GET'])
+async def rpc_endpoints():
+    return jsonify(rpc_pool.stats()), 200
+
+@app.route('/venues', methods=['GET'])
+async def venues():
+    return jsonify(venue_selector.venues()), 200
+
+@app.route('/positions', methods=['GET'])
+async def positions():
+    if monitor_shards is not None:
+        return jsonify(monitor_shards.open_positions()), 200
+    return jsonify(position_supervisor.open_positions()), 200
+
+@app.route('/positions/<position_id>', methods=['DELETE'])
+async def cancel_position(position_id):
+    cancelled = monitor_shards.cancel(position_id) if monitor_shards is not None else position_supervisor.cancel(position_id)
+    if cancelled:
+        # Cancelled on purpose, so it is not monitored again after a restart
+        await asyncio.to_thread(position_store.close, position_id, POSITION_CANCELLED)
+        return jsonify({'status': 'cancelled'}), 200
+    return jsonify({'status': 'failed', 'reason': 'Unknown position'}), 404
+
+@app.route('/positions/<position_id>/rules', methods=['PUT'])
+async def position_rules(position_id):
+    """
+    Override exit rules of one open position, in the units of exit_rules(), e.g.
+    {"increase_threshold": 0.5}; null drops an override. Overridden rules are kept
+    when the configuration is reloaded.
+    """
+    try:
+        overrides = parse_rule_overrides(await request.get_json(silent=True))
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'failed', 'reason': str(e)}), 400
+    if monitor_shards is not None:
+        worker = monitor_shards.send_rules(position_id, overrides)
+        if worker is None:
+            return jsonify({'status': 'failed', 'reason': 'Unknown position, or it is being moved to another worker'}), 404
+        return jsonify({'status': 'forwarded', 'worker': worker}), 202
+    rules = override_position_rules(position_id, overrides)
+    if rules is None:
+        return jsonify({'status': 'failed', 'reason': 'Unknown position'}), 404
+    return jsonify({'status': 'updated', 'rules': rules}), 200
+
+@app.route('/config', methods=['GET'])
+async def config_state():
+    return jsonify(runtime_config.describe()), 200
+
+@app.route('/config', methods=['POST'])
+async def reload_config():
+    """
+    Reload the runtime configuration from .env, optionally changing settings first with a
+    JSON object in .env units, e.g. {"PRICE_INCREASE_THRESHOLD": 40, "ENABLE_TRADING": false}.
+    Changed settings are saved and win over .env until changed again.
+    """
+    changes = await request.get_json(silent=True) or {}
+    if not isinstance(changes, dict):
+        return jsonify({'status': 'failed', 'reason': 'Expected a JSON object of settings'}), 400
+    try:
+        runtime_config.reload(changes)
+    except ValueError as e:
+        return jsonify({'status': 'failed', 'reason': str(e)}), 400
+    return jsonify(runtime_config.describe()), 200
+
+@app.route('/trades', methods=['GET'])
+async def trades():
+    since = float(request.args.get('since', 0))
+    return jsonify(await asyncio.to_thread(position_store.trades, since, request.args.get('from_name'))), 200
+
+@app.route('/moonbags', methods=['GET'])
+async def moonbags():
+    return jsonify(await asyncio.to_thread(position_store.moonbags)), 200
+
+@app.route('/monitor_workers', methods=['GET'])
+async def monitor_workers():
+    if monitor_shards is None:
+        return jsonify({'status': 'failed', 'reason': 'MONITOR_WORKERS is not set'}), 404
+    return jsonify(monitor_shards.stats()), 200
+
+def resuming_monitor(position_id, restored, run):
+    """
+    Monitor factory for the position supervisor. The first run starts from `restored`;
+    runs after a crash resume from the position store instead, so the buy is not recorded
+    again and a position whose sale had already started is not sold twice.
+    """
+    runs = itertools.count()
+
+    async def monitor():
+        state = restored
+        if next(runs):
+            stored = await asyncio.to_thread(position_store.load, position_id)
+            if stored is not None:
+                status, rules, window = stored
+                if status != POSITION_OPEN:
+                    logging.error(f"Monitoring {position_id[:8]} — Not resuming after the crash, the position is {status}; check the wallet if its sale was interrupted.")
+                    return
+                state = (rules, window)
+        await run(state)
+
+    return monitor
+
+def start_monitor(position_id, details, restored=None):
+    """Monitor a position in this process or, with MONITOR_WORKERS set, in one of the monitor workers."""
+    if monitor_shards is not None:
+        monitor_shards.open(position_id, details, restored)
+        return
+    position_supervisor.start(
+        position_id,
+        resuming_monitor(position_id, restored, lambda state: monitor_price(details['token_address'], details['initial_price'], details['token_decimals'], details, state)),
+        details,
+    )
+
+async def execute_worker_exit(position_id, details, exit):
+    try:
+        await execute_exit(details['token_address'], details['token_decimals'], details, exit)
+    except Exception as e:
+        logging.error(f"Monitoring {position_id[:8]} — Could not execute the exit reported by a monitor worker: {e}")
+
+def load_restored():
+    return {position_id: (rules, window) for position_id, _, rules, window in position_store.load_open()}
+
+# Spreads positions over monitor worker processes when MONITOR_WORKERS is set; sells still happen here
+monitor_shards = ShardCoordinator(
+    MONITOR_WORKERS, lambda index: [sys.executable, os.path.abspath(__file__), '--monitor-worker', str(index)],
+    execute_worker_exit, load_restored,
+) if MONITOR_WORKERS else None
+
+def restore_positions():
+    """
+    Resume monitoring every position that was open when the server stopped. All of them
+    are tracked before the price engine's next tick, so they are priced in one batch.
+    """
+    started_at = time.perf_counter()
+    positions = position_store.load_open()
+    for position_id, details, rules, window in positions:
+        start_monitor(position_id, details, (rules, window))
+    if positions:
+        logging.info(f"Restored {len(positions)} open positions in {(time.perf_counter() - started_at) * 1000:.1f} ms.")
+
+registry.gauge('mtdb_open_positions', 'Positions whose exit rules are being evaluated.', lambda: len(position_table))
+registry.gauge('mtdb_supervised_positions', 'Position monitor tasks, including ones restarting or selling.', lambda: len(position_supervisor.positions))
+registry.gauge('mtdb_priced_tokens', 'Distinct tokens the price engine refreshes.', lambda: len(price_engine.subscriptions))
+registry.gauge('mtdb_ingestion_queued', 'Webhook messages waiting for a worker.', lambda: ingestion_queue.queue.qsize())
+registry.gauge('mtdb_ingestion_in_flight', 'Webhook messages being processed.', lambda: ingestion_queue.in_flight)
+registry.gauge('mtdb_monitor_workers', 'Monitor worker processes connected to the server.', lambda: len(monitor_shards.workers) if monitor_shards is not None else 0)
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    return registry.exposition(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/profiler', methods=['GET'])
+async def profiler_profile():
+    """The sampled stacks in collapsed format, or the profiler state with ?format=json."""
+    if request.args.get('format') == 'json':
+        return jsonify(profiler.stats()), 200
+    return profiler.collapsed(), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+@app.route('/profiler', methods=['POST'])
+async def profiler_toggle():
+    """Start or stop the sampling profiler: {"enabled": true, "interval_ms": 5}."""
+    data = await request.get_json(silent=True) or {}
+    if data.get('enabled'):
+        interval_ms = data.get('interval_ms')
+        profiler.start(interval_ms / 1000 if interval_ms else None)
+    elif profiler.running:
+        await asyncio.to_thread(profiler.stop)
+    return jsonify(profiler.stats()), 200
+
+def config_message(config):
+    return {'type': 'config', 'version': config['version'], 'settings': config['settings']}
+
+def apply_server_config(previous, config):
+    """Hand a new configuration to the monitor workers and start what newly enabled switches need."""
+    if monitor_shards is not None:
+        monitor_shards.set_config(config_message(config))
+    if config['ENABLE_MARKET_CAP_FILTER'] and not previous['ENABLE_MARKET_CAP_FILTER']:
+        eth_price_cache.start(lambda: run_rpc(fetch_eth_price_in_usd))
+    if config['ENABLE_TRADING'] and not previous['ENABLE_TRADING']:
+        fee_oracle.start(run_rpc)
+
+@app.before_serving
+async def startup():
+    config = runtime_config.current()
+    runtime_config.add_listener(apply_server_config)
+    if RUNTIME_CONFIG_WATCH_SECONDS:
+        start_background_task(runtime_config.watch())
+    if monitor_shards is not None:
+        # Workers get the configuration before any position
+        monitor_shards.set_config(config_message(config))
+        # Restored positions wait in the coordinator until their workers connect
+        await monitor_shards.start()
+    # Resume open positions first, so their monitors register before the price engine's first tick
+    restore_positions()
+    # Start the shared price engine and the webhook workers on the server's long-lived event loop
+    price_engine.ensure_started()
+    ingestion_queue.start()
+    start_background_task(probe_event_loop_lag())
+    if config['ENABLE_MARKET_CAP_FILTER']:
+        # Keep the Chainlink ETH/USD price warm for the market cap filter
+        eth_price_cache.start(lambda: run_rpc(fetch_eth_price_in_usd))
+    if config['ENABLE_TRADING']:
+        # Load everything a transaction needs up front so the first buy does not wait on it
+        await asyncio.gather(run_rpc(get_chain_id), run_rpc(nonce_manager.sync), run_rpc(fee_oracle.bootstrap))
+        # Keep the fee data current even when the price engine is not polling blocks
+        fee_oracle.start(run_rpc)
+
+@app.after_serving
+async def shutdown():
+    await ingestion_queue.stop()
+    if profiler.running:
+        await asyncio.to_thread(profiler.stop)
+    await position_supervisor.shutdown()
+    if monitor_shards is not None:
+        await monitor_shards.stop()
+    if price_engine.task is not None:
+        price_engine.task.cancel()
+    if fee_oracle.task is not None:
+        fee_oracle.task.cancel()
+    receipt_watcher.stop()
+    # Deliver the SELL notifications queued while draining
+    await asyncio.to_thread(telegram_dispatcher.flush, 10)
+    await asyncio.to_thread(action_text_archive.flush, 10)
+    await asyncio.to_thread(token_metadata_cache.flush)
+    tick_recorder.flush()
+
+def start_worker_monitor(writer, position_id, details, restored):
+    async def monitor(state):
+        decision, rules = await wait_for_exit(details['token_address'], details['initial_price'], details['token_decimals'], details, state)
+        exit = await price_exit(details['token_address'], details['token_decimals'], details, decision, rules)
+        write_message(writer, {'type': 'exit', 'position_id': position_id, 'exit': exit})
+
+    def closed(task):
+        # Also sent after an exit, when the server has already let go of the position
+        if not task.cancelled() and not writer.is_closing():
+            write_message(writer, {'type': 'closed', 'position_id': position_id})
+
+    try:
+        position_supervisor.start(position_id, resuming_monitor(position_id, restored, monitor), details).add_done_callback(closed)
+    except ValueError as e:
+        logging.error(str(e))
+
+async def send_heartbeats(writer):
+    while True:
+        write_message(writer, {'type': 'heartbeat', 'stats': {
+            'open_positions': len(position_table), 'monitor_tasks': len(position_supervisor.positions), 'priced_tokens': len(price_engine.subscriptions),
+        }})
+        await asyncio.sleep(MONITOR_HEARTBEAT_SECONDS)
+
+async def run_monitor_worker(index):
+    """
+    Runs a monitor worker (main.py --monitor-worker INDEX): monitors the positions the
+    server assigns to it and sends their priced exits back. Exits when the server goes away.
+    """
+    try:
+        reader, writer = await asyncio.open_unix_connection(MONITOR_SOCKET_PATH)
+    except OSError as e:
+        logging.error(f"Monitor worker {index} could not connect to the server at {MONITOR_SOCKET_PATH}: {e}")
+        return
+    write_message(writer, {'type': 'hello', 'worker': index, 'pid': os.getpid()})
+    price_engine.ensure_started()
+    heartbeats = asyncio.create_task(send_heartbeats(writer))
+    try:
+        while True:
+            message = await read_message(reader)
+            if message is None:
+                break
+            if message['type'] == 'open':
+                start_worker_monitor(writer, message['position_id'], message['details'], message['restored'])
+            elif message['type'] == 'cancel':
+                position_supervisor.cancel(message['position_id'])
+            elif message['type'] == 'config':
+                runtime_config.apply(message['settings'], message['version'])
+            elif message['type'] == 'amount':
+                if not set_position_token_amount(message['position_id'], message['token_amount']):
+                    logging.error(f"Monitor worker {index} could not correct the token amount of {message['position_id'][:8]}, it is not monitored here.")
+            elif message['type'] == 'rules':
+                if override_position_rules(message['position_id'], message['overrides']) is None:
+                    logging.error(f"Monitor worker {index} could not override the exit rules of {message['position_id'][:8]}, it is not monitored here.")
+    finally:
+        heartbeats.cancel()
+        # Positions stay open in the position store and are moved to another worker
+        await position_supervisor.shutdown(0)
+        tick_recorder.flush()
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == '--monitor-worker':
+        asyncio.run(run_monitor_worker(int(sys.argv[2])))
+    else:
+        import uvicorn
+        uvicorn.run(app, host='0.0.0.0', port=5000, timeout_keep_alive=0)
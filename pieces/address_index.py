@@ -0,0 +1,108 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from functools import lru_cache
+from dotenv import load_dotenv
+from eth_utils import keccak
+from web3 import Web3
+from pieces.multicall import rpc_batch
+
+# Load environment variables
+load_dotenv()
+
+ADDRESS_INDEX_PATH = os.getenv('ADDRESS_INDEX_PATH', 'data/address_index.sqlite')
+ADDRESS_INDEX_MISS_TTL = float(os.getenv('ADDRESS_INDEX_MISS_TTL', 300))  # Seconds before a missing pair/pool is checked again
+
+# Init code hashes of the Uniswap pair/pool contracts, used for CREATE2 address derivation
+UNISWAP_V2_PAIR_INIT_CODE_HASH = bytes.fromhex('96e8ac4277198ff8b6f785478aa9a39f403cb768dd02cbee326c3e7da348845f')
+UNISWAP_V3_POOL_INIT_CODE_HASH = bytes.fromhex('e34f199b19b2b4f47f68442619d555527d244f78a3297ea89325f843f87b8b54')
+
+@lru_cache(maxsize=65536)
+def checksum(address):
+    """Memoized Web3.to_checksum_address for addresses seen on every tick."""
+    return Web3.to_checksum_address(address)
+
+def sort_tokens(token_a, token_b):
+    token_a, token_b = bytes.fromhex(token_a[2:]), bytes.fromhex(token_b[2:])
+    return (token_a, token_b) if token_a < token_b else (token_b, token_a)
+
+def create2_address(factory, salt, init_code_hash):
+    return checksum('0x' + keccak(b'\xff' + bytes.fromhex(factory[2:]) + salt + init_code_hash)[12:].hex())
+
+def compute_v2_pair_address(factory, token_a, token_b):
+    token0, token1 = sort_tokens(token_a, token_b)
+    return create2_address(factory, keccak(token0 + token1), UNISWAP_V2_PAIR_INIT_CODE_HASH)
+
+def compute_v3_pool_address(factory, token_a, token_b, fee):
+    token0, token1 = sort_tokens(token_a, token_b)
+    salt = keccak(token0.rjust(32, b'\0') + token1.rjust(32, b'\0') + fee.to_bytes(32, 'big'))
+    return create2_address(factory, salt, UNISWAP_V3_POOL_INIT_CODE_HASH)
+
+class AddressIndex:
+    """
+    Derives Uniswap pair/pool addresses locally and remembers, in memory and in SQLite,
+    whether a contract has been deployed there. Each address is verified once with
+    eth_getCode; addresses with no code are re-checked after ADDRESS_INDEX_MISS_TTL.
+    """
+
+    def __init__(self, path=ADDRESS_INDEX_PATH, miss_ttl=ADDRESS_INDEX_MISS_TTL):
+        self.path = path
+        self.miss_ttl = miss_ttl
+        self.lock = threading.Lock()
+        self.entries = {}  # address -> (exists, checked_at)
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS addresses (address TEXT PRIMARY KEY, kind TEXT, factory TEXT, token0 TEXT, token1 TEXT, fee INTEGER, exists_onchain INTEGER, checked_at REAL)')
+            for address, exists, checked_at in self.connection.execute('SELECT address, exists_onchain, checked_at FROM addresses'):
+                self.entries[address] = (bool(exists), checked_at)
+            logging.info(f"Loaded {len(self.entries)} pair/pool addresses from {self.path}")
+        return self.connection
+
+    def resolve(self, web3, candidates):
+        """
+        Takes (kind, factory, token_a, token_b, fee) tuples and returns the deployed
+        address for each, or None. Unknown addresses are verified in one batched request.
+        """
+        with self.lock:
+            self.connect()
+            now = time.time()
+            addresses = []
+            unknown = []
+            for kind, factory, token_a, token_b, fee in candidates:
+                if kind == 'v2':
+                    address = compute_v2_pair_address(factory, token_a, token_b)
+                else:
+                    address = compute_v3_pool_address(factory, token_a, token_b, fee)
+                addresses.append(address)
+                entry = self.entries.get(address)
+                if entry is None or (not entry[0] and now - entry[1] > self.miss_ttl):
+                    unknown.append((address, kind, factory, token_a, token_b, fee))
+
+            if unknown:
+                self.verify(web3, unknown, now)
+
+            return [address if self.entries.get(address, (False, 0))[0] else None for address in addresses]
+
+    def verify(self, web3, unknown, now):
+        codes = rpc_batch(web3, [('eth_getCode', [address, 'latest']) for address, *_ in unknown])
+        rows = []
+        for (address, kind, factory, token_a, token_b, fee), code in zip(unknown, codes):
+            if code is None:
+                continue  # Request failed, try again next time
+            exists = code not in ('0x', '0x0')
+            self.entries[address] = (exists, now)
+            token0, token1 = sort_tokens(token_a, token_b)
+            rows.append((address, kind, factory, '0x' + token0.hex(), '0x' + token1.hex(), fee, int(exists), now))
+        self.connection.executemany('INSERT OR REPLACE INTO addresses VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        self.connection.commit()
+
+# Shared index used by the pricing helpers
+address_index = AddressIndex()
@@ -0,0 +1,57 @@
+import time
+import queue
+import logging
+import threading
+
+class LineArchive:
+    """
+    Appends lines to a text file from a background thread. The file stays open, and
+    whatever has queued up while the previous write ran is written and flushed in one
+    go, so callers never block on disk I/O. With `format`, callers queue raw records and
+    the thread turns them into lines, so serializing them is off the caller's path too.
+    """
+
+    def __init__(self, path, format=None):
+        self.path = path
+        self.format = format
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def write(self, line):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name=f'archive-{self.path}', daemon=True)
+                self.thread.start()
+        self.queue.put(line)
+
+    def run(self):
+        with open(self.path, 'a') as file:
+            while True:
+                lines = [self.queue.get()]
+                try:
+                    while True:
+                        lines.append(self.queue.get_nowait())
+                except queue.Empty:
+                    pass
+                try:
+                    if self.format is not None:
+                        lines = [self.format(line) for line in lines]
+                    file.write('\n'.join(lines) + '\n')
+                    file.flush()
+                except (OSError, TypeError, ValueError) as e:
+                    logging.error(f"Failed to write {len(lines)} lines to {self.path}: {e}")
+                finally:
+                    for _ in lines:
+                        self.queue.task_done()
+
+    def flush(self, timeout=None):
+        """Wait until every queued line has been written."""
+        if self.thread is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
@@ -0,0 +1,66 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from pieces.metrics import rpc_call_seconds, rpc_errors_total
+
+# Load environment variables
+load_dotenv()
+
+RPC_THREAD_POOL_SIZE = int(os.getenv('RPC_THREAD_POOL_SIZE', 16))  # Maximum number of blocking web3 calls in flight
+RPC_SLOW_CALL_SECONDS = float(os.getenv('RPC_SLOW_CALL_SECONDS', 2))  # Log calls slower than this
+
+# Dedicated pool so blocking web3 calls never run on the event loop thread
+rpc_executor = ThreadPoolExecutor(max_workers=RPC_THREAD_POOL_SIZE, thread_name_prefix='rpc')
+
+rpc_latency = {}  # call name -> {'calls', 'errors', 'total_seconds', 'max_seconds'}
+rpc_latency_lock = threading.Lock()
+
+async def run_rpc(fn, *args, **kwargs):
+    """
+    Runs a blocking web3 helper on the RPC thread pool and awaits its result,
+    recording how long the call took under the function's name. The caller's context
+    goes along, so requests made by the helper are attributed to the caller's position.
+    """
+    loop = asyncio.get_running_loop()
+    name = getattr(fn, '__qualname__', repr(fn))
+    start = time.perf_counter()
+    failed = False
+    try:
+        return await loop.run_in_executor(rpc_executor, contextvars.copy_context().run, functools.partial(fn, *args, **kwargs))
+    except Exception:
+        failed = True
+        raise
+    finally:
+        record_latency(name, time.perf_counter() - start, failed)
+
+def record_latency(name, elapsed, failed=False):
+    with rpc_latency_lock:
+        stats = rpc_latency.setdefault(name, {'calls': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+        stats['calls'] += 1
+        stats['errors'] += int(failed)
+        stats['total_seconds'] += elapsed
+        stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+    rpc_call_seconds.observe(elapsed, name)
+    if failed:
+        rpc_errors_total.inc(name)
+    if elapsed > RPC_SLOW_CALL_SECONDS:
+        logging.warning(f"Slow RPC call {name}: {elapsed:.2f}s")
+
+def get_rpc_latency_stats():
+    """Return per-call latency statistics (call count, errors, average and max seconds)."""
+    with rpc_latency_lock:
+        return {
+            name: {
+                'calls': stats['calls'],
+                'errors': stats['errors'],
+                'avg_seconds': stats['total_seconds'] / stats['calls'],
+                'max_seconds': stats['max_seconds'],
+            }
+            for name, stats in rpc_latency.items()
+        }
@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+ETH_PRICE_TTL_SECONDS = float(os.getenv('ETH_PRICE_TTL_SECONDS', 60))  # How long a Chainlink ETH/USD price stays valid
+TOTAL_SUPPLY_TTL_SECONDS = float(os.getenv('TOTAL_SUPPLY_TTL_SECONDS', 30))  # How long a token's totalSupply stays valid
+TOKEN_METADATA_CACHE_SIZE = int(os.getenv('TOKEN_METADATA_CACHE_SIZE', 10000))  # Tokens kept in the metadata cache
+TOKEN_METADATA_CACHE_PATH = os.getenv('TOKEN_METADATA_CACHE_PATH', 'data/token_metadata.json')
+TOKEN_METADATA_CACHE_FLUSH_SECONDS = float(os.getenv('TOKEN_METADATA_CACHE_FLUSH_SECONDS', 30))  # How often new entries are written to the cache file
+
+class TTLCache:
+    """Thread-safe key/value cache whose entries expire `ttl` seconds after being set."""
+
+    def __init__(self, ttl, maxsize=10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.entries = OrderedDict()  # key -> (value, expires_at)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self.entries[key]
+                return None
+            return entry[0]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache, optionally persisted to a JSON file. Inserts
+    only mark the cache dirty; a background thread writes the file every
+    `flush_interval` seconds, and flush() writes it at shutdown.
+    """
+
+    def __init__(self, maxsize, path=None, flush_interval=TOKEN_METADATA_CACHE_FLUSH_SECONDS):
+        self.maxsize = maxsize
+        self.path = path
+        self.flush_interval = flush_interval
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.dirty = False
+        self.thread = None
+        self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as file:
+                for key, value in json.load(file):
+                    self.entries[key] = value
+            logging.info(f"Loaded {len(self.entries)} cached entries from {self.path}")
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not load cache file {self.path}: {e}")
+
+    def flush(self):
+        """Write the cache file if anything was added since the last write."""
+        if not self.path:
+            return
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                entries = list(self.entries.items())
+                self.dirty = False
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                temp_path = self.path + '.tmp'
+                with open(temp_path, 'w') as file:
+                    json.dump(entries, file)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                self.dirty = True
+                logging.error(f"Could not save cache file {self.path}: {e}")
+
+    def flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+            self.dirty = True
+            if self.path and self.thread is None:
+                self.thread = threading.Thread(target=self.flush_forever, name=f'cache-{self.path}', daemon=True)
+                self.thread.start()
+
+class RefreshedValue:
+    """
+    A single value kept warm by a background task that refreshes it every `ttl / 2`
+    seconds. get() returns None once the value is older than `ttl`.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.value = None
+        self.updated_at = 0.0
+        self.task = None
+
+    def get(self):
+        if self.value is None or time.monotonic() - self.updated_at > self.ttl:
+            return None
+        return self.value
+
+    def set(self, value):
+        self.value = value
+        self.updated_at = time.monotonic()
+
+    def start(self, fetch):
+        """Start refreshing in the background with `fetch`, an awaitable returning the new value."""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.refresh_forever(fetch))
+
+    async def refresh_forever(self, fetch):
+        while True:
+            try:
+                self.set(await fetch())
+            except Exception as e:
+                logging.error(f"Background refresh failed: {e}")
+            await asyncio.sleep(self.ttl / 2)
+
+# Shared caches
+eth_price_cache = RefreshedValue(ETH_PRICE_TTL_SECONDS)
+total_supply_cache = TTLCache(TOTAL_SUPPLY_TTL_SECONDS)
+token_metadata_cache = LRUCache(TOKEN_METADATA_CACHE_SIZE, TOKEN_METADATA_CACHE_PATH)  # token address -> [name, symbol, decimals]
@@ -0,0 +1,199 @@
+import os
+import json
+import logging
+import threading
+from web3 import Web3
+from web3._utils.abi import get_abi_input_types, get_abi_output_types
+from eth_utils import function_abi_to_4byte_selector
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+ABI_DIR = os.getenv('ABI_DIR', 'abis')  # Directory of the contract ABI JSON files
+ABI_CACHE_PATH = os.getenv('ABI_CACHE_PATH', 'data/abi_cache.json')  # Compiled ABI fragments, rebuilt when an ABI file changes
+
+# The functions used from each ABI file; nothing else is kept, and files not listed are never read
+ABI_FRAGMENTS = {
+    'IUniswapV2Factory': ('getPair',),
+    'IUniswapV2Pair': ('getReserves', 'token0', 'token1'),
+    'IUniswapV2ERC20': ('name', 'symbol', 'decimals', 'totalSupply', 'balanceOf', 'allowance', 'approve'),
+    'IUniswapV2Router02': ('swapExactETHForTokens', 'swapExactTokensForETH', 'getAmountsOut'),
+    'IUniswapV3Factory': ('getPool',),
+    'IUniswapV3Pool': ('slot0', 'liquidity', 'token0', 'token1', 'fee', 'ticks', 'tickBitmap'),
+}
+
+# ABIs that are not shipped as files
+CHAINLINK_AGGREGATOR_ABI = [{
+    'name': 'latestRoundData', 'type': 'function', 'stateMutability': 'view', 'inputs': [],
+    'outputs': [{'name': 'roundId', 'type': 'uint80'}, {'name': 'answer', 'type': 'int256'}, {'name': 'startedAt', 'type': 'uint256'},
+                {'name': 'updatedAt', 'type': 'uint256'}, {'name': 'answeredInRound', 'type': 'uint80'}],
+}]
+
+def compile_function(entry):
+    """What encoding a call and decoding its result needs: selector, input and output types."""
+    return {
+        'abi': entry,
+        'selector': '0x' + function_abi_to_4byte_selector(entry).hex(),
+        'inputs': get_abi_input_types(entry),
+        'outputs': get_abi_output_types(entry),
+    }
+
+class ContractRegistry:
+    """
+    Compiled ABI fragments shared by every module. The functions listed in ABI_FRAGMENTS
+    are read from the ABI files once, with their selectors and input/output types, and
+    saved to ABI_CACHE_PATH; later starts load that small file instead of parsing the
+    ABIs again, unless one of them changed. Nothing is loaded until a contract is used.
+    """
+
+    def __init__(self, abi_dir=ABI_DIR, cache_path=ABI_CACHE_PATH, fragments=ABI_FRAGMENTS):
+        self.abi_dir = abi_dir
+        self.cache_path = cache_path
+        self.fragments = fragments
+        self.functions = None  # ABI name -> function name -> compiled function
+        self.inline = {}  # ABI name -> ABI registered in code, compiled on first use
+        self.lock = threading.Lock()
+
+    def sources(self):
+        stamps = {}
+        for name in self.fragments:
+            stat = os.stat(os.path.join(self.abi_dir, f'{name}.json'))
+            stamps[name] = [stat.st_mtime_ns, stat.st_size]
+        return stamps
+
+    def load(self):
+        with self.lock:
+            if self.functions is not None:
+                return self.functions
+            sources = self.sources()
+            functions = self.load_cache(sources)
+            if functions is None:
+                functions = {name: self.compile_file(name, wanted) for name, wanted in self.fragments.items()}
+                self.save_cache(sources, functions)
+            self.functions = functions
+            return functions
+
+    def load_cache(self, sources):
+        try:
+            with open(self.cache_path) as file:
+                cache = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if cache.get('sources') != sources or any(set(cache['functions'].get(name, ())) != set(wanted) for name, wanted in self.fragments.items()):
+            return None
+        return cache['functions']
+
+    def save_cache(self, sources, functions):
+        directory = os.path.dirname(self.cache_path)
+        try:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.cache_path + '.tmp', 'w') as file:
+                json.dump({'sources': sources, 'functions': functions}, file, separators=(',', ':'))
+            os.replace(self.cache_path + '.tmp', self.cache_path)
+        except OSError as e:
+            logging.error(f"Could not save the ABI cache to {self.cache_path}: {e}")
+        logging.info(f"Compiled {sum(len(compiled) for compiled in functions.values())} ABI functions from {len(functions)} files.")
+
+    def compile_file(self, name, wanted):
+        with open(os.path.join(self.abi_dir, f'{name}.json')) as file:
+            abi = json.load(file)
+        if isinstance(abi, dict):
+            abi = abi['abi']
+        entries = {entry['name']: entry for entry in abi if entry.get('type') == 'function' and entry.get('name') in wanted}
+        missing = set(wanted) - set(entries)
+        if missing:
+            raise ValueError(f"{name}.json has no function {', '.join(sorted(missing))}.")
+        return {function_name: compile_function(entry) for function_name, entry in entries.items()}
+
+    def register(self, name, abi):
+        """Add an ABI that is not shipped as a file; all of its functions are compiled when first used."""
+        with self.lock:
+            self.inline[name] = abi
+
+    def compiled(self, name):
+        functions = self.load()
+        if name not in functions:
+            with self.lock:
+                abi = self.inline[name]
+                functions[name] = {entry['name']: compile_function(entry) for entry in abi if entry.get('type') == 'function'}
+        return functions[name]
+
+class ContractFunction:
+    """
+    A prepared contract call. It has the attributes multicall() relies on, and call()
+    sends it as a single eth_call.
+    """
+    __slots__ = ('web3', 'address', 'fn_name', 'compiled', 'args')
+
+    def __init__(self, web3, address, fn_name, compiled, args):
+        self.web3 = web3
+        self.address = address
+        self.fn_name = fn_name
+        self.compiled = compiled
+        self.args = args
+
+    @property
+    def abi(self):
+        return self.compiled['abi']
+
+    def _encode_transaction_data(self):
+        # Named like web3's ContractFunction method, so either can be batched
+        return self.compiled['selector'] + self.web3.codec.encode(self.compiled['inputs'], self.args).hex()
+
+    def decode(self, return_data):
+        """Decode the call's return data like web3 does: one output bare, several as a list, addresses checksummed."""
+        output_types = self.compiled['outputs']
+        decoded = self.web3.codec.decode(output_types, return_data)
+        decoded = [Web3.to_checksum_address(value) if output_type == 'address' else value for output_type, value in zip(output_types, decoded)]
+        return decoded[0] if len(decoded) == 1 else decoded
+
+    def call(self, block_identifier='latest'):
+        return self.decode(self.web3.eth.call({'to': self.address, 'data': self._encode_transaction_data()}, block_identifier))
+
+class ContractFunctions:
+    __slots__ = ('contract',)
+
+    def __init__(self, contract):
+        self.contract = contract
+
+    def __getattr__(self, fn_name):
+        contract = self.contract
+        compiled = contract.compiled.get(fn_name)
+        if compiled is None:
+            raise AttributeError(f"{contract.name} has no compiled function {fn_name}; add it to ABI_FRAGMENTS.")
+        return lambda *args: ContractFunction(contract.web3, contract.address, fn_name, compiled, args)
+
+class Contract:
+    """
+    Stand-in for web3's contract objects, built from the shared compiled fragments. They
+    are looked up when a function is first used, so contracts can be created at import.
+    """
+    __slots__ = ('web3', 'name', 'address', '_compiled')
+
+    def __init__(self, web3, name, address):
+        self.web3 = web3
+        self.name = name
+        self.address = address
+        self._compiled = None
+
+    @property
+    def compiled(self):
+        if self._compiled is None:
+            self._compiled = contract_registry.compiled(self.name)
+        return self._compiled
+
+    @property
+    def functions(self):
+        return ContractFunctions(self)
+
+    def encode_abi(self, fn_name, args):
+        return getattr(self.functions, fn_name)(*args)._encode_transaction_data()
+
+# Shared registry of the compiled ABI fragments
+contract_registry = ContractRegistry()
+
+def contract(web3, name, address):
+    """Contract `name` (an ABI in ABI_FRAGMENTS or registered) at a checksummed `address`; its ABI is loaded on first use."""
+    return Contract(web3, name, address)
@@ -0,0 +1,85 @@
+import os
+import time
+import asyncio
+import logging
+import statistics
+import threading
+from collections import deque
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+FEE_HISTORY_BLOCKS = int(os.getenv('FEE_HISTORY_BLOCKS', 10))  # Recent blocks kept for the priority fee estimate
+FEE_PRIORITY_PERCENTILE = float(os.getenv('FEE_PRIORITY_PERCENTILE', 50))  # Percentile of tips paid in each block
+FEE_BASE_FEE_MULTIPLIER = float(os.getenv('FEE_BASE_FEE_MULTIPLIER', 2))  # Headroom for base fee increases before inclusion
+FEE_MIN_PRIORITY_FEE_GWEI = float(os.getenv('FEE_MIN_PRIORITY_FEE_GWEI', 1))
+FEE_ORACLE_MAX_AGE_SECONDS = float(os.getenv('FEE_ORACLE_MAX_AGE_SECONDS', 30))  # Refresh on demand when older than this
+FEE_ORACLE_REFRESH_SECONDS = float(os.getenv('FEE_ORACLE_REFRESH_SECONDS', 12))  # Background refresh interval, about one block
+
+class FeeOracle:
+    """
+    Tracks the next block's base fee and recent priority fees in memory from
+    eth_feeHistory, so EIP-1559 fee fields can be filled in without a pre-send RPC.
+    A background task started with start() polls once per block; poll() also doubles
+    as the price engine's new-block probe, in which case the task skips its own poll.
+    """
+
+    def __init__(self, web3, history_blocks=FEE_HISTORY_BLOCKS, percentile=FEE_PRIORITY_PERCENTILE):
+        self.web3 = web3
+        self.percentile = percentile
+        self.priority_fees = deque(maxlen=history_blocks)
+        self.next_base_fee = None
+        self.latest_block = None
+        self.updated_at = 0.0
+        self.lock = threading.Lock()
+        self.task = None
+
+    def poll(self):
+        """Read the latest block's fee data and return its number."""
+        self.update(self.web3.eth.fee_history(1, 'latest', [self.percentile]))
+        return self.latest_block
+
+    def start(self, run, interval=FEE_ORACLE_REFRESH_SECONDS):
+        """Start refreshing in the background; `run` awaits a blocking call off the event loop, e.g. run_rpc."""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.refresh_forever(run, interval))
+
+    async def refresh_forever(self, run, interval):
+        while True:
+            # The price engine's block probe may already have refreshed the data
+            if time.monotonic() - self.updated_at >= interval:
+                try:
+                    await run(self.poll)
+                except Exception as e:
+                    logging.error(f"Fee oracle refresh failed: {e}")
+            await asyncio.sleep(interval)
+
+    def bootstrap(self):
+        self.update(self.web3.eth.fee_history(self.priority_fees.maxlen, 'latest', [self.percentile]))
+
+    def update(self, fee_history):
+        with self.lock:
+            newest_block = fee_history['oldestBlock'] + len(fee_history['gasUsedRatio']) - 1
+            if self.latest_block is not None and newest_block <= self.latest_block:
+                self.updated_at = time.monotonic()
+                return
+            for reward in fee_history.get('reward') or []:
+                self.priority_fees.append(reward[0])
+            # The last entry is the base fee of the block after the newest one
+            self.next_base_fee = fee_history['baseFeePerGas'][-1]
+            self.latest_block = newest_block
+            self.updated_at = time.monotonic()
+
+    def fees(self):
+        """Return the maxFeePerGas/maxPriorityFeePerGas fields for a transaction sent now."""
+        if self.next_base_fee is None or time.monotonic() - self.updated_at > FEE_ORACLE_MAX_AGE_SECONDS:
+            logging.info("Fee oracle is stale, refreshing fee history.")
+            self.bootstrap()
+        with self.lock:
+            min_priority_fee = self.web3.to_wei(FEE_MIN_PRIORITY_FEE_GWEI, 'gwei')
+            priority_fee = max(int(statistics.median(self.priority_fees)) if self.priority_fees else 0, min_priority_fee)
+            return {
+                'maxFeePerGas': int(self.next_base_fee * FEE_BASE_FEE_MULTIPLIER) + priority_fee,
+                'maxPriorityFeePerGas': priority_fee,
+            }
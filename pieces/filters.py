@@ -1,11 +1,28 @@
 import re
+import json
+import time
 import logging
 from web3 import Web3
+from pieces.multicall import multicall
+from pieces.contracts import contract
+from pieces.cache import token_metadata_cache
+from pieces.archive import LineArchive
 
 # Define the file path where cleaned action texts will be saved
 ACTION_TEXT_FILE = 'logs/cleaned_action_texts.log'
 
-def filter_message(data, filter_from_names):
+# Patterns are compiled once instead of on every message
+BANANA_GUN_PATTERN = re.compile(r'ETH \〈[^\)]+\〉 for')
+TOKEN_LINK_PATTERN = re.compile(r'https://etherscan\.io/token/(0x[0-9a-fA-F]{40})')
+
+def format_action_text(record):
+    timestamp, from_name, tx_hash, action_text_cleaned = record
+    return json.dumps({'timestamp': timestamp, 'from_name': from_name, 'tx_hash': tx_hash, 'action_text': action_text_cleaned})
+
+# Cleaned action texts are serialized and written from a background thread
+action_text_archive = LineArchive(ACTION_TEXT_FILE, format_action_text)
+
+def filter_message(data, filter_from_names, archive=True):
     from_name = data.get('from_name')
     action_text = data.get('action_text')
     passed_filters = []
@@ -13,10 +30,11 @@ def filter_message(data, filter_from_names):
     # Remove backslashes from action_text
     action_text_cleaned = action_text.replace('\\', '')
 
-    # Save the cleaned action text to a file
-    save_action_text(action_text_cleaned)
+    # Save the cleaned action text to a file (not when replaying the archive itself)
+    if archive:
+        save_action_text(action_text_cleaned, data)
 
-    # Check if from_name matches any of the names in filter_from_names
+    # Check if from_name matches any of the names in filter_from_names (pass a set for constant-time lookups)
     if from_name in filter_from_names:
         logging.info(f"FILTER 1 — 'from_name' : '{from_name}' — PASSED")
         passed_filters.append("'from_name'")
@@ -25,7 +43,7 @@ def filter_message(data, filter_from_names):
         return False
 
     # Check if action_text_cleaned includes 'ETH For' (Uniswap) or 'ETH (xyz) for' (Banana Gun)
-    if 'ETH For' in action_text_cleaned or re.search(r'ETH \〈[^\)]+\〉 for', action_text_cleaned):
+    if 'ETH For' in action_text_cleaned or BANANA_GUN_PATTERN.search(action_text_cleaned):
         logging.info(f"FILTER 2 — 'action_text' includes 'ETH For' or 'ETH (xyz) for' — PASSED")
         passed_filters.append("'action_text'")
         return True
@@ -43,21 +61,33 @@ def extract_token_address(action_text):
         eth_for_index = action_text.find(' for', eth_for_index)
         if eth_for_index == -1:
             return None
-    action_text_after_eth_for = action_text[eth_for_index:]
-    match = re.search(r'https://etherscan.io/token/0x[0-9a-fA-F]{40}', action_text_after_eth_for)
+    # Search from the anchor onwards without copying the rest of the text
+    match = TOKEN_LINK_PATTERN.search(action_text, eth_for_index)
     if match:
-        token_address = match.group().split('/')[-1]
-        return token_address
+        return match.group(1)
     return None
 
-def get_token_details(web3, token_address, uniswap_v2_erc20_abi):
-    token_contract = web3.eth.contract(address=Web3.to_checksum_address(token_address), abi=uniswap_v2_erc20_abi)
-    name = token_contract.functions.name().call()
-    symbol = token_contract.functions.symbol().call()
-    decimals = token_contract.functions.decimals().call()
+def get_token_details(web3, token_address):
+    # Name, symbol and decimals never change, so they are fetched once per token
+    metadata = token_metadata_cache.get(token_address.lower())
+    if metadata is not None:
+        return tuple(metadata)
+
+    token_contract = contract(web3, 'IUniswapV2ERC20', Web3.to_checksum_address(token_address))
+    name, symbol, decimals = multicall(web3, [
+        token_contract.functions.name(),
+        token_contract.functions.symbol(),
+        token_contract.functions.decimals(),
+    ])
+    if decimals is not None:
+        token_metadata_cache.set(token_address.lower(), [name, symbol, decimals])
     return name, symbol, decimals
 
-def save_action_text(action_text_cleaned):
-    """Save the cleaned action text to a file."""
-    with open(ACTION_TEXT_FILE, 'a') as file:
-        file.write(action_text_cleaned + '\n')
\ No newline at end of file
+def save_action_text(action_text_cleaned, data=None):
+    """
+    Queue the cleaned action text to be appended to the archive file, as one JSON object
+    per line with the time it was received and who sent it, so it can be replayed. The
+    record is serialized by the archive's thread, not by the caller.
+    """
+    data = data or {}
+    action_text_archive.write((time.time(), data.get('from_name'), data.get('tx_hash'), action_text_cleaned))
\ No newline at end of file
@@ -0,0 +1,123 @@
+import os
+import time
+import asyncio
+import logging
+import itertools
+from collections import OrderedDict
+from dotenv import load_dotenv
+from pieces.metrics import stage_seconds
+
+# Load environment variables
+load_dotenv()
+
+INGESTION_WORKERS = int(os.getenv('INGESTION_WORKERS', 4))  # Webhook messages processed concurrently
+INGESTION_QUEUE_SIZE = int(os.getenv('INGESTION_QUEUE_SIZE', 1000))  # Messages waiting before the webhook answers 503
+DEDUPE_WINDOW_SECONDS = float(os.getenv('DEDUPE_WINDOW_SECONDS', 3600))  # How long a tx_hash is remembered
+DEDUPE_MAX_ENTRIES = int(os.getenv('DEDUPE_MAX_ENTRIES', 100000))
+
+# Results of IngestionQueue.submit
+ACCEPTED = 'accepted'
+DUPLICATE = 'duplicate'
+QUEUE_FULL = 'queue_full'
+INVALID = 'invalid'
+
+class RecentKeys:
+    """Remembers keys for `window` seconds (and at most `max_entries` of them) in insertion order."""
+
+    def __init__(self, window=DEDUPE_WINDOW_SECONDS, max_entries=DEDUPE_MAX_ENTRIES):
+        self.window = window
+        self.max_entries = max_entries
+        self.seen = OrderedDict()  # key -> time first seen
+
+    def add(self, key):
+        """Record `key`; returns False if it was already seen within the window."""
+        now = time.monotonic()
+        while self.seen:
+            oldest_key, seen_at = next(iter(self.seen.items()))
+            if now - seen_at <= self.window and len(self.seen) < self.max_entries:
+                break
+            del self.seen[oldest_key]
+        if key in self.seen:
+            return False
+        self.seen[key] = now
+        return True
+
+    def discard(self, key):
+        self.seen.pop(key, None)
+
+class IngestionQueue:
+    """
+    Decouples webhook acknowledgement from processing: messages are deduplicated by
+    tx_hash, placed on a bounded priority queue and handled by a pool of workers.
+    """
+
+    def __init__(self, handler, priority=lambda data: 0, workers=INGESTION_WORKERS, maxsize=INGESTION_QUEUE_SIZE):
+        self.handler = handler
+        self.priority = priority
+        self.worker_count = workers
+        self.queue = asyncio.PriorityQueue(maxsize=maxsize)
+        self.recent = RecentKeys()
+        self.sequence = itertools.count()  # Keeps FIFO order within a priority
+        self.workers = []
+        self.in_flight = 0
+        self.counters = {'accepted': 0, 'duplicates': 0, 'rejected': 0, 'invalid': 0, 'processed': 0, 'failed': 0}
+        self.max_wait_seconds = 0.0
+
+    def start(self):
+        if not self.workers:
+            self.workers = [asyncio.create_task(self.work(), name=f'ingestion-worker-{i}') for i in range(self.worker_count)]
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def submit(self, data):
+        """Queue a webhook message without waiting for it to be processed."""
+        if not isinstance(data, dict) or not isinstance(data.get('tx_hash'), str) or not data['tx_hash']:
+            self.counters['invalid'] += 1
+            logging.error(f"Rejecting a malformed webhook message: {data!r:.200}")
+            return INVALID
+        tx_hash = data['tx_hash']
+        if not self.recent.add(tx_hash):
+            self.counters['duplicates'] += 1
+            logging.info(f"Ignoring duplicate transaction {tx_hash}.")
+            return DUPLICATE
+        try:
+            self.queue.put_nowait((self.priority(data), next(self.sequence), time.monotonic(), data))
+        except asyncio.QueueFull:
+            # Forget the hash so the sender's retry is not treated as a duplicate
+            self.recent.discard(tx_hash)
+            self.counters['rejected'] += 1
+            logging.error(f"Ingestion queue is full, rejecting transaction {tx_hash}.")
+            return QUEUE_FULL
+        self.counters['accepted'] += 1
+        return ACCEPTED
+
+    async def work(self):
+        while True:
+            _, _, enqueued_at, data = await self.queue.get()
+            waited = time.monotonic() - enqueued_at
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            stage_seconds.observe(waited, 'ingestion_wait')
+            self.in_flight += 1
+            try:
+                await self.handler(data)
+                self.counters['processed'] += 1
+            except Exception as e:
+                self.counters['failed'] += 1
+                logging.error(f"Failed to process transaction {data.get('tx_hash')}: {e}")
+            finally:
+                self.in_flight -= 1
+                self.queue.task_done()
+
+    def stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'capacity': self.queue.maxsize,
+            'in_flight': self.in_flight,
+            'workers': len(self.workers),
+            'max_wait_seconds': self.max_wait_seconds,
+            **self.counters,
+        }
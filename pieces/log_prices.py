@@ -0,0 +1,151 @@
+import os
+import json
+import asyncio
+import logging
+import itertools
+import websockets
+from dotenv import load_dotenv
+from pieces.multicall import rpc_batch
+from pieces.uniswap import v2_price_from_reserves, v3_price_from_slot0, venue_selector
+
+# Load environment variables
+load_dotenv()
+
+PRICE_LOGS_WS_URL = os.getenv('PRICE_LOGS_WS_URL')  # Optional websocket endpoint; without it logs are fetched with eth_getLogs per block
+PRICE_LOGS_MAX_BLOCKS = int(os.getenv('PRICE_LOGS_MAX_BLOCKS', 100))  # Re-read reserves instead of fetching logs for longer gaps
+PRICE_LOGS_RECONNECT_SECONDS = float(os.getenv('PRICE_LOGS_RECONNECT_SECONDS', 5))
+
+SYNC_TOPIC = '0x1c411e9a96e071241c2f21f7726b17ae89e3cab4c78be50e062b03a9fffbbad1'  # Sync(uint112,uint112)
+SWAP_TOPIC = '0xc42079f94a6350d7e6235f29174924f928cc2ac818eb64fed8004e115fbcca67'  # Swap(address,address,int256,int256,uint160,uint128,int24)
+
+def data_word(data, index):
+    # Log data is a hex string of 32-byte words
+    start = 2 + index * 64
+    return int(data[start:start + 64], 16)
+
+def signed_data_word(data, index):
+    word = data_word(data, index)
+    return word - 2 ** 256 if word >= 2 ** 255 else word
+
+class LogPriceFeed:
+    """
+    Keeps token prices current from the Sync events of V2 pairs and the Swap events of
+    V3 pools. Both carry the pool's new state (reserves, sqrtPriceX96), so the latest
+    event is enough to price a token, and one log query per block covers every venue.
+    Logs can be fetched with eth_getLogs or streamed over a websocket subscription.
+    """
+
+    def __init__(self, weth_address):
+        self.weth_address = weth_address
+        self.venues = {}  # lowercase venue address -> {'kind', 'token_address', 'decimals'}
+        self.tokens = {}  # lowercase token address -> lowercase venue address
+        self.prices = {}  # token address -> latest price
+        self.next_block = None  # First block whose logs have not been applied yet
+        self.resync = False  # Set when logs may have been missed and prices must be re-read
+        self.venues_changed = asyncio.Event()
+
+    def add(self, token_address, decimals, kind, venue_address, price):
+        """Follow a token's venue, starting from a price read directly from the pool."""
+        if self.tokens.get(token_address.lower()) == venue_address.lower():
+            self.prices[token_address] = price
+            return
+        self.remove(token_address)
+        self.venues[venue_address.lower()] = {'kind': kind, 'token_address': token_address, 'decimals': decimals}
+        self.tokens[token_address.lower()] = venue_address.lower()
+        self.prices[token_address] = price
+        self.venues_changed.set()
+
+    def remove(self, token_address):
+        venue_address = self.tokens.pop(token_address.lower(), None)
+        if venue_address is not None:
+            venue = self.venues.pop(venue_address)
+            self.prices.pop(venue['token_address'], None)
+            self.venues_changed.set()
+
+    def follows(self, token_address):
+        return token_address.lower() in self.tokens
+
+    def log_filter(self, from_block=None, to_block=None):
+        log_filter = {'address': list(self.venues), 'topics': [[SYNC_TOPIC, SWAP_TOPIC]]}
+        if from_block is not None:
+            log_filter.update(fromBlock=hex(from_block), toBlock=hex(to_block))
+        return log_filter
+
+    def fetch(self, web3, to_block):
+        """Return the raw logs of every followed venue from next_block to to_block, or None if the query failed."""
+        (logs,) = rpc_batch(web3, [('eth_getLogs', [self.log_filter(self.next_block, to_block)])])
+        return logs
+
+    def apply(self, logs):
+        """Update prices from raw JSON-RPC logs (in chain order) and return the tokens that changed."""
+        changed = {}
+        for log in logs:
+            if log.get('removed'):
+                continue
+            venue = self.venues.get(log['address'].lower())
+            if venue is None:
+                continue
+            topic = log['topics'][0]
+            if venue['kind'] == 'v2' and topic == SYNC_TOPIC:
+                reserves = (data_word(log['data'], 0), data_word(log['data'], 1))
+                price = v2_price_from_reserves(reserves, venue['token_address'], self.weth_address, venue['decimals'])
+                venue_selector.observe(log['address'], reserves=reserves)
+            elif venue['kind'] == 'v3' and topic == SWAP_TOPIC:
+                slot0 = (data_word(log['data'], 2), signed_data_word(log['data'], 4))
+                price = v3_price_from_slot0(slot0, venue['token_address'], self.weth_address, venue['decimals'])
+                # Keep the pool state used for quoting current as well
+                venue_selector.observe(log['address'], slot0=slot0, liquidity=data_word(log['data'], 3))
+            else:
+                continue
+            if price is not None:
+                changed[venue['token_address']] = price
+        self.prices.update(changed)
+        return changed
+
+    async def stream(self, url, on_prices):
+        """Follow the venues over a websocket logs subscription, calling on_prices(changed) for every event."""
+        while True:
+            try:
+                async with websockets.connect(url) as ws:
+                    await self.follow(ws, on_prices)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Price log subscription failed, reconnecting: {e}")
+            # Events may have been missed while disconnected
+            self.resync = True
+            await asyncio.sleep(PRICE_LOGS_RECONNECT_SECONDS)
+
+    async def follow(self, ws, on_prices):
+        request_ids = itertools.count(1)
+        subscribe_id = None
+        subscription = None
+        self.venues_changed.set()
+        receive = asyncio.ensure_future(ws.recv())
+        try:
+            while True:
+                changed = asyncio.ensure_future(self.venues_changed.wait())
+                done, _ = await asyncio.wait({receive, changed}, return_when=asyncio.FIRST_COMPLETED)
+                if changed in done:
+                    # Replace the subscription so it covers exactly the followed venues
+                    self.venues_changed.clear()
+                    if subscription is not None:
+                        await ws.send(json.dumps({'jsonrpc': '2.0', 'id': next(request_ids), 'method': 'eth_unsubscribe', 'params': [subscription]}))
+                        subscription = None
+                    subscribe_id = None
+                    if self.venues:
+                        subscribe_id = next(request_ids)
+                        await ws.send(json.dumps({'jsonrpc': '2.0', 'id': subscribe_id, 'method': 'eth_subscribe', 'params': ['logs', self.log_filter()]}))
+                else:
+                    changed.cancel()
+                if receive in done:
+                    message = json.loads(receive.result())
+                    receive = asyncio.ensure_future(ws.recv())
+                    if subscribe_id is not None and message.get('id') == subscribe_id:
+                        subscription = message.get('result')
+                    elif message.get('method') == 'eth_subscription' and message['params']['subscription'] == subscription:
+                        prices = self.apply([message['params']['result']])
+                        if prices:
+                            on_prices(prices)
+        finally:
+            receive.cancel()
@@ -1,128 +1,110 @@
-import json
 from web3 import Web3
 from dotenv import load_dotenv
-import os
 import logging
+from pieces.multicall import multicall
+from pieces.contracts import contract, contract_registry, CHAINLINK_AGGREGATOR_ABI
+from pieces.rpc import web3
+from pieces.address_index import checksum
+from pieces.uniswap import venue_selector
+from pieces.cache import eth_price_cache, token_metadata_cache, total_supply_cache
 
 # Load environment variables
 load_dotenv()
 
-# Initialize web3
-INFURA_URL = os.getenv('INFURA_URL')
-web3 = Web3(Web3.HTTPProvider(INFURA_URL))
-
 # Define addresses
 WETH_ADDRESS = '0xC02aaA39b223FE8D0A0E5C4F27eAD9083C756Cc2'
 UNISWAP_V2_FACTORY_ADDRESS = '0x5C69bEe701ef814a2B6a3EDD4B1652CB9cc5aA6f'
 UNISWAP_V3_FACTORY_ADDRESS = '0x1F98431c8aD98523631AE4a59f267346ea31F984'  # Uniswap V3 Factory Address
 CHAINLINK_ETH_USD_FEED = '0x5f4ec3df9cbd43714fe2740f5e3616155c5b8419'
 
-# Load ABIs
-with open('abis/IUniswapV2Factory.json') as file:
-    uniswap_v2_factory_abi = json.load(file)["abi"]
-with open('abis/IUniswapV2Pair.json') as file:
-    uniswap_v2_pair_abi = json.load(file)["abi"]
-with open('abis/IUniswapV2ERC20.json') as file:
-    uniswap_v2_erc20_abi = json.load(file)["abi"]
-with open('abis/IUniswapV3Factory.json') as file:
-    uniswap_v3_factory_abi = json.load(file)
-with open('abis/IUniswapV3Pool.json') as file:
-    uniswap_v3_pool_abi = json.load(file)
-
-chainlink_price_feed_abi = json.loads('[{"inputs":[],"name":"latestRoundData","outputs":[{"internalType":"uint80","name":"roundId","type":"uint80"},{"internalType":"int256","name":"answer","type":"int256"},{"internalType":"uint256","name":"startedAt","type":"uint256"},{"internalType":"uint256","name":"updatedAt","type":"uint256"},{"internalType":"uint80","name":"answeredInRound","type":"uint80"}],"stateMutability":"view","type":"function"}]')
-
-# Create contract instances
-uniswap_v2_factory = web3.eth.contract(address=Web3.to_checksum_address(UNISWAP_V2_FACTORY_ADDRESS), abi=uniswap_v2_factory_abi)
-uniswap_v3_factory = web3.eth.contract(address=Web3.to_checksum_address(UNISWAP_V3_FACTORY_ADDRESS), abi=uniswap_v3_factory_abi)
-chainlink_price_feed = web3.eth.contract(address=Web3.to_checksum_address(CHAINLINK_ETH_USD_FEED), abi=chainlink_price_feed_abi)
+# Contract instances, from the shared compiled ABI fragments
+contract_registry.register('ChainlinkAggregator', CHAINLINK_AGGREGATOR_ABI)
+uniswap_v2_factory = contract(web3, 'IUniswapV2Factory', Web3.to_checksum_address(UNISWAP_V2_FACTORY_ADDRESS))
+uniswap_v3_factory = contract(web3, 'IUniswapV3Factory', Web3.to_checksum_address(UNISWAP_V3_FACTORY_ADDRESS))
+chainlink_price_feed = contract(web3, 'ChainlinkAggregator', Web3.to_checksum_address(CHAINLINK_ETH_USD_FEED))
 
-def get_eth_price_in_usd():
+def fetch_eth_price_in_usd():
     latest_round_data = chainlink_price_feed.functions.latestRoundData().call()
     eth_price_in_usd = latest_round_data[1] / 1e8  # Chainlink prices have 8 decimals
     logging.info(f"ETH price in USD: {eth_price_in_usd}")
+    eth_price_cache.set(eth_price_in_usd)
     return eth_price_in_usd
 
-def get_token_details(token_address):
-    token_contract = web3.eth.contract(address=Web3.to_checksum_address(token_address), abi=uniswap_v2_erc20_abi)
-    name = token_contract.functions.name().call()
-    symbol = token_contract.functions.symbol().call()
-    decimals = token_contract.functions.decimals().call()
-    total_supply = token_contract.functions.totalSupply().call() / (10 ** decimals)
-    logging.info(f"Token details - Name: {name}, Symbol: {symbol}, Decimals: {decimals}, Total Supply: {total_supply}")
-    return name, symbol, decimals, total_supply
-
-def get_uniswap_v2_price(token_address, token_decimals):
-    pair_address = uniswap_v2_factory.functions.getPair(Web3.to_checksum_address(token_address), Web3.to_checksum_address(WETH_ADDRESS)).call()
-    
-    if pair_address == '0x0000000000000000000000000000000000000000':
-        logging.info("No pair address found on Uniswap V2.")
-        return None, None
-
-    logging.info(f"Pair address found: {pair_address}")
-    pair_contract = web3.eth.contract(address=Web3.to_checksum_address(pair_address), abi=uniswap_v2_pair_abi)
-    reserves = pair_contract.functions.getReserves().call()
-    
-    reserve0, reserve1 = reserves[0], reserves[1]
-    token0 = pair_contract.functions.token0().call()
-
-    if Web3.to_checksum_address(token_address) == Web3.to_checksum_address(token0):
-        reserve_token = reserve0
-        reserve_weth = reserve1
-    else:
-        reserve_token = reserve1
-        reserve_weth = reserve0
-
-    adjusted_reserve_token = reserve_token / (10 ** token_decimals)
-    adjusted_reserve_weth = reserve_weth / (10 ** 18)
-
-    logging.info(f"Reserves - Token: {adjusted_reserve_token}, WETH: {adjusted_reserve_weth}")
-
-    if adjusted_reserve_token == 0:
-        logging.error("Adjusted reserve token is zero, cannot calculate token price.")
-        return None, None
-
-    token_price = adjusted_reserve_weth / adjusted_reserve_token
-    logging.info(f"Token price on Uniswap V2: {token_price} ETH")
-    return token_price, pair_address
-
-def get_uniswap_v3_price(token_address, token_decimals):
-    fee_tiers = [500, 3000, 10000]
-    
-    for fee in fee_tiers:
-        try:
-            # Fetch pool address from Uniswap V3 Factory contract
-            pool_address = uniswap_v3_factory.functions.getPool(Web3.to_checksum_address(token_address), Web3.to_checksum_address(WETH_ADDRESS), fee).call()
-            
-            if pool_address != '0x0000000000000000000000000000000000000000':
-                pool_contract = web3.eth.contract(address=Web3.to_checksum_address(pool_address), abi=uniswap_v3_pool_abi)
-                slot0 = pool_contract.functions.slot0().call()
-                sqrtPriceX96 = slot0[0]
-                token_price = (sqrtPriceX96 ** 2 / (2 ** 192)) * (10 ** token_decimals) / (10 ** 18)
-                logging.info(f"Token price on Uniswap V3 (fee tier {fee}): {token_price} ETH")
-                return token_price, pool_address
-        except Exception as e:
-            logging.error(f"Error fetching Uniswap V3 price for fee tier {fee}: {e}")
-    
-    logging.info("No pool address found on Uniswap V3.")
-    return None, None
+def get_token_snapshot(token_address):
+    """
+    Gathers everything the buy decision needs (ETH/USD, token metadata, total supply,
+    pair/pool and price) in a single batched round trip, skipping cached values.
+    """
+    token = checksum(token_address)
+    weth = checksum(WETH_ADDRESS)
+    token_contract = contract(web3, 'IUniswapV2ERC20', token)
+
+    # Only read what is not already cached: on a warm path that is just the venue reads
+    eth_price_in_usd = eth_price_cache.get()
+    metadata = token_metadata_cache.get(token.lower())
+    total_supply = total_supply_cache.get(token.lower())
+
+    # Pair/pool addresses are derived locally, so the venue reads can go in the same batch
+    planned_decimals = metadata[2] if metadata is not None else 18
+    venue_calls, finish_venues = venue_selector.plan(web3, uniswap_v2_factory, uniswap_v3_factory, {token_address: planned_decimals}, weth)
+
+    calls = []
+    if eth_price_in_usd is None:
+        calls.append(('latest_round_data', chainlink_price_feed.functions.latestRoundData()))
+    if metadata is None:
+        calls.append(('name', token_contract.functions.name()))
+        calls.append(('symbol', token_contract.functions.symbol()))
+        calls.append(('decimals', token_contract.functions.decimals()))
+    if total_supply is None:
+        calls.append(('total_supply', token_contract.functions.totalSupply()))
+
+    batch_results = multicall(web3, [call for _, call in calls] + venue_calls)
+    results = dict(zip([key for key, _ in calls], batch_results))
+    venue_results = batch_results[len(calls):]
 
-def calculate_market_cap(token_address):
-    eth_price_in_usd = get_eth_price_in_usd()
     if eth_price_in_usd is None:
-        logging.info("Cannot calculate market cap without ETH price.")
-        return None
+        if results['latest_round_data'] is None:
+            logging.info("Could not read ETH price.")
+            return None
+        eth_price_in_usd = results['latest_round_data'][1] / 1e8  # Chainlink prices have 8 decimals
+        eth_price_cache.set(eth_price_in_usd)
+    if metadata is None:
+        if results['decimals'] is None:
+            logging.info("Could not read token details.")
+            return None
+        metadata = [results['name'], results['symbol'], results['decimals']]
+        token_metadata_cache.set(token.lower(), metadata)
+    name, symbol, decimals = metadata
+    if total_supply is None:
+        if results['total_supply'] is None:
+            logging.info("Could not read token total supply.")
+            return None
+        total_supply = results['total_supply'] / (10 ** decimals)
+        total_supply_cache.set(token.lower(), total_supply)
 
-    name, symbol, decimals, total_supply = get_token_details(token_address)
-    token_price, pair_address = get_uniswap_v2_price(token_address, decimals)
-    
-    if token_price is None:
-        token_price, pair_address = get_uniswap_v3_price(token_address, decimals)
+    logging.info(f"ETH price in USD: {eth_price_in_usd}")
+    logging.info(f"Token details - Name: {name}, Symbol: {symbol}, Decimals: {decimals}, Total Supply: {total_supply}")
 
+    # Price from the deepest V2/V3 venue; prices scale with 10 ** decimals, so correct a guess made before they were known
+    token_price, pair_address, kind = finish_venues(venue_results)[token_address]
+    if token_price is not None:
+        token_price = token_price * 10 ** (decimals - planned_decimals)
+        logging.info(f"Token price on Uniswap {kind.upper()} ({pair_address}): {token_price} ETH")
+
+    snapshot = {
+        'name': name,
+        'symbol': symbol,
+        'decimals': decimals,
+        'total_supply': total_supply,
+        'eth_price_in_usd': eth_price_in_usd,
+        'token_price': token_price,
+        'pair_address': pair_address,
+        'market_cap_usd': None,
+    }
     if token_price is not None:
         market_cap_eth = total_supply * token_price
-        market_cap_usd = market_cap_eth * eth_price_in_usd
-        logging.info(f"Market Cap for {name} ({symbol}) - ETH: {market_cap_eth}, USD: {market_cap_usd}")
-        return market_cap_usd
+        snapshot['market_cap_usd'] = market_cap_eth * eth_price_in_usd
+        logging.info(f"Market Cap for {name} ({symbol}) - ETH: {market_cap_eth}, USD: {snapshot['market_cap_usd']}")
     else:
         logging.info("Token price not available on Uniswap V2 or V3.")
-        return None
+    return snapshot
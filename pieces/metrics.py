@@ -0,0 +1,171 @@
+import os
+import time
+import asyncio
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+EVENT_LOOP_LAG_INTERVAL_SECONDS = float(os.getenv('EVENT_LOOP_LAG_INTERVAL_SECONDS', 0.5))  # How often the event loop lag probe runs
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# The position an RPC request is made for; unset for shared work such as price engine refreshes
+current_position = contextvars.ContextVar('current_position', default=None)
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values)) + '}'
+
+class Histogram:
+    """Prometheus histogram with fixed buckets; one observe() is a bisect and a few additions under a lock."""
+
+    def __init__(self, name, description, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {}  # label values -> [bucket counts, sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def exposition(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self.series.items()}
+        for label_values, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{format_labels(self.label_names + ("le",), label_values + (le,))} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.label_names, label_values)} {total}')
+            lines.append(f'{self.name}_count{format_labels(self.label_names, label_values)} {count}')
+        return lines
+
+class Counter:
+    def __init__(self, name, description, label_names=()):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def exposition(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        with self.lock:
+            values = dict(self.values)
+        lines.extend(f'{self.name}{format_labels(self.label_names, labels)} {value}' for labels, value in sorted(values.items()))
+        return lines
+
+class Gauge:
+    """Gauge read from a callable when metrics are scraped, so the hot path never updates it."""
+
+    def __init__(self, name, description, read):
+        self.name = name
+        self.description = description
+        self.read = read
+
+    def exposition(self):
+        try:
+            value = self.read()
+        except Exception:
+            return []
+        return [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} gauge', f'{self.name} {value}']
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name, description, read):
+        return self.register(Gauge(name, description, read))
+
+    def exposition(self):
+        """All metrics in the Prometheus text format."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.exposition())
+        return '\n'.join(lines) + '\n'
+
+# Shared registry and the metrics recorded on the hot path
+registry = MetricsRegistry()
+stage_seconds = registry.register(Histogram('mtdb_stage_seconds', 'Time spent in each stage of handling a webhook, a trade or a price update.', ('stage',)))
+rpc_call_seconds = registry.register(Histogram('mtdb_rpc_call_seconds', 'Duration of blocking web3 helpers run on the RPC thread pool.', ('call',)))
+rpc_request_seconds = registry.register(Histogram('mtdb_rpc_request_seconds', 'Duration of JSON-RPC requests by method, batches included.', ('method',)))
+rpc_requests_total = registry.register(Counter('mtdb_rpc_requests_total', 'JSON-RPC requests sent, by method and by whether they were made for one position or shared.', ('method', 'scope')))
+rpc_errors_total = registry.register(Counter('mtdb_rpc_errors_total', 'Blocking web3 helpers that raised, by call.', ('call',)))
+event_loop_lag_seconds = registry.register(Histogram('mtdb_event_loop_lag_seconds', 'How late the event loop ran a timer scheduled by the lag probe.'))
+
+position_rpc_requests = {}  # position id -> JSON-RPC requests made for it
+position_rpc_lock = threading.Lock()
+last_event_loop_lag = 0.0
+
+@contextmanager
+def timed(stage):
+    """Time the enclosed block into mtdb_stage_seconds under `stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage)
+
+def record_rpc_request(method, elapsed):
+    position_id = current_position.get()
+    rpc_request_seconds.observe(elapsed, method)
+    rpc_requests_total.inc(method, 'shared' if position_id is None else 'position')
+    if position_id is not None:
+        with position_rpc_lock:
+            position_rpc_requests[position_id] = position_rpc_requests.get(position_id, 0) + 1
+
+def attribute_to_position(position_id):
+    """Count the JSON-RPC requests made from the current context (and the RPC helpers it runs) for this position."""
+    with position_rpc_lock:
+        position_rpc_requests.setdefault(position_id, 0)
+    current_position.set(position_id)
+
+def forget_position(position_id):
+    with position_rpc_lock:
+        position_rpc_requests.pop(position_id, None)
+
+def rpc_requests_per_position():
+    """Average JSON-RPC requests made so far by each monitored position."""
+    with position_rpc_lock:
+        return sum(position_rpc_requests.values()) / len(position_rpc_requests) if position_rpc_requests else 0.0
+
+async def probe_event_loop_lag(interval=EVENT_LOOP_LAG_INTERVAL_SECONDS):
+    """Sleep for `interval` in a loop and record how much later than asked the loop woke us up."""
+    global last_event_loop_lag
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        last_event_loop_lag = max(0.0, loop.time() - start - interval)
+        event_loop_lag_seconds.observe(last_event_loop_lag)
+
+registry.gauge('mtdb_event_loop_lag_last_seconds', 'Lag measured by the most recent event loop probe.', lambda: last_event_loop_lag)
+registry.gauge('mtdb_rpc_requests_per_open_position', 'Average JSON-RPC requests made so far by each open position, shared price refreshes excluded.', rpc_requests_per_position)
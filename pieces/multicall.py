@@ -0,0 +1,77 @@
+import os
+import json
+import time
+import logging
+from dotenv import load_dotenv
+from pieces.rpc import WRITE_METHODS
+from pieces.metrics import record_rpc_request
+
+# Load environment variables
+load_dotenv()
+
+MULTICALL3_ADDRESS = '0xcA11bde05977b3631167028862bE2a173976CA11'  # Same address on every major EVM chain
+AGGREGATE3_SELECTOR = '0x82ad56cb'  # aggregate3((address,bool,bytes)[])
+MULTICALL_MODE = os.getenv('MULTICALL_MODE', 'multicall')  # 'multicall' (Multicall3 contract) or 'batch' (JSON-RPC batch)
+
+def multicall(web3, calls, block_identifier='latest'):
+    """
+    Executes a list of contract function calls (e.g. `contract.functions.getReserves()`)
+    in a single round trip and returns their decoded results in the same order.
+    Calls that revert or cannot be decoded return None.
+    """
+    if not calls:
+        return []
+
+    if MULTICALL_MODE == 'multicall':
+        try:
+            return multicall3(web3, calls, block_identifier)
+        except Exception as e:
+            logging.error(f"Multicall3 aggregate failed, falling back to JSON-RPC batch: {e}")
+
+    return batch_eth_call(web3, calls, block_identifier)
+
+def multicall3(web3, calls, block_identifier='latest'):
+    encoded_calls = [(call.address, True, bytes.fromhex(call._encode_transaction_data()[2:])) for call in calls]
+    data = AGGREGATE3_SELECTOR + web3.codec.encode(['(address,bool,bytes)[]'], [encoded_calls]).hex()
+    raw_result = web3.eth.call({'to': MULTICALL3_ADDRESS, 'data': data}, block_identifier)
+    (results,) = web3.codec.decode(['(bool,bytes)[]'], raw_result)
+    return [decode_result(web3, call, return_data) if success else None for call, (success, return_data) in zip(calls, results)]
+
+def batch_eth_call(web3, calls, block_identifier='latest'):
+    if isinstance(block_identifier, int):
+        block_identifier = hex(block_identifier)
+    payloads = [('eth_call', [{'to': call.address, 'data': call._encode_transaction_data()}, block_identifier]) for call in calls]
+    results = rpc_batch(web3, payloads)
+    return [decode_result(web3, call, bytes.fromhex(result[2:])) if result else None for call, result in zip(calls, results)]
+
+def rpc_batch(web3, payloads):
+    """
+    Sends a list of (method, params) pairs as one JSON-RPC batch request and returns
+    the results in the same order. Failed entries return None.
+    """
+    if not payloads:
+        return []
+
+    batch = [{'jsonrpc': '2.0', 'id': i, 'method': method, 'params': params} for i, (method, params) in enumerate(payloads)]
+    # Sent through the provider's endpoint pool, so batches get the same failover and hedging
+    start = time.perf_counter()
+    try:
+        raw_response = web3.provider.pool.post(json.dumps(batch), write=any(method in WRITE_METHODS for method, _ in payloads))
+    finally:
+        record_rpc_request(f'batch:{payloads[0][0]}', time.perf_counter() - start)
+
+    results = [None] * len(payloads)
+    for item in json.loads(raw_response):
+        if 'error' in item:
+            logging.error(f"JSON-RPC batch entry {item.get('id')} failed: {item['error']}")
+            continue
+        results[item['id']] = item.get('result')
+    return results
+
+def decode_result(web3, call, return_data):
+    # Output types are compiled once per function by the contract registry
+    try:
+        return call.decode(return_data)
+    except Exception as e:
+        logging.error(f"Could not decode result of {call.fn_name} on {call.address}: {e}")
+        return None
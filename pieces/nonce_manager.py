@@ -0,0 +1,37 @@
+import logging
+import itertools
+import threading
+
+class NonceManager:
+    """
+    Hands out transaction nonces for one account from an in-process counter, so
+    concurrent buys and sells never race on getTransactionCount. The counter is
+    synced from the node once, and again whenever a send fails.
+    """
+
+    def __init__(self, web3, get_address):
+        self.web3 = web3
+        self.get_address = get_address  # Called when syncing, so the account is only needed once a transaction is sent
+        self.counter = None
+        self.sync_lock = threading.Lock()
+
+    def reserve(self):
+        """Return the next unused nonce."""
+        counter = self.counter
+        if counter is None:
+            counter = self.sync()
+        # next() on itertools.count is atomic under the GIL, so reservations need no lock
+        return next(counter)
+
+    def sync(self):
+        with self.sync_lock:
+            address = self.get_address()
+            nonce = self.web3.eth.get_transaction_count(address, 'pending')
+            self.counter = itertools.count(nonce)
+            logging.info(f"Nonce manager synced for {address}: next nonce {nonce}")
+            return self.counter
+
+    def resync(self, nonce, error):
+        """Call when sending the transaction with `nonce` failed, so later nonces do not leave a gap."""
+        logging.error(f"Transaction with nonce {nonce} failed to send, resyncing nonces: {error}")
+        self.counter = None
@@ -0,0 +1,253 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from decimal import Decimal
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+POSITION_STORE_PATH = os.getenv('POSITION_STORE_PATH', 'data/positions.sqlite')
+
+# Position states kept in the store; only open positions are monitored again after a restart
+POSITION_OPEN = 'open'
+POSITION_SELLING = 'selling'  # Its sale is about to be or has been broadcast; never sold again automatically
+POSITION_MOONBAG = 'moonbag'
+POSITION_CLOSED = 'closed'
+POSITION_CANCELLED = 'cancelled'
+
+WINDOW_FIELDS = ('window_start', 'window_first', 'window_low', 'window_high', 'window_count')
+TRADE_FIELDS = ('timestamp', 'position_id', 'side', 'token_address', 'venue', 'token_amount', 'eth_amount', 'price', 'profit_or_loss', 'reason', 'from_name', 'tx_hash')
+
+# Token amounts are integer base units stored as TEXT, since a uint256 does not fit an SQLite INTEGER
+POSITIONS_TABLE = (
+    'CREATE TABLE IF NOT EXISTS positions (position_id TEXT PRIMARY KEY, status TEXT, token_address TEXT, '
+    'details TEXT, rules TEXT, window_start REAL, window_first REAL, window_low REAL, window_high REAL, '
+    'window_count INTEGER, token_amount_left TEXT, sell_tx_hash TEXT, opened_at REAL, closed_at REAL)'
+)
+TRADES_TABLE = (
+    'CREATE TABLE IF NOT EXISTS trades (timestamp REAL, position_id TEXT, side TEXT, token_address TEXT, venue TEXT, '
+    'token_amount TEXT, eth_amount REAL, price REAL, profit_or_loss REAL, reason TEXT, from_name TEXT, tx_hash TEXT)'
+)
+
+def to_base_units(token_amount, token_decimals):
+    """A token amount stored in whole tokens by earlier versions, as integer base units."""
+    if token_amount is None:
+        return None
+    return int(Decimal(repr(token_amount)).scaleb(token_decimals).to_integral_value())
+
+def stored_amount(token_amount):
+    return str(int(token_amount)) if token_amount is not None else None
+
+def loaded_amount(token_amount):
+    return int(token_amount) if token_amount is not None else None
+
+class PositionStore:
+    """
+    Open positions in SQLite, so they survive a restart. The database runs in WAL mode
+    and each change is one small transaction: a row when a position is bought, its
+    no-change window when it rolls over, and its final state when it is sold. The
+    same database holds the trade ledger, one row per buy and sell, and the market
+    cap of every token considered for a buy, which the replay engine filters on.
+    """
+
+    def __init__(self, path=POSITION_STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            # WAL with synchronous=NORMAL survives process crashes without an fsync per write
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.migrate_token_amounts()
+            self.connection.execute(POSITIONS_TABLE)
+            self.connection.execute('CREATE INDEX IF NOT EXISTS positions_status ON positions (status)')
+            self.connection.execute(TRADES_TABLE)
+            self.connection.execute('CREATE INDEX IF NOT EXISTS trades_position ON trades (position_id)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS token_snapshots (timestamp REAL, token_address TEXT, market_cap_usd REAL, price REAL)')
+        return self.connection
+
+    def migrate_token_amounts(self):
+        """
+        Stores written before token amounts were kept in base units hold them as REAL whole
+        tokens. Their positions and trades tables are rebuilt with the amounts in base units,
+        using the decimals recorded in each position's details.
+        """
+        connection = self.connection
+        columns = {row[1]: row[2] for row in connection.execute('PRAGMA table_info(positions)')}
+        if columns.get('token_amount_left') != 'REAL':
+            return
+        connection.execute('BEGIN')
+        decimals = {}
+        positions = []
+        for row in connection.execute('SELECT * FROM positions').fetchall():
+            details = json.loads(row[3])
+            decimals[row[0]] = details.get('token_decimals', 18)
+            details['token_amount'] = to_base_units(details['token_amount'], decimals[row[0]])
+            positions.append((*row[:3], json.dumps(details), *row[4:10], stored_amount(to_base_units(row[10], decimals[row[0]])), *row[11:]))
+        trades = [
+            (*row[:5], stored_amount(to_base_units(row[5], decimals.get(row[1], 18))), *row[6:])
+            for row in connection.execute('SELECT * FROM trades').fetchall()
+        ]
+        connection.execute('DROP TABLE positions')
+        connection.execute('DROP TABLE trades')
+        connection.execute(POSITIONS_TABLE)
+        connection.execute(TRADES_TABLE)
+        connection.executemany(f'INSERT INTO positions VALUES ({", ".join("?" * 14)})', positions)
+        connection.executemany(f'INSERT INTO trades VALUES ({", ".join("?" * len(TRADE_FIELDS))})', trades)
+        connection.commit()
+        logging.info(f"Converted the token amounts of {len(positions)} positions and {len(trades)} trades in {self.path} to base units.")
+
+    def open(self, position_id, details, rules, window):
+        """
+        Record a bought position. `details` are the transaction details its monitor
+        needs, `rules` its exit rule parameters and `window` its no-change window state.
+        """
+        with self.lock:
+            connection = self.connect()
+            connection.execute(
+                'INSERT OR REPLACE INTO positions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL, ?, NULL)',
+                (position_id, POSITION_OPEN, details['token_address'], json.dumps(details), json.dumps(rules),
+                 *(window[field] for field in WINDOW_FIELDS), stored_amount(details['token_amount']), time.time()),
+            )
+            connection.commit()
+
+    def save_windows(self, windows):
+        """Persist the no-change windows of positions that rolled over, as a dict of position_id to window state."""
+        if not windows:
+            return
+        with self.lock:
+            connection = self.connect()
+            connection.executemany(
+                'UPDATE positions SET window_start = ?, window_first = ?, window_low = ?, window_high = ?, window_count = ? WHERE position_id = ?',
+                [(*(window[field] for field in WINDOW_FIELDS), position_id) for position_id, window in windows.items()],
+            )
+            connection.commit()
+
+    def save_rules(self, rules):
+        """Persist changed exit rules of open positions, as a dict of position_id to rules."""
+        if not rules:
+            return
+        with self.lock:
+            connection = self.connect()
+            connection.executemany(
+                'UPDATE positions SET rules = ? WHERE position_id = ? AND status = ?',
+                [(json.dumps(position_rules), position_id, POSITION_OPEN) for position_id, position_rules in rules.items()],
+            )
+            connection.commit()
+
+    def set_token_amount(self, position_id, details):
+        """Persist a position's corrected token amount, taken from `details`, in the position and its buy trade."""
+        token_amount = stored_amount(details['token_amount'])
+        with self.lock:
+            connection = self.connect()
+            connection.execute(
+                'UPDATE positions SET details = ?, token_amount_left = ? WHERE position_id = ? AND status = ?',
+                (json.dumps(details), token_amount, position_id, POSITION_OPEN),
+            )
+            connection.execute("UPDATE trades SET token_amount = ? WHERE position_id = ? AND side = 'buy'", (token_amount, position_id))
+            connection.commit()
+
+    def mark_selling(self, position_id):
+        """Record that a position's sale is starting, before it is broadcast."""
+        with self.lock:
+            connection = self.connect()
+            connection.execute('UPDATE positions SET status = ? WHERE position_id = ?', (POSITION_SELLING, position_id))
+            connection.commit()
+
+    def load(self, position_id):
+        """A position's (status, rules, window), or None if it was never recorded."""
+        with self.lock:
+            connection = self.connect()
+            row = connection.execute(
+                'SELECT status, rules, window_start, window_first, window_low, window_high, window_count FROM positions WHERE position_id = ?',
+                (position_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), dict(zip(WINDOW_FIELDS, row[2:]))
+
+    def close(self, position_id, status=POSITION_CLOSED, token_amount_left=0, sell_tx_hash=None):
+        """Mark a position as no longer monitored; a moonbag keeps the base units left in the wallet."""
+        if token_amount_left and status == POSITION_CLOSED:
+            status = POSITION_MOONBAG
+        with self.lock:
+            connection = self.connect()
+            connection.execute(
+                'UPDATE positions SET status = ?, token_amount_left = ?, sell_tx_hash = ?, closed_at = ? WHERE position_id = ?',
+                (status, stored_amount(token_amount_left), sell_tx_hash, time.time(), position_id),
+            )
+            connection.commit()
+
+    def load_open(self):
+        """Every open position as (position_id, details, rules, window), oldest first, in one query."""
+        with self.lock:
+            connection = self.connect()
+            rows = connection.execute(
+                'SELECT position_id, details, rules, window_start, window_first, window_low, window_high, window_count '
+                'FROM positions WHERE status = ? ORDER BY opened_at', (POSITION_OPEN,)
+            ).fetchall()
+        positions = [(row[0], json.loads(row[1]), json.loads(row[2]), dict(zip(WINDOW_FIELDS, row[3:]))) for row in rows]
+        logging.info(f"Loaded {len(positions)} open positions from {self.path}")
+        return positions
+
+    def moonbags(self):
+        with self.lock:
+            connection = self.connect()
+            rows = connection.execute(
+                'SELECT position_id, token_address, token_amount_left, sell_tx_hash, closed_at FROM positions WHERE status = ?', (POSITION_MOONBAG,)
+            ).fetchall()
+        return [
+            {'id': position_id, 'token_address': token_address, 'token_amount': loaded_amount(token_amount_left), 'sell_tx_hash': sell_tx_hash, 'sold_at': closed_at}
+            for position_id, token_address, token_amount_left, sell_tx_hash, closed_at in rows
+        ]
+
+    def record_trade(self, **trade):
+        """Append a buy or sell to the trade ledger; keyword arguments are the TRADE_FIELDS, missing ones are NULL."""
+        trade.setdefault('timestamp', time.time())
+        trade['token_amount'] = stored_amount(trade.get('token_amount'))
+        with self.lock:
+            connection = self.connect()
+            connection.execute(f'INSERT INTO trades VALUES ({", ".join("?" * len(TRADE_FIELDS))})', [trade.get(field) for field in TRADE_FIELDS])
+            connection.commit()
+
+    def trades(self, since=0.0, from_name=None):
+        """Ledger rows since an epoch timestamp, optionally of one copied wallet, oldest first."""
+        query = f'SELECT {", ".join(TRADE_FIELDS)} FROM trades WHERE timestamp >= ?'
+        params = [since]
+        if from_name is not None:
+            query += ' AND from_name = ?'
+            params.append(from_name)
+        with self.lock:
+            rows = self.connect().execute(query + ' ORDER BY timestamp', params).fetchall()
+        trades = [dict(zip(TRADE_FIELDS, row)) for row in rows]
+        for trade in trades:
+            trade['token_amount'] = loaded_amount(trade['token_amount'])
+        return trades
+
+    def record_snapshot(self, token_address, market_cap_usd, price):
+        with self.lock:
+            connection = self.connect()
+            connection.execute('INSERT INTO token_snapshots VALUES (?, ?, ?, ?)', (time.time(), token_address.lower(), market_cap_usd, price))
+            connection.commit()
+
+    def snapshots(self):
+        """Every recorded market cap as a dict of lowercase token address to a list of (timestamp, market_cap_usd, price)."""
+        with self.lock:
+            rows = self.connect().execute('SELECT token_address, timestamp, market_cap_usd, price FROM token_snapshots ORDER BY timestamp').fetchall()
+        snapshots = {}
+        for token_address, *snapshot in rows:
+            snapshots.setdefault(token_address, []).append(tuple(snapshot))
+        return snapshots
+
+# Shared store of the server's positions
+position_store = PositionStore()
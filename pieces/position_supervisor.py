@@ -0,0 +1,101 @@
+import os
+import asyncio
+import logging
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+POSITION_MAX_RESTARTS = int(os.getenv('POSITION_MAX_RESTARTS', 5))  # Restarts allowed before a crashed monitor is given up
+POSITION_RESTART_DELAY_SECONDS = float(os.getenv('POSITION_RESTART_DELAY_SECONDS', 1))  # Base delay, doubled after each crash
+POSITION_DRAIN_SECONDS = float(os.getenv('POSITION_DRAIN_SECONDS', 30))  # How long shutdown waits for open positions
+
+class PositionSupervisor:
+    """
+    Registry of position monitor tasks running on the server's event loop. Crashed
+    monitors are restarted with backoff, and shutdown drains them before cancelling.
+    """
+
+    def __init__(self, max_restarts=POSITION_MAX_RESTARTS, restart_delay=POSITION_RESTART_DELAY_SECONDS):
+        self.max_restarts = max_restarts
+        self.restart_delay = restart_delay
+        self.positions = {}  # position_id -> dict with task, details, status, restarts, started_at
+        self.accepting = True
+
+    def start(self, position_id, monitor_factory, details):
+        """Start supervising `monitor_factory()`, a callable that returns the monitoring coroutine."""
+        if not self.accepting:
+            raise RuntimeError("Supervisor is shutting down, not accepting new positions.")
+        if position_id in self.positions and not self.positions[position_id]['task'].done():
+            raise ValueError(f"Position {position_id} is already being monitored.")
+        position = {
+            'details': details,
+            'status': 'running',
+            'restarts': 0,
+            'started_at': datetime.now(timezone.utc),
+            'last_error': None,
+        }
+        self.positions[position_id] = position
+        position['task'] = asyncio.create_task(self.supervise(position_id, position, monitor_factory))
+        return position['task']
+
+    async def supervise(self, position_id, position, monitor_factory):
+        try:
+            while True:
+                try:
+                    await monitor_factory()
+                    position['status'] = 'closed'
+                    return
+                except asyncio.CancelledError:
+                    position['status'] = 'cancelled'
+                    raise
+                except Exception as e:
+                    position['last_error'] = repr(e)
+                    if position['restarts'] >= self.max_restarts:
+                        position['status'] = 'failed'
+                        logging.error(f"Monitoring {position_id} — Monitor crashed {position['restarts'] + 1} times, giving up: {e}")
+                        return
+                    delay = self.restart_delay * (2 ** position['restarts'])
+                    position['restarts'] += 1
+                    position['status'] = 'restarting'
+                    logging.error(f"Monitoring {position_id} — Monitor crashed, restarting in {delay:.1f}s: {e}")
+                    await asyncio.sleep(delay)
+                    position['status'] = 'running'
+        finally:
+            if self.positions.get(position_id) is position:
+                del self.positions[position_id]
+
+    def cancel(self, position_id):
+        position = self.positions.get(position_id)
+        if position is None:
+            return False
+        position['task'].cancel()
+        return True
+
+    def open_positions(self):
+        return [
+            {
+                'id': position_id,
+                'status': position['status'],
+                'restarts': position['restarts'],
+                'started_at': position['started_at'].isoformat(),
+                'last_error': position['last_error'],
+                **position['details'],
+            }
+            for position_id, position in self.positions.items()
+        ]
+
+    async def shutdown(self, drain_seconds=POSITION_DRAIN_SECONDS):
+        """Stop accepting positions, give open ones `drain_seconds` to close, then cancel the rest."""
+        self.accepting = False
+        tasks = [position['task'] for position in self.positions.values()]
+        if not tasks:
+            return
+        logging.info(f"Draining {len(tasks)} open positions for up to {drain_seconds}s.")
+        _, pending = await asyncio.wait(tasks, timeout=drain_seconds)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logging.info(f"Cancelled {len(pending)} positions that were still open at shutdown.")
+            await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,196 @@
+import numpy as np
+
+POSITION_DTYPE = np.dtype([
+    ('active', '?'),
+    ('token_id', 'i4'),
+    ('initial_price', 'f8'),
+    ('increase_threshold', 'f8'),
+    ('decrease_threshold', 'f8'),
+    ('moonbag', 'f8'),
+    ('no_change_enabled', '?'),
+    ('no_change_threshold', 'f8'),
+    ('window_length', 'f8'),  # Seconds
+    ('window_start', 'f8'),  # Epoch seconds
+    ('window_first', 'f8'),
+    ('window_low', 'f8'),
+    ('window_high', 'f8'),
+    ('window_count', 'i8'),
+])
+
+# Moonbags are split off in millionths of a position, so the amounts sold and kept are whole base units
+MOONBAG_PRECISION = 10 ** 6
+
+# Exit reasons returned by PositionTable.evaluate
+EXIT_PRICE_INCREASE = 'increase'
+EXIT_PRICE_DECREASE = 'decrease'
+EXIT_NO_CHANGE = 'no_change'
+
+def amount_to_sell(token_amount, moonbag):
+    """The part of `token_amount` base units sold on a take-profit; the rest, never more than was held, is kept as the moonbag."""
+    return token_amount - token_amount * round(moonbag * MOONBAG_PRECISION) // MOONBAG_PRECISION
+
+class PositionTable:
+    """
+    Open positions stored as rows of a NumPy structured array, so the take-profit,
+    stop-loss/moonbag and no-change rules of every position are evaluated in one
+    vectorized pass per price update. Token amounts are integer base units, which can
+    exceed 64 bits, so they are kept as Python ints beside the array.
+    """
+
+    def __init__(self, capacity=1024):
+        self.rows = np.zeros(capacity, dtype=POSITION_DTYPE)
+        self.free_rows = list(range(capacity - 1, -1, -1))
+        self.row_by_position = {}  # position_id -> row index
+        self.position_by_row = {}  # row index -> position_id
+        self.token_amounts = {}  # position_id -> token amount in base units
+        self.token_ids = {}  # lowercase token address -> token id
+        self.token_addresses = []  # token id -> token address
+        self.rolled = []  # Positions whose no-change window rolled over in the last evaluate()
+
+    def __len__(self):
+        return len(self.row_by_position)
+
+    def grow(self):
+        capacity = len(self.rows)
+        self.rows = np.concatenate([self.rows, np.zeros(capacity, dtype=POSITION_DTYPE)])
+        self.free_rows.extend(range(2 * capacity - 1, capacity - 1, -1))
+
+    def token_id(self, token_address):
+        token_key = token_address.lower()
+        if token_key not in self.token_ids:
+            self.token_ids[token_key] = len(self.token_addresses)
+            self.token_addresses.append(token_address)
+        return self.token_ids[token_key]
+
+    def add(self, position_id, token_address, initial_price, token_amount, start_time, increase_threshold, decrease_threshold,
+            moonbag, no_change_enabled, no_change_threshold, no_change_minutes, window=None):
+        """
+        Add an open position holding `token_amount` base units; `start_time` is in epoch
+        seconds and thresholds are fractions. `window` restores a no-change window saved
+        from window(), e.g. after a restart.
+        """
+        if position_id in self.row_by_position:
+            raise ValueError(f"Position {position_id} is already in the table.")
+        if not self.free_rows:
+            self.grow()
+        row = self.free_rows.pop()
+        self.rows[row] = (
+            True, self.token_id(token_address), initial_price, increase_threshold, decrease_threshold,
+            moonbag, no_change_enabled, no_change_threshold, no_change_minutes * 60, start_time, 0.0, 0.0, 0.0, 0,
+        )
+        if window is not None:
+            for field, value in window.items():
+                self.rows[field][row] = value
+        self.row_by_position[position_id] = row
+        self.position_by_row[row] = position_id
+        self.token_amounts[position_id] = int(token_amount)
+        return row
+
+    def set_rules(self, position_id, increase_threshold, decrease_threshold, moonbag, no_change_enabled, no_change_threshold, no_change_minutes):
+        """
+        Change the exit rules of an open position in place. Its no-change window keeps its
+        start and prices, and the next evaluate() uses the new rules. Returns False if
+        the position is not in the table.
+        """
+        row = self.row_by_position.get(position_id)
+        if row is None:
+            return False
+        rows = self.rows
+        rows['increase_threshold'][row] = increase_threshold
+        rows['decrease_threshold'][row] = decrease_threshold
+        rows['moonbag'][row] = moonbag
+        rows['no_change_enabled'][row] = no_change_enabled
+        rows['no_change_threshold'][row] = no_change_threshold
+        rows['window_length'][row] = no_change_minutes * 60
+        return True
+
+    def set_token_amount(self, position_id, token_amount):
+        """Change the base units held by an open position; returns False if the position is not in the table."""
+        if position_id not in self.row_by_position:
+            return False
+        self.token_amounts[position_id] = int(token_amount)
+        return True
+
+    def window(self, position_id):
+        """The no-change window state of a position, as plain Python values."""
+        row = self.rows[self.row_by_position[position_id]]
+        return {field: row[field].item() for field in ('window_start', 'window_first', 'window_low', 'window_high', 'window_count')}
+
+    def remove(self, position_id):
+        row = self.row_by_position.pop(position_id, None)
+        if row is None:
+            return False
+        del self.position_by_row[row]
+        del self.token_amounts[position_id]
+        self.rows[row]['active'] = False
+        self.free_rows.append(row)
+        return True
+
+    def evaluate(self, timestamp, prices):
+        """
+        Applies one price update to every open position. `prices` maps token address to
+        its price in ETH (None when unavailable) and `timestamp` is in epoch seconds.
+        Returns one dict per position that must be sold; those positions are removed.
+        """
+        price_by_token = np.full(len(self.token_addresses), np.nan)
+        for token_address, price in prices.items():
+            token_id = self.token_ids.get(token_address.lower())
+            if token_id is not None and price is not None:
+                price_by_token[token_id] = price
+
+        rows = self.rows
+        live = rows['active'] & (rows['token_id'] < len(price_by_token))
+        live_rows = np.flatnonzero(live)
+        self.rolled = []
+        if live_rows.size == 0:
+            return []
+        table = rows[live_rows]
+        price = price_by_token[table['token_id']]
+        priced = ~np.isnan(price)
+
+        initial_price = table['initial_price']
+        price_increase = (price - initial_price) / initial_price
+        price_decrease = (initial_price - price) / initial_price
+        take_profit = priced & (price_increase >= table['increase_threshold'])
+        stop_loss = priced & ~take_profit & (price_decrease >= table['decrease_threshold'])
+
+        # No-change rule: evaluate every window that completed before this tick
+        checked = priced & ~take_profit & ~stop_loss & table['no_change_enabled']
+        rolled = checked & (timestamp >= table['window_start'] + table['window_length'])
+        first = table['window_first']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            quiet = (np.abs((table['window_high'] - first) / first) < table['no_change_threshold']) & \
+                    (np.abs((first - table['window_low']) / first) < table['no_change_threshold'])
+        no_change = rolled & (table['window_count'] > 0) & quiet
+
+        # Positions that keep running roll their window forward and record this price
+        advance = rolled & ~no_change
+        windows_passed = np.floor((timestamp - table['window_start'][advance]) / table['window_length'][advance])
+        rows['window_start'][live_rows[advance]] += windows_passed * table['window_length'][advance]
+        rows['window_count'][live_rows[advance]] = 0
+
+        update = live_rows[checked & ~no_change]
+        new_window = update[rows['window_count'][update] == 0]
+        rows['window_first'][new_window] = price_by_token[rows['token_id'][new_window]]
+        update_price = price_by_token[rows['token_id'][update]]
+        rows['window_low'][update] = np.where(rows['window_count'][update] == 0, update_price, np.minimum(rows['window_low'][update], update_price))
+        rows['window_high'][update] = np.where(rows['window_count'][update] == 0, update_price, np.maximum(rows['window_high'][update], update_price))
+        rows['window_count'][update] += 1
+        self.rolled = [self.position_by_row[row] for row in live_rows[advance]]
+
+        exits = []
+        for reasons, reason in ((take_profit, EXIT_PRICE_INCREASE), (stop_loss, EXIT_PRICE_DECREASE), (no_change, EXIT_NO_CHANGE)):
+            for index in np.flatnonzero(reasons):
+                row = live_rows[index]
+                position_id = self.position_by_row[row]
+                token_amount = self.token_amounts[position_id]
+                exits.append({
+                    'position_id': position_id,
+                    'token_address': self.token_addresses[table['token_id'][index]],
+                    'reason': reason,
+                    'price': float(price[index]),
+                    'price_change': float(price_increase[index]),
+                    'token_amount_to_sell': amount_to_sell(token_amount, float(table['moonbag'][index])) if reason == EXIT_PRICE_INCREASE else token_amount,
+                })
+                self.remove(position_id)
+        return exits
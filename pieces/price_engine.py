@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import time
+import os
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from pieces.uniswap import get_uniswap_prices, VENUE_REEVALUATE_SECONDS
+from pieces.async_rpc import run_rpc
+from pieces.log_prices import LogPriceFeed, PRICE_LOGS_WS_URL, PRICE_LOGS_MAX_BLOCKS
+from pieces.metrics import timed
+
+# Load environment variables
+load_dotenv()
+
+PRICE_ENGINE_MODE = os.getenv('PRICE_ENGINE_MODE', 'block')  # 'block' refreshes once per new block, 'tick' on every tick, 'logs' follows Sync/Swap events
+PRICE_ENGINE_TICK_SECONDS = float(os.getenv('PRICE_ENGINE_TICK_SECONDS', 1))  # How often to look for a new block
+
+class PriceEngine:
+    """
+    Refreshes the price of every subscribed token once per new block (or per tick)
+    and fans the result out to all positions monitoring that token. In 'logs' mode
+    pools are read once per token and then followed through their Sync/Swap events.
+    """
+
+    def __init__(self, web3, uniswap_v2_factory, uniswap_v3_factory, weth_address,
+                 mode=PRICE_ENGINE_MODE, tick_seconds=PRICE_ENGINE_TICK_SECONDS, block_source=None, logs_ws_url=PRICE_LOGS_WS_URL):
+        self.web3 = web3
+        self.uniswap_v2_factory = uniswap_v2_factory
+        self.uniswap_v3_factory = uniswap_v3_factory
+        self.weth_address = weth_address
+        self.mode = mode
+        self.tick_seconds = tick_seconds
+        self.block_source = block_source  # Optional callable returning the latest block number
+        self.subscriptions = {}  # token_address -> {'decimals': int, 'queues': set of asyncio.Queue, 'trackers': int}
+        self.listeners = []
+        self.last_block = None
+        self.task = None
+        self.log_feed = LogPriceFeed(weth_address) if mode == 'logs' else None
+        self.logs_ws_url = logs_ws_url
+        self.stream_task = None
+        self.venues_read_at = 0.0  # Last time every followed venue was re-read and re-evaluated
+
+    def track(self, token_address, token_decimals):
+        """Start pricing a token; every track() call must be paired with an untrack()."""
+        self.ensure_started()
+        token_key = token_address.lower()
+        subscription = self.subscriptions.setdefault(token_key, {'token_address': token_address, 'decimals': token_decimals, 'queues': set(), 'trackers': 0})
+        subscription['trackers'] += 1
+        # Force a refresh on the next tick so the new position does not wait a whole block
+        self.last_block = None
+        return subscription
+
+    def untrack(self, token_address):
+        token_key = token_address.lower()
+        subscription = self.subscriptions.get(token_key)
+        if subscription is None:
+            return
+        subscription['trackers'] -= 1
+        if subscription['trackers'] <= 0:
+            del self.subscriptions[token_key]
+            if self.log_feed is not None:
+                self.log_feed.remove(token_address)
+
+    def subscribe(self, token_address, token_decimals):
+        """Register for price updates of a token and return the update queue."""
+        queue = asyncio.Queue(maxsize=1)
+        self.track(token_address, token_decimals)['queues'].add(queue)
+        return queue
+
+    def unsubscribe(self, token_address, queue):
+        subscription = self.subscriptions.get(token_address.lower())
+        if subscription is not None:
+            subscription['queues'].discard(queue)
+        self.untrack(token_address)
+
+    def add_listener(self, listener):
+        """Call `listener(timestamp, prices)` after every refresh with a dict of token address to price."""
+        self.listeners.append(listener)
+
+    def ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self.task is None or self.task.done() or self.task.get_loop() is not loop:
+            self.task = loop.create_task(self.run())
+        if self.log_feed is not None and self.logs_ws_url and (self.stream_task is None or self.stream_task.done() or self.stream_task.get_loop() is not loop):
+            self.stream_task = loop.create_task(self.log_feed.stream(self.logs_ws_url, self.publish_prices))
+
+    async def run(self):
+        while True:
+            try:
+                if self.subscriptions and await run_rpc(self.has_new_block):
+                    await self.refresh()
+            except Exception as e:
+                logging.error(f"Price engine tick failed: {e}")
+            await asyncio.sleep(self.tick_seconds)
+
+    def has_new_block(self):
+        if self.mode == 'tick':
+            return True
+        block_number = self.block_source() if self.block_source is not None else self.web3.eth.block_number
+        if block_number == self.last_block:
+            return False
+        self.last_block = block_number
+        return True
+
+    async def refresh(self):
+        """Fetch every distinct token in one batched pass and publish the prices to their subscribers."""
+        subscriptions = list(self.subscriptions.values())
+        if self.log_feed is not None:
+            token_prices = await self.refresh_from_logs(subscriptions)
+        else:
+            tokens = {subscription['token_address']: subscription['decimals'] for subscription in subscriptions}
+            prices = await self.read_prices(tokens)
+            token_prices = {token_address: prices.get(token_address, (None, None, None))[0] for token_address in tokens}
+        self.publish_prices(token_prices)
+
+    async def read_prices(self, tokens):
+        try:
+            with timed('price_refresh'):
+                return await run_rpc(get_uniswap_prices, self.web3, self.uniswap_v2_factory, self.uniswap_v3_factory, tokens, self.weth_address)
+        except Exception as e:
+            logging.error(f"Error fetching prices for {len(tokens)} tokens: {e}")
+            return {}
+
+    async def refresh_from_logs(self, subscriptions):
+        """
+        Apply the events since the last block. Tokens not followed yet are read from their
+        pools, and so is every token after a gap or once the venue choice is due for review.
+        """
+        feed = self.log_feed
+        to_block = self.last_block
+        stale = [subscription for subscription in subscriptions if not feed.follows(subscription['token_address'])]
+        if feed.resync or feed.next_block is None or to_block - feed.next_block >= PRICE_LOGS_MAX_BLOCKS or \
+                time.time() - self.venues_read_at > VENUE_REEVALUATE_SECONDS:
+            feed.resync = False
+            stale = subscriptions
+        elif not self.logs_ws_url and feed.next_block <= to_block and len(stale) < len(subscriptions):
+            logs = await run_rpc(feed.fetch, self.web3, to_block)
+            if logs is None:
+                stale = subscriptions
+            else:
+                feed.apply(logs)
+
+        if stale:
+            tokens = {subscription['token_address']: subscription['decimals'] for subscription in stale}
+            for token_address, (price, venue_address, kind) in (await self.read_prices(tokens)).items():
+                if price is not None:
+                    feed.add(token_address, tokens[token_address], kind, venue_address, price)
+            if len(stale) == len(subscriptions):
+                # Set after the read, so the selector's choices have expired too when this does
+                self.venues_read_at = time.time()
+        feed.next_block = to_block + 1
+        return {subscription['token_address']: feed.prices.get(subscription['token_address']) for subscription in subscriptions}
+
+    def publish_prices(self, token_prices):
+        timestamp = datetime.now(timezone.utc)
+        for token_address, price in token_prices.items():
+            subscription = self.subscriptions.get(token_address.lower())
+            if subscription is not None:
+                self.publish(subscription, (timestamp, price))
+
+        for listener in self.listeners:
+            try:
+                listener(timestamp, token_prices)
+            except Exception as e:
+                logging.error(f"Price engine listener failed: {e}")
+
+    def publish(self, subscription, update):
+        for queue in subscription['queues']:
+            # Subscribers only care about the latest price, so replace any unread update
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(update)
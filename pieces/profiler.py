@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+PROFILER_INTERVAL_SECONDS = float(os.getenv('PROFILER_INTERVAL_SECONDS', 0.005))  # Time between stack samples while profiling
+PROFILER_MAX_DEPTH = int(os.getenv('PROFILER_MAX_DEPTH', 64))  # Innermost frames kept per sampled stack
+
+class SamplingProfiler:
+    """
+    Samples the stack of every thread from a background thread while enabled and counts
+    identical stacks. Costs nothing while stopped and can be switched on and off at
+    runtime; the result is in the collapsed format flame graph tools read.
+    """
+
+    def __init__(self, interval=PROFILER_INTERVAL_SECONDS, max_depth=PROFILER_MAX_DEPTH):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, interval=None):
+        """Start sampling, clearing the previous profile. Returns False if it was already running."""
+        with self.lock:
+            if self.running:
+                return False
+            if interval is not None:
+                self.interval = interval
+            self.stacks = Counter()
+            self.samples = 0
+            self.started_at = time.time()
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run, name='sampling-profiler', daemon=True)
+            self.thread.start()
+        logging.info(f"Sampling profiler started, one sample every {self.interval * 1000:.1f} ms.")
+        return True
+
+    def stop(self):
+        with self.lock:
+            thread = self.thread
+            self.stop_event.set()
+        if thread is not None:
+            thread.join()
+        logging.info(f"Sampling profiler stopped after {self.samples} samples.")
+
+    def run(self):
+        own_thread = threading.get_ident()
+        names = {}
+        while not self.stop_event.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            sampled = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                sampled.append(';'.join(reversed(stack)))
+            with self.lock:
+                self.stacks.update(sampled)
+                self.samples += 1
+
+    def collapsed(self):
+        """Sampled stacks as 'thread;outer;...;inner count' lines, most frequent first."""
+        with self.lock:
+            return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common()) + '\n'
+
+    def stats(self):
+        with self.lock:
+            return {
+                'running': self.running,
+                'interval_seconds': self.interval,
+                'samples': self.samples,
+                'started_at': self.started_at,
+                'distinct_stacks': len(self.stacks),
+            }
+
+# Shared profiler toggled through the admin endpoints
+profiler = SamplingProfiler()
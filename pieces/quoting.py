@@ -0,0 +1,243 @@
+import os
+import time
+import bisect
+import logging
+from dotenv import load_dotenv
+from pieces.multicall import multicall
+from pieces.contracts import contract
+from pieces.address_index import address_index, checksum
+from pieces.uniswap import venue_selector
+
+# Load environment variables
+load_dotenv()
+
+SLIPPAGE_TOLERANCE_PERCENT = float(os.getenv('SLIPPAGE_TOLERANCE_PERCENT', 5))  # Minimum output is the quote minus this much
+QUOTE_MAX_AGE_SECONDS = float(os.getenv('QUOTE_MAX_AGE_SECONDS', 15))  # Re-read pool state older than this before quoting
+QUOTE_V3_TICK_WORDS = int(os.getenv('QUOTE_V3_TICK_WORDS', 2))  # Tick bitmap words (256 ticks each) read per V3 pool and direction
+QUOTE_V3_TICKS_TTL_SECONDS = float(os.getenv('QUOTE_V3_TICKS_TTL_SECONDS', 60))
+
+Q96 = 2 ** 96
+MIN_TICK = -887272
+MAX_TICK = 887272
+MIN_SQRT_RATIO = 4295128739
+MAX_SQRT_RATIO = 1461446703485210103287273052203988822378723970342
+V3_TICK_SPACINGS = {100: 1, 500: 10, 3000: 60, 10000: 200}
+
+# Constants of TickMath.getSqrtRatioAtTick, one per bit of the absolute tick
+TICK_RATIO_FACTORS = [
+    0xfff97272373d413259a46990580e213a, 0xfff2e50f5f656932ef12357cf3c7fdcc, 0xffe5caca7e10e4e61c3624eaa0941cd0,
+    0xffcb9843d60f6159c9db58835c926644, 0xff973b41fa98c081472e6896dfb254c0, 0xff2ea16466c96a3843ec78b326b52861,
+    0xfe5dee046a99a2a811c461f1969c3053, 0xfcbe86c7900a88aedcffc83b479aa3a4, 0xf987a7253ac413176f2b074cf7815e54,
+    0xf3392b0822b70005940c7a398e4b70f3, 0xe7159475a2c29b7443b29c7fa6e889d9, 0xd097f3bdfd2022b8845ad8f792aa5825,
+    0xa9f746462d870fdf8a65dc1f90e061e5, 0x70d869a156d2a1b890bb3df62baf32f7, 0x31be135f97d08fd981231505542fcfa6,
+    0x9aa508b5b7a84e1c677de54f3e99bc9, 0x5d6af8dedb81196699c329225ee604, 0x2216e584f5fa1ea926041bedfe98,
+    0x48a170391f7dc42444e8fa2,
+]
+
+v3_tick_cache = {}  # (pool address, zero_for_one) -> (ticks, fetched_at)
+
+# Uniswap V2
+
+def v2_amount_out(amount_in, reserve_in, reserve_out):
+    """UniswapV2Library.getAmountOut: exact output of a swap through a pair with the 0.3% fee."""
+    if amount_in <= 0 or reserve_in <= 0 or reserve_out <= 0:
+        return 0
+    amount_in_with_fee = amount_in * 997
+    return amount_in_with_fee * reserve_out // (reserve_in * 1000 + amount_in_with_fee)
+
+# Uniswap V3, ported from TickMath, SqrtPriceMath and SwapMath with their rounding
+
+def mul_div_rounding_up(a, b, denominator):
+    return -(-a * b // denominator)
+
+def get_sqrt_ratio_at_tick(tick):
+    abs_tick = abs(tick)
+    ratio = 0xfffcb933bd6fad37aa2d162d1a594001 if abs_tick & 1 else 1 << 128
+    for bit, factor in enumerate(TICK_RATIO_FACTORS, start=1):
+        if abs_tick & (1 << bit):
+            ratio = (ratio * factor) >> 128
+    if tick > 0:
+        ratio = (2 ** 256 - 1) // ratio
+    return (ratio >> 32) + (1 if ratio % (1 << 32) else 0)
+
+def get_amount0_delta(sqrt_a, sqrt_b, liquidity, round_up):
+    if sqrt_a > sqrt_b:
+        sqrt_a, sqrt_b = sqrt_b, sqrt_a
+    numerator1 = liquidity << 96
+    numerator2 = sqrt_b - sqrt_a
+    if round_up:
+        return -(-mul_div_rounding_up(numerator1, numerator2, sqrt_b) // sqrt_a)
+    return numerator1 * numerator2 // sqrt_b // sqrt_a
+
+def get_amount1_delta(sqrt_a, sqrt_b, liquidity, round_up):
+    if sqrt_a > sqrt_b:
+        sqrt_a, sqrt_b = sqrt_b, sqrt_a
+    if round_up:
+        return mul_div_rounding_up(liquidity, sqrt_b - sqrt_a, Q96)
+    return liquidity * (sqrt_b - sqrt_a) // Q96
+
+def get_next_sqrt_price_from_input(sqrt_price, liquidity, amount_in, zero_for_one):
+    if zero_for_one:
+        # getNextSqrtPriceFromAmount0RoundingUp, including its fallback when the product overflows 256 bits
+        if amount_in == 0:
+            return sqrt_price
+        numerator1 = liquidity << 96
+        product = amount_in * sqrt_price
+        denominator = numerator1 + product
+        if product < 2 ** 256 and denominator < 2 ** 256:
+            return mul_div_rounding_up(numerator1, sqrt_price, denominator)
+        return -(-numerator1 // (numerator1 // sqrt_price + amount_in))
+    return sqrt_price + (amount_in << 96) // liquidity
+
+def compute_swap_step(sqrt_price, sqrt_target, liquidity, amount_remaining, fee_pips):
+    """SwapMath.computeSwapStep for an exact input. Returns (next sqrt price, amount in, amount out, fee amount)."""
+    zero_for_one = sqrt_price >= sqrt_target
+    amount_remaining_less_fee = amount_remaining * (1_000_000 - fee_pips) // 1_000_000
+    if zero_for_one:
+        amount_in = get_amount0_delta(sqrt_target, sqrt_price, liquidity, True)
+    else:
+        amount_in = get_amount1_delta(sqrt_price, sqrt_target, liquidity, True)
+    if amount_remaining_less_fee >= amount_in:
+        sqrt_next = sqrt_target
+    else:
+        sqrt_next = get_next_sqrt_price_from_input(sqrt_price, liquidity, amount_remaining_less_fee, zero_for_one)
+
+    reached_target = sqrt_next == sqrt_target
+    if zero_for_one:
+        if not reached_target:
+            amount_in = get_amount0_delta(sqrt_next, sqrt_price, liquidity, True)
+        amount_out = get_amount1_delta(sqrt_next, sqrt_price, liquidity, False)
+    else:
+        if not reached_target:
+            amount_in = get_amount1_delta(sqrt_price, sqrt_next, liquidity, True)
+        amount_out = get_amount0_delta(sqrt_price, sqrt_next, liquidity, False)
+
+    if not reached_target:
+        fee_amount = amount_remaining - amount_in
+    else:
+        fee_amount = mul_div_rounding_up(amount_in, fee_pips, 1_000_000 - fee_pips)
+    return sqrt_next, amount_in, amount_out, fee_amount
+
+def next_initialized_tick_within_one_word(initialized_ticks, tick, tick_spacing, lte):
+    """TickBitmap.nextInitializedTickWithinOneWord over a sorted list of initialized ticks."""
+    compressed = tick // tick_spacing  # Floor division rounds towards negative infinity like the contract
+    if lte:
+        word_start = (compressed >> 8) << 8
+        i = bisect.bisect_right(initialized_ticks, compressed * tick_spacing)
+        if i and initialized_ticks[i - 1] >= word_start * tick_spacing:
+            return initialized_ticks[i - 1], True
+        return word_start * tick_spacing, False
+    compressed += 1
+    word_end = ((compressed >> 8) << 8) + 255
+    i = bisect.bisect_left(initialized_ticks, compressed * tick_spacing)
+    if i < len(initialized_ticks) and initialized_ticks[i] <= word_end * tick_spacing:
+        return initialized_ticks[i], True
+    return word_end * tick_spacing, False
+
+def v3_amount_out(amount_in, zero_for_one, sqrt_price_x96, liquidity, tick, fee, ticks=None):
+    """
+    Output of an exact-input swap through a V3 pool. With `ticks` (initialized tick ->
+    liquidityNet) the swap crosses ticks like the pool does; without them liquidity is
+    assumed constant over the whole move (single-tick math).
+    """
+    sqrt_limit = MIN_SQRT_RATIO + 1 if zero_for_one else MAX_SQRT_RATIO - 1
+    initialized_ticks = sorted(ticks) if ticks is not None else None
+    amount_remaining = amount_in
+    amount_out = 0
+    while amount_remaining > 0 and sqrt_price_x96 != sqrt_limit:
+        if ticks is None:
+            sqrt_next_tick, tick_next, initialized = sqrt_limit, None, False
+        else:
+            tick_next, initialized = next_initialized_tick_within_one_word(initialized_ticks, tick, V3_TICK_SPACINGS[fee], zero_for_one)
+            tick_next = max(MIN_TICK, min(MAX_TICK, tick_next))
+            sqrt_next_tick = get_sqrt_ratio_at_tick(tick_next)
+        sqrt_target = max(sqrt_next_tick, sqrt_limit) if zero_for_one else min(sqrt_next_tick, sqrt_limit)
+        if liquidity == 0:
+            step_in = step_out = fee_amount = 0
+            sqrt_price_x96 = sqrt_target
+        else:
+            sqrt_price_x96, step_in, step_out, fee_amount = compute_swap_step(sqrt_price_x96, sqrt_target, liquidity, amount_remaining, fee)
+        amount_remaining -= step_in + fee_amount
+        amount_out += step_out
+        if tick_next is None or sqrt_price_x96 != sqrt_next_tick:
+            break
+        if initialized:
+            liquidity_net = ticks[tick_next]
+            liquidity += -liquidity_net if zero_for_one else liquidity_net
+        tick = tick_next - 1 if zero_for_one else tick_next
+    return amount_out
+
+def fetch_v3_ticks(web3, pool_address, tick, fee, zero_for_one, words=QUOTE_V3_TICK_WORDS):
+    """Read the initialized ticks (tick -> liquidityNet) in the `words` bitmap words a swap would walk through."""
+    tick_spacing = V3_TICK_SPACINGS[fee]
+    pool_contract = contract(web3, 'IUniswapV3Pool', pool_address)
+    first_word = (tick // tick_spacing) >> 8
+    word_positions = [first_word - i if zero_for_one else first_word + i for i in range(words)]
+    bitmaps = multicall(web3, [pool_contract.functions.tickBitmap(word) for word in word_positions])
+    initialized = []
+    for word, bitmap in zip(word_positions, bitmaps):
+        for bit in range(256):
+            if bitmap and bitmap >> bit & 1:
+                initialized.append(((word << 8) + bit) * tick_spacing)
+    tick_infos = multicall(web3, [pool_contract.functions.ticks(t) for t in initialized])
+    return {t: info[1] for t, info in zip(initialized, tick_infos) if info is not None}
+
+# Quotes for trades and P/L
+
+def min_amount_out(expected_out, slippage_percent=SLIPPAGE_TOLERANCE_PERCENT):
+    # Integer basis points keep large raw amounts exact
+    return expected_out * round((100 - slippage_percent) * 100) // 10_000
+
+def read_venue_state(web3, address, kind, fee):
+    """Pool state cached by the venue selector, re-read when older than QUOTE_MAX_AGE_SECONDS."""
+    state = venue_selector.state(address)
+    if state is not None and time.time() - state['read_at'] <= QUOTE_MAX_AGE_SECONDS:
+        return state
+    calls = venue_selector.venue_calls(web3, kind, address)
+    venue_selector.remember(kind, address, fee, multicall(web3, calls), 0)
+    return venue_selector.state(address)
+
+def quote_swap(web3, uniswap_v2_factory, token_address, weth_address, amount_in, buying, v2_only=False):
+    """
+    Quotes swapping `amount_in` (raw units) of WETH for the token (`buying`) or back.
+    Uses the token's chosen venue, or its V2 pair when `v2_only` (trades go through the
+    V2 router). Returns {'venue', 'kind', 'expected_out', 'min_out'} or None.
+    """
+    token = checksum(token_address)
+    weth = checksum(weth_address)
+    chosen = venue_selector.venues().get(token.lower())
+    if chosen is None or (v2_only and chosen['kind'] != 'v2'):
+        (pair_address,) = address_index.resolve(web3, [('v2', uniswap_v2_factory.address, token, weth, None)])
+        if pair_address is None:
+            return None
+        chosen = {'kind': 'v2', 'address': pair_address, 'fee': None}
+
+    state = read_venue_state(web3, chosen['address'], chosen['kind'], chosen['fee'])
+    if state is None:
+        return None
+
+    token_is_token0 = token.lower() < weth.lower()
+    if state['kind'] == 'v2':
+        reserve_token, reserve_weth = state['reserves'][:2] if token_is_token0 else state['reserves'][1::-1]
+        expected_out = v2_amount_out(amount_in, reserve_weth, reserve_token) if buying else v2_amount_out(amount_in, reserve_token, reserve_weth)
+    else:
+        # Selling token0 (or buying with token0 = WETH) moves the price down
+        zero_for_one = token_is_token0 != buying
+        sqrt_price_x96, tick = state['slot0'][0], state['slot0'][1]
+        ticks = cached_v3_ticks(web3, chosen['address'], tick, state['fee'], zero_for_one)
+        expected_out = v3_amount_out(amount_in, zero_for_one, sqrt_price_x96, state['liquidity'], tick, state['fee'], ticks)
+
+    return {'venue': chosen['address'], 'kind': state['kind'], 'expected_out': expected_out, 'min_out': min_amount_out(expected_out)}
+
+def cached_v3_ticks(web3, pool_address, tick, fee, zero_for_one):
+    key = (pool_address, zero_for_one)
+    cached = v3_tick_cache.get(key)
+    if cached is not None and time.time() - cached[1] <= QUOTE_V3_TICKS_TTL_SECONDS:
+        return cached[0]
+    try:
+        ticks = fetch_v3_ticks(web3, pool_address, tick, fee, zero_for_one)
+    except Exception as e:
+        logging.error(f"Could not read tick data of {pool_address}, quoting with constant liquidity: {e}")
+        return None
+    v3_tick_cache[key] = (ticks, time.time())
+    return ticks
@@ -0,0 +1,85 @@
+import os
+import time
+import asyncio
+import logging
+from dotenv import load_dotenv
+from pieces.multicall import rpc_batch
+from pieces.async_rpc import run_rpc
+
+# Load environment variables
+load_dotenv()
+
+RECEIPT_POLL_SECONDS = float(os.getenv('RECEIPT_POLL_SECONDS', 3))  # How often pending transactions are checked
+RECEIPT_TIMEOUT_SECONDS = float(os.getenv('RECEIPT_TIMEOUT_SECONDS', 600))  # Give up waiting after this long
+
+class ReceiptWatcher:
+    """
+    Waits for transaction receipts in one background task. All pending hashes are
+    checked with a single JSON-RPC batch per poll, and each caller gets a future that
+    resolves with the mined transaction's status, block, gas used, effective gas price and logs.
+    """
+
+    def __init__(self, web3, poll_seconds=RECEIPT_POLL_SECONDS, timeout=RECEIPT_TIMEOUT_SECONDS):
+        self.web3 = web3
+        self.poll_seconds = poll_seconds
+        self.timeout = timeout
+        self.pending = {}  # tx_hash -> {'future', 'sent_at', 'label'}
+        self.task = None
+
+    def track(self, tx_hash, label=''):
+        """Start watching `tx_hash` and return a future resolved with its receipt details."""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+        if tx_hash in self.pending:
+            return self.pending[tx_hash]['future']
+        future = asyncio.get_running_loop().create_future()
+        self.pending[tx_hash] = {'future': future, 'sent_at': time.monotonic(), 'label': label}
+        return future
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            if not self.pending:
+                continue
+            try:
+                await self.poll()
+            except Exception as e:
+                logging.error(f"Receipt polling failed: {e}")
+
+    async def poll(self):
+        tx_hashes = list(self.pending)
+        receipts = await run_rpc(rpc_batch, self.web3, [('eth_getTransactionReceipt', [tx_hash]) for tx_hash in tx_hashes])
+        now = time.monotonic()
+        for tx_hash, receipt in zip(tx_hashes, receipts):
+            watched = self.pending[tx_hash]
+            if receipt is not None:
+                del self.pending[tx_hash]
+                details = {
+                    'tx_hash': tx_hash,
+                    'status': int(receipt['status'], 16),
+                    'block_number': int(receipt['blockNumber'], 16),
+                    'gas_used': int(receipt['gasUsed'], 16),
+                    'effective_gas_price': int(receipt.get('effectiveGasPrice', '0x0'), 16),
+                    'seconds_to_mine': now - watched['sent_at'],
+                    'logs': receipt.get('logs') or [],
+                }
+                log_receipt(details, watched['label'])
+                if not watched['future'].done():
+                    watched['future'].set_result(details)
+            elif now - watched['sent_at'] > self.timeout:
+                del self.pending[tx_hash]
+                logging.error(f"No receipt for {watched['label']} transaction {tx_hash} after {self.timeout:.0f}s.")
+                if not watched['future'].done():
+                    watched['future'].set_exception(TimeoutError(f"Transaction {tx_hash} not mined after {self.timeout:.0f}s"))
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+def log_receipt(details, label=''):
+    logging.info(f"Transaction Details for {details['tx_hash']}{f' ({label})' if label else ''}:")
+    logging.info(f"  Status: {details['status']}")
+    logging.info(f"  Block Number: {details['block_number']}")
+    logging.info(f"  Gas Used: {details['gas_used']}")
+    logging.info(f"  Effective Gas Price: {details['effective_gas_price'] / 1e9} Gwei")
+    logging.info(f"  Mined after: {details['seconds_to_mine']:.1f}s")
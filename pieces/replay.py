@@ -0,0 +1,315 @@
+import os
+import json
+import zlib
+import logging
+import argparse
+import itertools
+import numpy as np
+from datetime import datetime, timezone, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+from pieces.filters import filter_message, extract_token_address, ACTION_TEXT_FILE
+from pieces.position_table import PositionTable, EXIT_PRICE_INCREASE
+from pieces.position_store import PositionStore, POSITION_STORE_PATH
+from pieces.tick_recorder import load_token_history, TICK_RECORDER_DIR
+
+# Load environment variables
+load_dotenv()
+
+# Parameters that can be varied, with the live configuration as default; units are the ones used in .env
+REPLAY_PARAMETERS = {
+    'AMOUNT_OF_ETH': float(os.getenv('AMOUNT_OF_ETH', 0.1)),
+    'PRICE_INCREASE_THRESHOLD': float(os.getenv('PRICE_INCREASE_THRESHOLD', 50)),  # Percent
+    'PRICE_DECREASE_THRESHOLD': float(os.getenv('PRICE_DECREASE_THRESHOLD', 20)),  # Percent
+    'NO_CHANGE_THRESHOLD_PERCENT': float(os.getenv('NO_CHANGE_THRESHOLD_PERCENT', 1)),
+    'NO_CHANGE_TIME_MINUTES': float(os.getenv('NO_CHANGE_TIME_MINUTES', 10)),
+    'MOONBAG': float(os.getenv('MOONBAG', 0)),  # Percent
+    'MIN_MARKET_CAP': float(os.getenv('MIN_MARKET_CAP', 0)),  # USD
+    'MAX_MARKET_CAP': float(os.getenv('MAX_MARKET_CAP', 1e12)),  # USD
+}
+REPLAY_MAX_HOLD_HOURS = float(os.getenv('REPLAY_MAX_HOLD_HOURS', 24))  # Price history replayed after each buy
+REPLAY_SNAPSHOT_SECONDS = float(os.getenv('REPLAY_SNAPSHOT_SECONDS', 300))  # How far a recorded market cap may be from the message
+
+# Token decimals are not recorded with the ticks, so replayed amounts are base units of an 18 decimal token
+REPLAY_TOKEN_UNIT = 10 ** 18
+
+def load_messages(path=ACTION_TEXT_FILE):
+    """
+    Archived messages with the time they were received, oldest first. Lines written
+    before the archive recorded the sender are plain text and cannot be replayed.
+    """
+    messages = []
+    legacy = 0
+    with open(path) as file:
+        for line in file:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                legacy += 1
+                continue
+            if isinstance(message, dict) and message.get('from_name') and message.get('timestamp'):
+                messages.append(message)
+            else:
+                legacy += 1
+    if legacy:
+        logging.info(f"Skipped {legacy} archived lines without a sender or timestamp.")
+    messages.sort(key=lambda message: message['timestamp'])
+    return messages
+
+def select_candidates(messages, from_names=None):
+    """Run the messages through the live filters and return (timestamp, from_name, tx_hash, token address) for every buy signal."""
+    from_names = frozenset(from_names) if from_names else frozenset(message['from_name'] for message in messages)
+    candidates = []
+    previous_level = logging.root.manager.disable
+    logging.disable(logging.INFO)  # The filters log every message
+    try:
+        for message in messages:
+            if filter_message(message, from_names, archive=False):
+                token_address = extract_token_address(message['action_text'])
+                if token_address:
+                    candidates.append((message['timestamp'], message['from_name'], message.get('tx_hash') or '', token_address.lower()))
+    finally:
+        logging.disable(previous_level)
+    return candidates
+
+def recorded_ticks(token_address, start, end, directory=TICK_RECORDER_DIR):
+    """A token's recorded (timestamps, prices) between two epoch times, from the tick recorder's daily segments."""
+    day = datetime.fromtimestamp(start, timezone.utc).date()
+    last_day = datetime.fromtimestamp(end, timezone.utc).date()
+    parts = []
+    while day <= last_day:
+        parts.extend(load_token_history(token_address, day.strftime('%Y%m%d'), directory))
+        day += timedelta(days=1)
+    if not parts:
+        return np.empty(0), np.empty(0)
+    rows = np.concatenate(parts)
+    rows = rows[(rows['timestamp'] >= start) & (rows['timestamp'] <= end) & ~np.isnan(rows['price'])]
+    return rows['timestamp'], rows['price']
+
+def synthetic_ticks(token_address, start, end, seed, tick_seconds, volatility):
+    """A seeded random walk of the token's price from `start`, identical for every parameter set."""
+    rng = np.random.default_rng([seed, zlib.crc32(token_address.encode())])
+    timestamps = np.arange(start, end, tick_seconds)
+    prices = 1e-6 * np.exp(np.cumsum(rng.normal(0, volatility, len(timestamps))))
+    return timestamps, prices
+
+def synthetic_market_cap(token_address, seed):
+    rng = np.random.default_rng([seed, zlib.crc32(token_address.encode()), 1])
+    return float(10 ** rng.uniform(4, 8))
+
+def recorded_market_cap(snapshots, token_address, timestamp):
+    """The recorded market cap closest to the message, if one was taken within REPLAY_SNAPSHOT_SECONDS."""
+    best = None
+    for snapshot_time, market_cap_usd, _ in snapshots.get(token_address, ()):
+        distance = abs(snapshot_time - timestamp)
+        if market_cap_usd is not None and distance <= REPLAY_SNAPSHOT_SECONDS and (best is None or distance < best[0]):
+            best = (distance, market_cap_usd)
+    return best[1] if best is not None else None
+
+def build_replay(candidates, synthetic=False, seed=1, tick_seconds=12.0, volatility=0.01, market_cap_filter=True,
+                 tick_directory=TICK_RECORDER_DIR, store_path=POSITION_STORE_PATH):
+    """
+    Everything a replay needs: per candidate its market cap, and one merged, time-ordered
+    stream of the price ticks of every candidate token, as (timestamps, token ids, prices).
+    """
+    snapshots = {} if synthetic or not market_cap_filter else PositionStore(store_path).snapshots()
+    tokens = []
+    token_ids = {}
+    windows = {}  # token id -> [first buy time, last buy time]
+    replay_candidates = []
+    for timestamp, from_name, tx_hash, token_address in candidates:
+        if market_cap_filter:
+            market_cap_usd = synthetic_market_cap(token_address, seed) if synthetic else recorded_market_cap(snapshots, token_address, timestamp)
+        else:
+            market_cap_usd = None
+        if token_address not in token_ids:
+            token_ids[token_address] = len(tokens)
+            tokens.append(token_address)
+        token_id = token_ids[token_address]
+        window = windows.setdefault(token_id, [timestamp, timestamp])
+        window[1] = max(window[1], timestamp)
+        replay_candidates.append((timestamp, from_name, tx_hash, token_id, market_cap_usd))
+
+    streams = []
+    horizon = REPLAY_MAX_HOLD_HOURS * 3600
+    for token_id, (first, last) in windows.items():
+        if synthetic:
+            timestamps, prices = synthetic_ticks(tokens[token_id], first, last + horizon, seed, tick_seconds, volatility)
+        else:
+            timestamps, prices = recorded_ticks(tokens[token_id], first, last + horizon, tick_directory)
+        streams.append((timestamps, np.full(len(timestamps), token_id, dtype=np.int32), prices))
+    if streams:
+        timestamps, token_id_column, prices = (np.concatenate(column) for column in zip(*streams))
+        order = np.argsort(timestamps, kind='stable')
+        ticks = (timestamps[order], token_id_column[order], prices[order])
+    else:
+        ticks = (np.empty(0), np.empty(0, dtype=np.int32), np.empty(0))
+    # Ticks sharing a timestamp form one group, evaluated in a single pass
+    group_starts = np.concatenate(([0], np.flatnonzero(np.diff(ticks[0])) + 1, [len(ticks[0])])) if len(ticks[0]) else np.zeros(1, dtype=np.int64)
+    last_prices = np.full(len(tokens), np.nan)
+    last_prices[ticks[1]] = ticks[2]  # Later ticks overwrite earlier ones
+    return {
+        'tokens': tokens, 'candidates': replay_candidates, 'ticks': ticks, 'groups': group_starts,
+        'last_prices': last_prices, 'market_cap_filter': market_cap_filter,
+    }
+
+def run_parameter_set(replay, params):
+    """
+    Replays the buy signals in virtual time: each candidate passing the market cap bounds
+    is bought at the next tick of its token, and its exit rules run on the real
+    PositionTable until it is sold or the history ends. Returns P/L per from_name.
+    """
+    tokens = replay['tokens']
+    timestamps, token_ids, prices = replay['ticks']
+    table = PositionTable()
+    results = {}
+    positions = {}  # position id -> (from_name, token id, token amount in base units)
+    position_ids = itertools.count()  # Signals may share a tx_hash, so positions are numbered instead
+    open_by_token = np.zeros(len(tokens), dtype=np.int64)
+    pending = iter(sorted(replay['candidates']))
+    candidate = next(pending, None)
+    rules = (
+        params['PRICE_INCREASE_THRESHOLD'] / 100, params['PRICE_DECREASE_THRESHOLD'] / 100, params['MOONBAG'] / 100,
+        True, params['NO_CHANGE_THRESHOLD_PERCENT'] / 100, params['NO_CHANGE_TIME_MINUTES'],
+    )
+
+    def wallet(from_name):
+        return results.setdefault(from_name, {'signals': 0, 'buys': 0, 'sells': 0, 'wins': 0, 'profit_or_loss': 0.0, 'open': 0, 'unrealized': 0.0, 'moonbag_eth': 0.0})
+
+    group_starts = replay['groups']
+    group_times = timestamps[group_starts[:-1]]
+    g = 0
+    while g < len(group_times):
+        if not positions:
+            # Nothing to evaluate until the next signal arrives
+            if candidate is None:
+                break
+            g = max(g, int(np.searchsorted(group_times, candidate[0])))
+            if g == len(group_times):
+                break
+        # All tokens priced at the same instant are evaluated together, like one price engine refresh
+        i, j = group_starts[g], group_starts[g + 1]
+        g += 1
+        now = group_times[g - 1]
+        due = candidate is not None and candidate[0] <= now
+        if not due and not open_by_token[token_ids[i:j]].any():
+            continue
+        tick_prices = {tokens[token_ids[k]]: prices[k] for k in range(i, j)}
+
+        # Buy every signal that arrived before this tick at its token's first price after it
+        while candidate is not None and candidate[0] <= now:
+            timestamp, from_name, tx_hash, token_id, market_cap_usd = candidate
+            candidate = next(pending, None)
+            stats = wallet(from_name)
+            stats['signals'] += 1
+            if replay['market_cap_filter'] and (market_cap_usd is None or not params['MIN_MARKET_CAP'] <= market_cap_usd <= params['MAX_MARKET_CAP']):
+                continue
+            price = tick_prices.get(tokens[token_id])
+            if price is None:
+                # Bought on the token's next tick instead; positions wait in the table for it
+                price = next_price(timestamps, token_ids, prices, token_id, j)
+                if price is None:
+                    continue
+            position_id = next(position_ids)
+            token_amount = int(params['AMOUNT_OF_ETH'] / price * REPLAY_TOKEN_UNIT)
+            table.add(position_id, tokens[token_id], price, token_amount, now, *rules)
+            positions[position_id] = (from_name, token_id, token_amount)
+            open_by_token[token_id] += 1
+            stats['buys'] += 1
+
+        for decision in table.evaluate(now, tick_prices):
+            from_name, token_id, token_amount = positions.pop(decision['position_id'])
+            open_by_token[token_id] -= 1
+            stats = wallet(from_name)
+            sold = decision['token_amount_to_sell']
+            profit_or_loss = sold / REPLAY_TOKEN_UNIT * decision['price'] - params['AMOUNT_OF_ETH'] * (sold / token_amount)
+            stats['sells'] += 1
+            stats['wins'] += int(profit_or_loss > 0)
+            stats['profit_or_loss'] += profit_or_loss
+            if decision['reason'] == EXIT_PRICE_INCREASE:
+                stats['moonbag_eth'] += (token_amount - sold) / REPLAY_TOKEN_UNIT * decision['price']
+
+    # Positions still open when the history ends are marked to their last price
+    last_price = replay['last_prices']
+    for from_name, token_id, token_amount in positions.values():
+        stats = wallet(from_name)
+        stats['open'] += 1
+        stats['unrealized'] += float(token_amount / REPLAY_TOKEN_UNIT * last_price[token_id] - params['AMOUNT_OF_ETH'])
+    while candidate is not None:
+        wallet(candidate[1])['signals'] += 1
+        candidate = next(pending, None)
+    return {'params': params, 'wallets': results, 'profit_or_loss': sum(stats['profit_or_loss'] for stats in results.values())}
+
+def next_price(timestamps, token_ids, prices, token_id, start):
+    later = np.flatnonzero(token_ids[start:] == token_id)
+    return float(prices[start + later[0]]) if later.size else None
+
+replay_data = None
+
+def init_worker(replay):
+    global replay_data
+    replay_data = replay
+
+def run_worker(params):
+    return run_parameter_set(replay_data, params)
+
+def parameter_grid(grid):
+    """Every combination of the `NAME=value,value` settings, on top of the live configuration."""
+    names = []
+    values = []
+    for setting in grid:
+        name, _, listed = setting.partition('=')
+        if name not in REPLAY_PARAMETERS:
+            raise ValueError(f"Unknown replay parameter {name}, expected one of {', '.join(REPLAY_PARAMETERS)}.")
+        names.append(name)
+        values.append([float(value) for value in listed.split(',')])
+    return [dict(REPLAY_PARAMETERS, **dict(zip(names, combination))) for combination in itertools.product(*values)]
+
+def run_replay(replay, parameter_sets, workers=None):
+    """Run every parameter set over the same replay on a process pool, best total P/L first."""
+    if len(parameter_sets) == 1 or workers == 1:
+        results = [run_parameter_set(replay, params) for params in parameter_sets]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(replay,)) as executor:
+            results = list(executor.map(run_worker, parameter_sets, chunksize=max(1, len(parameter_sets) // (4 * (workers or os.cpu_count() or 1)))))
+    return sorted(results, key=lambda result: result['profit_or_loss'], reverse=True)
+
+def print_results(results, varied, top):
+    for result in results[:top]:
+        settings = ', '.join(f"{name}={result['params'][name]:g}" for name in varied) or 'live configuration'
+        print(f"{settings}: {result['profit_or_loss']:+.6f} ETH")
+        for from_name, stats in sorted(result['wallets'].items(), key=lambda item: item[1]['profit_or_loss'], reverse=True):
+            print(
+                f"    {from_name:<24} {stats['profit_or_loss']:+.6f} ETH  {stats['buys']:>4} buys of {stats['signals']:>4} signals  "
+                f"{stats['wins']:>4}/{stats['sells']:<4} winning sells  {stats['open']:>3} open ({stats['unrealized']:+.6f} ETH)"
+            )
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay the archived webhook messages through the filters and exit rules for many parameter sets.')
+    parser.add_argument('--archive', default=ACTION_TEXT_FILE, help='Archived messages, one JSON object per line')
+    parser.add_argument('--grid', action='append', default=[], metavar='NAME=V1,V2', help=f"Values to try for one of: {', '.join(REPLAY_PARAMETERS)}")
+    parser.add_argument('--from-names', help='Comma separated wallets to follow, default every wallet in the archive')
+    parser.add_argument('--synthetic', action='store_true', help='Use seeded random-walk prices and market caps instead of recorded ones')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--tick-seconds', type=float, default=12.0, help='Synthetic tick interval')
+    parser.add_argument('--volatility', type=float, default=0.01, help='Standard deviation of the synthetic log return per tick')
+    parser.add_argument('--no-market-cap-filter', action='store_true')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--top', type=int, default=10, help='Parameter sets to print')
+    parser.add_argument('--output', help='Write every result to this JSON file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from_names = [name.strip() for name in args.from_names.split(',')] if args.from_names else None
+    candidates = select_candidates(load_messages(args.archive), from_names)
+    replay = build_replay(candidates, args.synthetic, args.seed, args.tick_seconds, args.volatility, not args.no_market_cap_filter)
+    parameter_sets = parameter_grid(args.grid)
+    logging.info(f"Replaying {len(candidates)} buy signals on {len(replay['tokens'])} tokens ({len(replay['ticks'][0])} ticks) for {len(parameter_sets)} parameter sets.")
+    results = run_replay(replay, parameter_sets, args.workers)
+    print_results(results, [setting.partition('=')[0] for setting in args.grid], args.top)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+if __name__ == '__main__':
+    main()
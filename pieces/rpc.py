@@ -0,0 +1,201 @@
+import os
+import time
+import logging
+import threading
+import requests
+from urllib.parse import urlsplit
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+from web3 import Web3
+from web3.providers.base import JSONBaseProvider
+from pieces.metrics import record_rpc_request
+
+# Load environment variables
+load_dotenv()
+
+INFURA_URL = os.getenv('INFURA_URL')
+RPC_URLS = [url.strip() for url in os.getenv('RPC_URLS', INFURA_URL or '').split(',') if url.strip()]  # Endpoints in order of preference
+RPC_TIMEOUT_SECONDS = float(os.getenv('RPC_TIMEOUT_SECONDS', 10))
+RPC_MAX_ATTEMPTS = int(os.getenv('RPC_MAX_ATTEMPTS', 3))  # Tries per request, moving to the next endpoint after each failure
+RPC_POOL_CONNECTIONS = int(os.getenv('RPC_POOL_CONNECTIONS', 32))  # Keep-alive connections per endpoint
+RPC_HEDGE_READS = os.getenv('RPC_HEDGE_READS', 'true').lower() == 'true'  # Send slow reads to a second endpoint as well
+RPC_HEDGE_MIN_SECONDS = float(os.getenv('RPC_HEDGE_MIN_SECONDS', 0.25))  # Never hedge before this long, whatever the p95
+RPC_COOLDOWN_SECONDS = float(os.getenv('RPC_COOLDOWN_SECONDS', 1))  # Doubles with each consecutive failure
+RPC_MAX_COOLDOWN_SECONDS = float(os.getenv('RPC_MAX_COOLDOWN_SECONDS', 60))
+
+# Requests that change chain state are failed over but never hedged
+WRITE_METHODS = {'eth_sendRawTransaction', 'eth_sendTransaction'}
+LATENCY_SAMPLES = 100
+
+class RpcUnavailable(Exception):
+    """Raised when no endpoint answered a request."""
+
+class Endpoint:
+    """One JSON-RPC endpoint with its own keep-alive session and health statistics."""
+
+    def __init__(self, url, pool_connections=RPC_POOL_CONNECTIONS):
+        self.url = url
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_connections)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+    def p95(self):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def score(self, now):
+        """Lower is better: recent latency, penalised by failures; endpoints cooling down go last."""
+        average = sum(self.latencies) / len(self.latencies) if self.latencies else 0.0
+        return (self.cooldown_until > now, average * (1 + self.consecutive_failures))
+
+class RpcPool:
+    """
+    Sends JSON-RPC requests to the healthiest of several endpoints. Failed, timed out
+    or rate-limited requests move on to the next endpoint and put the failing one in a
+    growing cooldown. Reads that take longer than the endpoint's p95 latency are also
+    sent to the next endpoint, and whichever answers first wins.
+    """
+
+    def __init__(self, urls=RPC_URLS, timeout=RPC_TIMEOUT_SECONDS, max_attempts=RPC_MAX_ATTEMPTS, hedge_reads=RPC_HEDGE_READS):
+        # Checked on the first request rather than here, so modules that never reach the node import without one
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.hedge_reads = hedge_reads and len(self.endpoints) > 1
+        self.lock = threading.Lock()
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.hedge_executor = ThreadPoolExecutor(max_workers=RPC_POOL_CONNECTIONS, thread_name_prefix='rpc-hedge') if self.hedge_reads else None
+
+    def ranked(self):
+        now = time.monotonic()
+        with self.lock:
+            return sorted(self.endpoints, key=lambda endpoint: endpoint.score(now))
+
+    def post(self, body, write=False):
+        """Send an encoded JSON-RPC request (single or batch) and return the raw response body."""
+        if not self.endpoints:
+            raise RpcUnavailable("No RPC endpoints configured, set INFURA_URL or RPC_URLS.")
+        ranked = self.ranked()
+        if self.hedge_reads and not write:
+            return self.post_hedged(body, ranked)
+        return self.post_with_failover(body, ranked)
+
+    def post_with_failover(self, body, ranked):
+        last_error = None
+        for attempt in range(self.max_attempts):
+            try:
+                return self.send(ranked[attempt % len(ranked)], body)
+            except requests.exceptions.RequestException as e:
+                last_error = e
+        raise RpcUnavailable(f"All {self.max_attempts} RPC attempts failed, last error: {last_error}")
+
+    def post_hedged(self, body, ranked):
+        primary, backup = ranked[0], ranked[1]
+        delay = max(RPC_HEDGE_MIN_SECONDS, primary.p95() or self.timeout)
+        first = self.hedge_executor.submit(self.send, primary, body)
+        done, _ = wait([first], timeout=delay)
+        if done and first.exception() is None:
+            return first.result()
+
+        # The primary is slow or failed: race it against the next endpoint
+        with self.lock:
+            self.hedges += 1
+        second = self.hedge_executor.submit(self.send, backup, body)
+        pending = {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is second:
+                        with self.lock:
+                            self.hedge_wins += 1
+                    return future.result()
+        # Both failed: fall back to the remaining endpoints
+        return self.post_with_failover(body, ranked[2:] or ranked)
+
+    def send(self, endpoint, body):
+        start = time.monotonic()
+        try:
+            response = endpoint.session.post(endpoint.url, data=body, headers={'Content-Type': 'application/json'}, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            self.record_failure(endpoint)
+            logging.warning(f"RPC request to {endpoint.url} failed: {e}")
+            raise
+        if response.status_code == 429:
+            retry_after = response.headers.get('Retry-After', '')
+            self.record_failure(endpoint, float(retry_after) if retry_after.isdigit() else None)
+            logging.warning(f"RPC endpoint {endpoint.url} is rate limiting requests.")
+            raise requests.exceptions.HTTPError(f"Rate limited by {endpoint.url}", response=response)
+        if response.status_code >= 400:
+            self.record_failure(endpoint)
+            logging.warning(f"RPC request to {endpoint.url} failed with HTTP {response.status_code}.")
+            response.raise_for_status()
+        self.record_success(endpoint, time.monotonic() - start)
+        return response.content
+
+    def record_success(self, endpoint, elapsed):
+        with self.lock:
+            endpoint.requests += 1
+            endpoint.latencies.append(elapsed)
+            endpoint.consecutive_failures = 0
+            endpoint.cooldown_until = 0.0
+
+    def record_failure(self, endpoint, cooldown=None):
+        with self.lock:
+            endpoint.requests += 1
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            if cooldown is None:
+                cooldown = min(RPC_MAX_COOLDOWN_SECONDS, RPC_COOLDOWN_SECONDS * 2 ** (endpoint.consecutive_failures - 1))
+            endpoint.cooldown_until = time.monotonic() + cooldown
+
+    def stats(self):
+        now = time.monotonic()
+        with self.lock:
+            return {
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'endpoints': [
+                    {
+                        'host': urlsplit(endpoint.url).netloc,  # The path may carry an API key
+                        'requests': endpoint.requests,
+                        'failures': endpoint.failures,
+                        'p95_seconds': endpoint.p95(),
+                        'cooling_down': endpoint.cooldown_until > now,
+                    }
+                    for endpoint in self.endpoints
+                ],
+            }
+
+class PooledProvider(JSONBaseProvider):
+    """web3 provider that sends every request through an RpcPool."""
+
+    def __init__(self, pool):
+        super().__init__()
+        self.pool = pool
+
+    @property
+    def endpoint_uri(self):
+        return self.pool.endpoints[0].url
+
+    def make_request(self, method, params):
+        start = time.perf_counter()
+        try:
+            raw_response = self.pool.post(self.encode_rpc_request(method, params), write=method in WRITE_METHODS)
+        finally:
+            record_rpc_request(method, time.perf_counter() - start)
+        return self.decode_rpc_response(raw_response)
+
+# Shared pool and web3 instance used by every module
+rpc_pool = RpcPool()
+web3 = Web3(PooledProvider(rpc_pool))
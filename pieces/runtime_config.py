@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from dotenv import load_dotenv, dotenv_values
+
+# Load environment variables
+load_dotenv()
+
+RUNTIME_CONFIG_ENV_PATH = os.getenv('RUNTIME_CONFIG_ENV_PATH', '.env')  # Re-read when it changes or on POST /config
+RUNTIME_CONFIG_OVERRIDES_PATH = os.getenv('RUNTIME_CONFIG_OVERRIDES_PATH', 'data/runtime_config.json')  # Settings changed through POST /config, kept across restarts
+RUNTIME_CONFIG_WATCH_SECONDS = float(os.getenv('RUNTIME_CONFIG_WATCH_SECONDS', 2))  # How often the .env file is checked for changes; 0 disables the watch
+
+def parse_list(value):
+    if isinstance(value, str):
+        value = value.split(',')
+    return [str(item).strip() for item in value]
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if str(value).strip().lower() not in ('true', 'false'):
+        raise ValueError(f"expected true or false, got {value!r}")
+    return str(value).strip().lower() == 'true'
+
+# Settings that can be changed without a restart, in the units used in .env, and how each is parsed
+RELOADABLE_SETTINGS = {
+    'FILTER_FROM_NAME': parse_list,
+    'FILTER_FROM_ADDRESS': parse_list,
+    'AMOUNT_OF_ETH': float,
+    'PRICE_INCREASE_THRESHOLD': float,  # Percent
+    'PRICE_DECREASE_THRESHOLD': float,  # Percent
+    'NO_CHANGE_THRESHOLD_PERCENT': float,
+    'NO_CHANGE_TIME_MINUTES': int,
+    'MOONBAG': float,  # Percent
+    'MIN_MARKET_CAP': float,  # USD
+    'MAX_MARKET_CAP': float,  # USD
+    'SEND_TELEGRAM_MESSAGES': parse_bool,
+    'ALLOW_MULTIPLE_TRANSACTIONS': parse_bool,
+    'ENABLE_MARKET_CAP_FILTER': parse_bool,
+    'ENABLE_PRICE_CHANGE_CHECKER': parse_bool,
+    'ENABLE_TRADING': parse_bool,
+}
+
+# Used when a setting is in neither .env nor the environment; the switches keep their former hardcoded values
+SETTING_DEFAULTS = {
+    'MOONBAG': '0',
+    'SEND_TELEGRAM_MESSAGES': 'true',
+    'ALLOW_MULTIPLE_TRANSACTIONS': 'true',
+    'ENABLE_MARKET_CAP_FILTER': 'true',
+    'ENABLE_PRICE_CHANGE_CHECKER': 'true',
+    'ENABLE_TRADING': 'false',
+}
+
+def parse_settings(raw):
+    """Parse every reloadable setting from `raw` (text from .env or JSON values); raises ValueError naming the bad ones."""
+    settings = {}
+    errors = []
+    for name, parse in RELOADABLE_SETTINGS.items():
+        value = raw.get(name, SETTING_DEFAULTS.get(name))
+        if value is None:
+            errors.append(f"{name} is not set")
+            continue
+        try:
+            settings[name] = parse(value)
+        except (TypeError, ValueError) as e:
+            errors.append(f"{name}: {e}")
+    if not errors:
+        if len(settings['FILTER_FROM_NAME']) != len(settings['FILTER_FROM_ADDRESS']):
+            errors.append("FILTER_FROM_NAME and FILTER_FROM_ADDRESS must list the same number of entries")
+        if settings['MIN_MARKET_CAP'] > settings['MAX_MARKET_CAP']:
+            errors.append("MIN_MARKET_CAP is above MAX_MARKET_CAP")
+        if not 0 <= settings['MOONBAG'] <= 100:
+            errors.append("MOONBAG must be between 0 and 100")
+        if settings['NO_CHANGE_TIME_MINUTES'] <= 0:
+            errors.append("NO_CHANGE_TIME_MINUTES must be positive")
+    if errors:
+        raise ValueError('; '.join(errors))
+    return settings
+
+def build_snapshot(settings, version):
+    """
+    One immutable configuration version: the settings as given plus the values the bot
+    uses, with percentages converted to fractions and the filter index built from the
+    watchlist, so readers never see a watchlist and an index from different versions.
+    """
+    names, addresses = settings['FILTER_FROM_NAME'], settings['FILTER_FROM_ADDRESS']
+    return {
+        'version': version,
+        'loaded_at': time.time(),
+        'settings': settings,
+        'FILTER_FROM_NAMES': names,
+        'FILTER_FROM_ADDRESSES': addresses,
+        'NAME_TO_ADDRESS': dict(zip(names, addresses)),
+        'FILTER_FROM_NAME_SET': frozenset(names),
+        'FROM_NAME_PRIORITY': {name: rank for rank, name in enumerate(names)},
+        'AMOUNT_OF_ETH': settings['AMOUNT_OF_ETH'],
+        'PRICE_INCREASE_THRESHOLD': settings['PRICE_INCREASE_THRESHOLD'] / 100,  # Convert to fraction
+        'PRICE_DECREASE_THRESHOLD': settings['PRICE_DECREASE_THRESHOLD'] / 100,  # Convert to fraction
+        'NO_CHANGE_THRESHOLD_PERCENT': settings['NO_CHANGE_THRESHOLD_PERCENT'] / 100,  # Convert to fraction
+        'NO_CHANGE_TIME_MINUTES': settings['NO_CHANGE_TIME_MINUTES'],
+        'MOONBAG': settings['MOONBAG'] / 100,  # Convert to fraction
+        'MIN_MARKET_CAP': settings['MIN_MARKET_CAP'],
+        'MAX_MARKET_CAP': settings['MAX_MARKET_CAP'],
+        'SEND_TELEGRAM_MESSAGES': settings['SEND_TELEGRAM_MESSAGES'],
+        'ALLOW_MULTIPLE_TRANSACTIONS': settings['ALLOW_MULTIPLE_TRANSACTIONS'],
+        'ENABLE_MARKET_CAP_FILTER': settings['ENABLE_MARKET_CAP_FILTER'],
+        'ENABLE_PRICE_CHANGE_CHECKER': settings['ENABLE_PRICE_CHANGE_CHECKER'],
+        'ENABLE_TRADING': settings['ENABLE_TRADING'],
+    }
+
+class RuntimeConfig:
+    """
+    The current configuration snapshot. A reload builds and validates a complete new
+    snapshot and swaps it in with one assignment, then calls the listeners, which move
+    open positions onto it; a reload that fails validation changes nothing. Readers take
+    current() once and use that snapshot throughout, so a message is handled under one
+    version. Reloads and listeners run on the event loop, between price updates.
+    """
+
+    def __init__(self, env_path=RUNTIME_CONFIG_ENV_PATH, overrides_path=RUNTIME_CONFIG_OVERRIDES_PATH):
+        self.env_path = env_path
+        self.overrides_path = overrides_path
+        self.snapshot = None
+        self.overrides = None  # Settings changed through POST /config, in .env units
+        self.listeners = []
+        self.env_stamp = None
+
+    def current(self):
+        if self.snapshot is None:
+            # Startup reads the environment as loaded by load_dotenv(), like the former module constants
+            self.overrides = self.load_overrides()
+            self.env_stamp = self.stamp()
+            self.snapshot = build_snapshot(parse_settings({**os.environ, **self.overrides}), 1)
+        return self.snapshot
+
+    def add_listener(self, listener):
+        """Call `listener(previous, snapshot)` after every change of the snapshot."""
+        self.listeners.append(listener)
+
+    def stamp(self):
+        try:
+            stat = os.stat(self.env_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def load_overrides(self):
+        try:
+            with open(self.overrides_path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not read the runtime config overrides in {self.overrides_path}: {e}")
+            return {}
+
+    def save_overrides(self, overrides):
+        directory = os.path.dirname(self.overrides_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.overrides_path + '.tmp', 'w') as file:
+            json.dump(overrides, file, indent=2)
+        os.replace(self.overrides_path + '.tmp', self.overrides_path)
+
+    def reload(self, changes=None):
+        """
+        Re-read the .env file, which wins over the environment the process started with,
+        apply the settings changed through POST /config and then `changes`, and switch to
+        the result. Raises ValueError, keeping the current snapshot, when it is invalid.
+        """
+        previous = self.current()
+        self.env_stamp = self.stamp()
+        if changes:
+            unknown = set(changes) - set(RELOADABLE_SETTINGS)
+            if unknown:
+                raise ValueError(f"Not reloadable: {', '.join(sorted(unknown))}")
+        overrides = {**self.overrides, **(changes or {})}
+        settings = parse_settings({**os.environ, **dotenv_values(self.env_path), **overrides})
+        if changes:
+            self.save_overrides(overrides)
+            self.overrides = overrides
+        if settings == previous['settings']:
+            return previous
+        return self.switch(build_snapshot(settings, previous['version'] + 1))
+
+    def apply(self, settings, version):
+        """Switch to a snapshot built elsewhere, e.g. the server's configuration sent to a monitor worker."""
+        previous = self.current()
+        if version == previous['version'] and settings == previous['settings']:
+            return previous
+        return self.switch(build_snapshot(parse_settings(settings), version))
+
+    def switch(self, snapshot):
+        previous, self.snapshot = self.snapshot, snapshot
+        changed = sorted(name for name, value in snapshot['settings'].items() if previous['settings'].get(name) != value)
+        logging.info(f"Runtime configuration version {snapshot['version']} in effect, changed: {', '.join(changed) or 'nothing'}.")
+        for listener in self.listeners:
+            try:
+                listener(previous, snapshot)
+            except Exception as e:
+                logging.error(f"Runtime configuration listener failed: {e}")
+        return snapshot
+
+    async def watch(self, interval=RUNTIME_CONFIG_WATCH_SECONDS):
+        """Reload whenever the .env file changes."""
+        self.current()
+        while True:
+            await asyncio.sleep(interval)
+            if self.stamp() == self.env_stamp:
+                continue
+            try:
+                self.reload()
+            except ValueError as e:
+                logging.error(f"Ignoring the changed {self.env_path}, keeping configuration version {self.snapshot['version']}: {e}")
+
+    def describe(self):
+        snapshot = self.current()
+        return {'version': snapshot['version'], 'loaded_at': snapshot['loaded_at'], 'settings': snapshot['settings'], 'overrides': self.overrides}
+
+# Shared runtime configuration
+runtime_config = RuntimeConfig()
@@ -0,0 +1,337 @@
+import os
+import json
+import time
+import bisect
+import asyncio
+import hashlib
+import logging
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+MONITOR_WORKERS = int(os.getenv('MONITOR_WORKERS', 0))  # Monitor worker processes; 0 monitors every position in the server process
+MONITOR_SOCKET_PATH = os.getenv('MONITOR_SOCKET_PATH', 'data/monitor.sock')  # Unix socket the monitor workers connect to
+MONITOR_RING_REPLICAS = int(os.getenv('MONITOR_RING_REPLICAS', 64))  # Points per worker on the hash ring
+MONITOR_HEARTBEAT_SECONDS = float(os.getenv('MONITOR_HEARTBEAT_SECONDS', 2))  # How often workers report in
+MONITOR_HEARTBEAT_TIMEOUT_SECONDS = float(os.getenv('MONITOR_HEARTBEAT_TIMEOUT_SECONDS', 15))  # Silence after which a worker is killed and its positions moved
+MONITOR_RESPAWN_DELAY_SECONDS = float(os.getenv('MONITOR_RESPAWN_DELAY_SECONDS', 1))  # Base delay before a dead worker is started again, doubled per crash
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+class HashRing:
+    """
+    Consistent hash ring of worker indexes. Each worker owns `replicas` points, so
+    removing one only moves the keys it owned, spread over the remaining workers.
+    """
+
+    def __init__(self, replicas=MONITOR_RING_REPLICAS):
+        self.replicas = replicas
+        self.points = []  # Sorted ring positions
+        self.owners = {}  # ring position -> worker
+
+    def __len__(self):
+        return len(set(self.owners.values()))
+
+    def add(self, worker):
+        for replica in range(self.replicas):
+            point = ring_hash(f'{worker}#{replica}')
+            if point not in self.owners:
+                bisect.insort(self.points, point)
+            self.owners[point] = worker
+
+    def remove(self, worker):
+        self.points = [point for point in self.points if self.owners[point] != worker]
+        self.owners = {point: self.owners[point] for point in self.points}
+
+    def owner(self, key):
+        """The worker owning `key`, or None when the ring is empty."""
+        if not self.points:
+            return None
+        index = bisect.bisect(self.points, ring_hash(key)) % len(self.points)
+        return self.owners[self.points[index]]
+
+# Messages are JSON objects, one per line
+
+def write_message(writer, message):
+    writer.write(json.dumps(message).encode() + b'\n')
+
+async def read_message(reader):
+    """The next message, or None once the other side has closed the connection."""
+    line = await reader.readline()
+    return json.loads(line) if line else None
+
+class ShardCoordinator:
+    """
+    Runs in the webhook server and spreads open positions over monitor worker processes.
+    A position goes to the worker that owns its token on a consistent hash ring, so all
+    positions of a token share one price subscription. Workers send exit decisions back
+    over a Unix socket and the server executes them, keeping the wallet and its nonces in
+    one process. When a worker dies its positions move to the others, resuming from the
+    no-change windows in the position store, and the worker is started again.
+    """
+
+    def __init__(self, worker_count, worker_command, on_exit, load_restored, socket_path=MONITOR_SOCKET_PATH):
+        self.worker_count = worker_count
+        self.worker_command = worker_command  # index -> argv of a worker process
+        self.on_exit = on_exit  # async (position_id, details, exit) called when a worker reports an exit
+        self.load_restored = load_restored  # () -> dict of position_id to the stored (rules, window) of open positions
+        self.socket_path = socket_path
+        self.ring = HashRing()
+        self.workers = {}  # index -> {'writer', 'positions', 'last_seen', 'stats'} of connected workers
+        self.processes = {}  # index -> asyncio.subprocess.Process
+        self.restarts = {}  # index -> times the worker process was started again
+        self.positions = {}  # position_id -> {'details', 'restored', 'worker'}
+        self.token_workers = {}  # lowercase token address -> worker monitoring its positions
+        self.config = None  # Latest configuration message, sent to every worker before its positions
+        self.server = None
+        self.tasks = set()
+        self.started_at = None
+        self.ready = False  # Set once every worker has connected, or the startup grace period is over
+        self.stopping = False
+
+    def start_task(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def start(self):
+        directory = os.path.dirname(self.socket_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.server = await asyncio.start_unix_server(self.handle_worker, self.socket_path)
+        self.started_at = time.monotonic()
+        for index in range(self.worker_count):
+            self.start_task(self.run_worker_process(index))
+        self.start_task(self.watch_heartbeats())
+        logging.info(f"Monitoring positions in {self.worker_count} worker processes over {self.socket_path}.")
+
+    async def run_worker_process(self, index):
+        self.restarts[index] = 0
+        while not self.stopping:
+            process = await asyncio.create_subprocess_exec(*self.worker_command(index))
+            self.processes[index] = process
+            return_code = await process.wait()
+            if self.stopping:
+                return
+            delay = MONITOR_RESPAWN_DELAY_SECONDS * (2 ** min(self.restarts[index], 6))
+            self.restarts[index] += 1
+            logging.error(f"Monitor worker {index} exited with code {return_code}, starting it again in {delay:.1f}s.")
+            await asyncio.sleep(delay)
+
+    async def handle_worker(self, reader, writer):
+        hello = await read_message(reader)
+        if not hello or hello.get('type') != 'hello' or self.stopping:
+            writer.close()
+            return
+        index = hello['worker']
+        if index in self.workers:
+            self.lose_worker(index)
+        self.workers[index] = {'writer': writer, 'positions': set(), 'last_seen': time.monotonic(), 'stats': {}}
+        if self.config is not None:
+            write_message(writer, self.config)
+        self.ring.add(index)
+        logging.info(f"Monitor worker {index} connected (pid {hello.get('pid')}).")
+        if len(self.workers) == self.worker_count:
+            self.ready = True
+        self.assign_pending()
+        try:
+            while True:
+                message = await read_message(reader)
+                if message is None:
+                    break
+                worker = self.workers.get(index)
+                if worker is None or worker['writer'] is not writer:
+                    break
+                worker['last_seen'] = time.monotonic()
+                if message['type'] == 'heartbeat':
+                    worker['stats'] = message['stats']
+                elif message['type'] == 'exit':
+                    self.finish(index, message['position_id'], message['exit'])
+                elif message['type'] == 'closed':
+                    self.finish(index, message['position_id'], None, gave_up=True)
+        except (ConnectionError, ValueError) as e:
+            logging.error(f"Monitor worker {index} connection failed: {e}")
+        finally:
+            worker = self.workers.get(index)
+            if worker is not None and worker['writer'] is writer:
+                self.lose_worker(index)
+            writer.close()
+
+    def route(self, token_address):
+        """The worker for a token: the one already monitoring it, otherwise its owner on the ring."""
+        if not self.ready:
+            # Restored positions would all go to the first worker to connect
+            return None
+        token_key = token_address.lower()
+        worker = self.token_workers.get(token_key)
+        if worker not in self.workers:
+            worker = self.ring.owner(token_key)
+            if worker is None:
+                return None
+            self.token_workers[token_key] = worker
+        return worker
+
+    def open(self, position_id, details, restored=None):
+        """Monitor a position in a worker; `restored` is its stored (rules, window) after a restart."""
+        if self.stopping:
+            raise RuntimeError("Shard coordinator is stopping, not accepting new positions.")
+        if position_id in self.positions:
+            raise ValueError(f"Position {position_id} is already being monitored.")
+        self.positions[position_id] = {'details': details, 'restored': restored, 'worker': None}
+        self.assign(position_id)
+
+    def assign(self, position_id):
+        position = self.positions[position_id]
+        index = self.route(position['details']['token_address'])
+        if index is None:
+            # Sent once a worker connects
+            position['worker'] = None
+            return
+        position['worker'] = index
+        worker = self.workers[index]
+        worker['positions'].add(position_id)
+        write_message(worker['writer'], {'type': 'open', 'position_id': position_id, 'details': position['details'], 'restored': position['restored']})
+
+    def assign_pending(self):
+        for position_id, position in self.positions.items():
+            if position['worker'] is None:
+                self.assign(position_id)
+
+    def release(self, position_id):
+        position = self.positions.pop(position_id)
+        worker = self.workers.get(position['worker'])
+        if worker is not None:
+            worker['positions'].discard(position_id)
+        token_key = position['details']['token_address'].lower()
+        if not any(other['details']['token_address'].lower() == token_key for other in self.positions.values()):
+            self.token_workers.pop(token_key, None)
+        return position
+
+    def finish(self, index, position_id, exit, gave_up=False):
+        position = self.positions.get(position_id)
+        if position is None or position['worker'] != index:
+            # Cancelled, already finished, or moved to another worker in the meantime
+            return
+        position = self.release(position_id)
+        if gave_up:
+            logging.error(f"Monitoring {position_id[:8]} — Worker {index} gave up monitoring the position.")
+            return
+        self.start_task(self.on_exit(position_id, position['details'], exit))
+
+    def cancel(self, position_id):
+        position = self.positions.get(position_id)
+        if position is None:
+            return False
+        self.release(position_id)
+        worker = self.workers.get(position['worker'])
+        if worker is not None:
+            write_message(worker['writer'], {'type': 'cancel', 'position_id': position_id})
+        return True
+
+    def set_config(self, message):
+        """Send a configuration message to every worker now and to workers that connect later."""
+        self.config = message
+        for worker in self.workers.values():
+            write_message(worker['writer'], message)
+
+    def send_rules(self, position_id, overrides):
+        """Forward per-position rule overrides to the worker monitoring the position; returns that worker, or None."""
+        position = self.positions.get(position_id)
+        worker = self.workers.get(position['worker']) if position is not None else None
+        if worker is None:
+            return None
+        write_message(worker['writer'], {'type': 'rules', 'position_id': position_id, 'overrides': overrides})
+        return position['worker']
+
+    def send_token_amount(self, position_id, token_amount):
+        """Correct a position's token amount here and in the worker monitoring it; returns that worker, or None."""
+        position = self.positions.get(position_id)
+        if position is None:
+            return None
+        # A worker the position is assigned to later gets it with the details
+        position['details']['token_amount'] = token_amount
+        worker = self.workers.get(position['worker'])
+        if worker is None:
+            return None
+        write_message(worker['writer'], {'type': 'amount', 'position_id': position_id, 'token_amount': token_amount})
+        return position['worker']
+
+    def lose_worker(self, index):
+        worker = self.workers.pop(index)
+        self.ring.remove(index)
+        self.token_workers = {token_key: owner for token_key, owner in self.token_workers.items() if owner != index}
+        orphans = [position_id for position_id in worker['positions'] if position_id in self.positions]
+        if orphans and not self.stopping:
+            logging.error(f"Monitor worker {index} lost, moving its {len(orphans)} positions to {len(self.workers)} other workers.")
+            self.start_task(self.rebalance(index, orphans))
+
+    async def rebalance(self, index, position_ids):
+        """Reassign the positions of a lost worker, resuming from the windows it last saved."""
+        stored = await asyncio.to_thread(self.load_restored)
+        for position_id in position_ids:
+            position = self.positions.get(position_id)
+            if position is None or position['worker'] != index:
+                continue
+            if position_id in stored:
+                position['restored'] = stored[position_id]
+            self.assign(position_id)
+
+    async def watch_heartbeats(self):
+        while not self.stopping:
+            await asyncio.sleep(MONITOR_HEARTBEAT_SECONDS)
+            now = time.monotonic()
+            if not self.ready and self.workers and now - self.started_at > MONITOR_HEARTBEAT_TIMEOUT_SECONDS:
+                logging.error(f"Only {len(self.workers)} of {self.worker_count} monitor workers connected, assigning positions to them.")
+                self.ready = True
+                self.assign_pending()
+            for index, worker in list(self.workers.items()):
+                if now - worker['last_seen'] > MONITOR_HEARTBEAT_TIMEOUT_SECONDS:
+                    logging.error(f"Monitor worker {index} sent nothing for {now - worker['last_seen']:.0f}s, killing it.")
+                    process = self.processes.get(index)
+                    if process is not None and process.returncode is None:
+                        process.kill()
+                    worker['writer'].close()
+
+    def open_positions(self):
+        return [{'id': position_id, 'worker': position['worker'], **position['details']} for position_id, position in self.positions.items()]
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            'workers': {
+                index: {
+                    'pid': self.processes[index].pid if index in self.processes else None,
+                    'restarts': self.restarts.get(index, 0),
+                    'positions': len(worker['positions']),
+                    'last_seen_seconds_ago': now - worker['last_seen'],
+                    **worker['stats'],
+                }
+                for index, worker in self.workers.items()
+            },
+            'positions': len(self.positions),
+            'unassigned': sum(1 for position in self.positions.values() if position['worker'] is None),
+        }
+
+    async def stop(self, timeout=10):
+        """Disconnect the workers, which makes them exit; open positions stay in the position store."""
+        self.stopping = True
+        for task in list(self.tasks):
+            task.cancel()
+        # Workers still starting up cannot connect any more and exit too
+        if self.server is not None:
+            self.server.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        for worker in self.workers.values():
+            worker['writer'].close()
+        processes = [process for process in self.processes.values() if process.returncode is None]
+        if processes:
+            await asyncio.wait([asyncio.create_task(process.wait()) for process in processes], timeout=timeout)
+            for process in processes:
+                if process.returncode is None:
+                    process.kill()
@@ -1,45 +1,152 @@
 import requests
 import re
+import time
+import queue
 import logging
+import threading
 import os
 
 # Load environment variables
 from dotenv import load_dotenv
+from pieces.metrics import timed
 load_dotenv()
 
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
-SEND_TELEGRAM_MESSAGES = True  # Set to True to enable sending Telegram messages
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')  # Point at a local stub server for testing
+TELEGRAM_MESSAGES_PER_SECOND = float(os.getenv('TELEGRAM_MESSAGES_PER_SECOND', 1))  # Per chat
+TELEGRAM_MAX_RETRIES = int(os.getenv('TELEGRAM_MAX_RETRIES', 5))
+TELEGRAM_COALESCE = os.getenv('TELEGRAM_COALESCE', 'true').lower() == 'true'  # Merge queued messages into one digest
 
-def send_telegram_message(message):
-    """
-    Sends a message to the configured Telegram chat.
-    """
-    if not SEND_TELEGRAM_MESSAGES:
-        logging.info("Sending Telegram messages is disabled.")
-        logging.info(f"Message that would be sent: {message}")
-        return
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+DIGEST_SEPARATOR = '\n\n———\n\n'
 
-    url = f'https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage'
-    
+def escape_markdown(message):
     # Escape special characters for MarkdownV2
     escape_chars = r'\_~`>#+-=|{}.!'
-    escaped_message = re.sub(f'([{re.escape(escape_chars)}])', r'\\\1', message)
+    return re.sub(f'([{re.escape(escape_chars)}])', r'\\\1', message)
+
+def parse_retry_after(response, default):
+    """Seconds to wait from a 429 response's retry_after, or `default` if the body does not say."""
+    try:
+        return float(response.json()['parameters']['retry_after'])
+    except (ValueError, TypeError, KeyError):
+        return default
 
-    data = {
-        'chat_id': TELEGRAM_CHAT_ID,
-        'text': escaped_message,
-        'parse_mode': 'MarkdownV2',
-        'disable_web_page_preview': True
-    }
+class TelegramDispatcher:
+    """
+    Delivers Telegram messages from a background thread so callers never wait on the
+    Telegram API. Messages are rate limited per chat, retried with backoff (honouring
+    429 retry_after), and bursts queued for the same chat can be merged into a digest.
+    """
 
-    logging.info(f"Sending Telegram message!")
+    def __init__(self, bot_token=TELEGRAM_BOT_TOKEN, api_url=TELEGRAM_API_URL, messages_per_second=TELEGRAM_MESSAGES_PER_SECOND,
+                 max_retries=TELEGRAM_MAX_RETRIES, coalesce=TELEGRAM_COALESCE):
+        self.url = f'{api_url}/bot{bot_token}/sendMessage'
+        self.min_interval = 1 / messages_per_second
+        self.max_retries = max_retries
+        self.coalesce = coalesce
+        self.session = requests.Session()
+        self.queue = queue.Queue()
+        self.next_send_at = {}  # chat_id -> monotonic time of the next allowed send
+        self.thread = None
+        self.lock = threading.Lock()
 
-    try:
-        response = requests.post(url, data=data)
-        response.raise_for_status()
-        logging.info(f"Telegram response: {response.json()}")
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error sending message to Telegram: {e}")
-        if response is not None:
-            logging.error(f"Response content: {response.content}")
+    def send(self, message, chat_id=TELEGRAM_CHAT_ID):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='telegram', daemon=True)
+                self.thread.start()
+        self.queue.put((chat_id, message))
+
+    def run(self):
+        while True:
+            chat_id, message = self.queue.get()
+            if chat_id is None:
+                self.queue.task_done()
+                return
+            messages = [message]
+            if self.coalesce:
+                messages.extend(self.drain_chat(chat_id, len(message)))
+            try:
+                self.deliver(chat_id, DIGEST_SEPARATOR.join(messages))
+            except Exception as e:
+                # Keep the thread alive, or every later message would be dropped
+                logging.error(f"Dropping {len(messages)} Telegram messages after an unexpected error: {e}")
+            finally:
+                for _ in messages:
+                    self.queue.task_done()
+
+    def drain_chat(self, chat_id, length):
+        """Take further queued messages for the same chat while they fit into one Telegram message."""
+        merged = []
+        with self.queue.mutex:
+            pending = self.queue.queue
+            while pending and pending[0][0] == chat_id:
+                next_message = pending[0][1]
+                length += len(DIGEST_SEPARATOR) + len(next_message)
+                if length > TELEGRAM_MAX_MESSAGE_LENGTH:
+                    break
+                merged.append(pending.popleft()[1])
+        return merged
+
+    def deliver(self, chat_id, message):
+        data = {
+            'chat_id': chat_id,
+            'text': escape_markdown(message),
+            'parse_mode': 'MarkdownV2',
+            'disable_web_page_preview': True
+        }
+
+        for attempt in range(self.max_retries + 1):
+            self.wait_for_rate_limit(chat_id)
+            response = None
+            try:
+                with timed('telegram_send'):
+                    response = self.session.post(self.url, data=data, timeout=10)
+                if response.status_code == 429:
+                    retry_after = parse_retry_after(response, 2 ** attempt)
+                    logging.warning(f"Telegram rate limit hit, retrying in {retry_after}s.")
+                    self.next_send_at[chat_id] = time.monotonic() + retry_after
+                    continue
+                response.raise_for_status()
+                logging.info(f"Telegram response: {response.text}")
+                return True
+            except requests.exceptions.RequestException as e:
+                logging.error(f"Error sending message to Telegram: {e}")
+                if response is not None:
+                    logging.error(f"Response content: {response.content}")
+                    if 400 <= response.status_code < 500:
+                        return False  # The message itself was rejected, retrying will not help
+                self.next_send_at[chat_id] = time.monotonic() + 2 ** attempt
+
+        logging.error(f"Giving up on Telegram message after {self.max_retries + 1} attempts.")
+        return False
+
+    def wait_for_rate_limit(self, chat_id):
+        now = time.monotonic()
+        send_at = max(now, self.next_send_at.get(chat_id, now))
+        if send_at > now:
+            time.sleep(send_at - now)
+        self.next_send_at[chat_id] = send_at + self.min_interval
+
+    def flush(self, timeout=None):
+        """Wait until every queued message has been delivered or given up on."""
+        if self.thread is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+# Shared dispatcher used by send_telegram_message
+telegram_dispatcher = TelegramDispatcher()
+
+def send_telegram_message(message):
+    """
+    Queues a message for the configured Telegram chat and returns immediately.
+    """
+    logging.info(f"Queueing Telegram message!")
+    telegram_dispatcher.send(message)
@@ -1,4 +1,5 @@
 import re
+from decimal import Decimal
 
 def insert_zero_width_space(text):
     """
@@ -23,3 +24,7 @@ def insert_zero_width_space(text):
     text = re.sub(pattern_preceding_dot, insert_spaces_preceding_dot, text)
     
     return text
+
+def format_token_amount(amount, decimals):
+    """An integer amount of a token's base units in whole tokens, with every digit and no exponent."""
+    return format(Decimal(amount).scaleb(-decimals).normalize(), 'f')
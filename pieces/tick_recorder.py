@@ -0,0 +1,129 @@
+import os
+import logging
+import threading
+import numpy as np
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from pieces.position_table import EXIT_PRICE_INCREASE, EXIT_PRICE_DECREASE, EXIT_NO_CHANGE
+
+# Load environment variables
+load_dotenv()
+
+TICK_RECORDER_DIR = os.getenv('TICK_RECORDER_DIR', 'data/ticks')  # One directory per UTC day, one file per token
+TICK_SEGMENT_ROWS = int(os.getenv('TICK_SEGMENT_ROWS', 131072))  # Rows preallocated per segment file; a full segment continues in a new part
+
+TICK_DTYPE = np.dtype([
+    ('timestamp', 'f8'),  # Epoch seconds; unused rows hold +inf so written rows are found with a binary search
+    ('price', 'f8'),  # ETH per token, NaN when the token could not be priced
+    ('venue', 'S20'),  # Raw address of the pair/pool the price was read from
+    ('decision', 'i1'),  # DECISION_* of the token's positions on this tick
+])
+
+DECISION_HOLD = 0
+DECISION_CODES = {EXIT_PRICE_INCREASE: 1, EXIT_PRICE_DECREASE: 2, EXIT_NO_CHANGE: 3}
+
+def segment_day(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y%m%d')
+
+def segment_path(directory, day, token_address, part):
+    suffix = f'.{part}' if part else ''
+    return os.path.join(directory, day, f'{token_address.lower()}{suffix}.npy')
+
+def address_bytes(address):
+    return bytes.fromhex(address[2:]) if address else b''
+
+class TickRecorder:
+    """
+    Records every price tick into memory-mapped NumPy segments, one per token and UTC
+    day. Writing a tick is a store into the mapped array, and a token's history is read
+    back as a view of the file, without parsing or copying.
+    """
+
+    def __init__(self, directory=TICK_RECORDER_DIR, segment_rows=TICK_SEGMENT_ROWS):
+        self.directory = directory
+        self.segment_rows = segment_rows
+        self.segments = {}  # lowercase token address -> [day, part, memmap, next row]
+        self.lock = threading.Lock()
+
+    def record(self, timestamp, prices, venues=None, decisions=None):
+        """
+        Append one tick: `prices` maps token address to price, `venues` lowercase token
+        address to the pair/pool address it was priced from and `decisions` lowercase
+        token address to an exit reason of one of its positions.
+        """
+        venues = venues or {}
+        decisions = decisions or {}
+        day = segment_day(timestamp)
+        with self.lock:
+            for token_address, price in prices.items():
+                try:
+                    token_key = token_address.lower()
+                    segment = self.segment(token_key, day)
+                    row = segment[3]
+                    segment[2][row] = (
+                        timestamp, np.nan if price is None else price, address_bytes(venues.get(token_key)),
+                        DECISION_CODES.get(decisions.get(token_key), DECISION_HOLD),
+                    )
+                    segment[3] = row + 1
+                except OSError as e:
+                    logging.error(f"Could not record the price tick of {token_address}: {e}")
+
+    def segment(self, token_key, day):
+        segment = self.segments.get(token_key)
+        if segment is not None and segment[0] == day and segment[3] < self.segment_rows:
+            return segment
+        if segment is not None:
+            segment[2].flush()
+        part = segment[1] + 1 if segment is not None and segment[0] == day else 0
+        segment = self.open_segment(token_key, day, part)
+        self.segments[token_key] = segment
+        return segment
+
+    def open_segment(self, token_key, day, part):
+        # Continue the last part of the day that still has room, e.g. after a restart
+        while True:
+            path = segment_path(self.directory, day, token_key, part)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                rows = np.lib.format.open_memmap(path, mode='w+', dtype=TICK_DTYPE, shape=(self.segment_rows,))
+                rows['timestamp'] = np.inf
+                return [day, part, rows, 0]
+            rows = np.load(path, mmap_mode='r+')
+            used = written_rows(rows)
+            if used < len(rows):
+                return [day, part, rows, used]
+            part += 1
+
+    def flush(self):
+        with self.lock:
+            for segment in self.segments.values():
+                segment[2].flush()
+
+    def forget(self, token_address):
+        """Close a token's segment once it is no longer priced."""
+        with self.lock:
+            segment = self.segments.pop(token_address.lower(), None)
+            if segment is not None:
+                segment[2].flush()
+
+def written_rows(rows):
+    return int(np.searchsorted(rows['timestamp'], np.inf))
+
+def load_token_history(token_address, day=None, directory=TICK_RECORDER_DIR):
+    """
+    A token's recorded ticks for one UTC day ('YYYYMMDD', default today), as read-only
+    views of the memory-mapped segments: one structured array per segment part.
+    """
+    day = day or segment_day(datetime.now(timezone.utc).timestamp())
+    history = []
+    part = 0
+    while True:
+        path = segment_path(directory, day, token_address, part)
+        if not os.path.exists(path):
+            return history
+        rows = np.load(path, mmap_mode='r')
+        history.append(rows[:written_rows(rows)])
+        part += 1
+
+# Shared recorder of the server's price ticks
+tick_recorder = TickRecorder()
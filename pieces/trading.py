@@ -1,124 +1,182 @@
 import os
-import json
+import time
 import logging
+import threading
 from web3 import Web3
 from dotenv import load_dotenv
 from eth_account import Account
 from datetime import datetime, timedelta, timezone
+from pieces.async_rpc import record_latency
+from pieces.metrics import timed
+from pieces.rpc import web3
+from pieces.contracts import contract
+from pieces.nonce_manager import NonceManager
+from pieces.fee_oracle import FeeOracle
 
 # Load environment variables
 load_dotenv()
 
-# Initialize web3
-INFURA_URL = os.getenv('INFURA_URL')
-web3 = Web3(Web3.HTTPProvider(INFURA_URL))
-
 # Wallet details
 WALLET_PRIVATE_KEY = os.getenv('WALLET_PRIVATE_KEY')
-WALLET_ADDRESS = web3.eth.account.from_key(WALLET_PRIVATE_KEY).address
 
 # Uniswap Router address
-UNISWAP_V2_ROUTER_ADDRESS = '0x7a250d5630b4cf539739df2c5dacf5b4c659f248'  # Uniswap V2 Router
-UNISWAP_V3_ROUTER_ADDRESS = '0xE592427A0AEce92De3Edee1F18E0157C05861564'  # Uniswap V3 Router
-
-# Load ABIs
-with open('abis/IUniswapV2Router02.json') as file:
-    uniswap_v2_router_abi = json.load(file)["abi"]
-with open('abis/IUniswapV3Router.json') as file:
-    uniswap_v3_router_abi = json.load(file)
+UNISWAP_V2_ROUTER_ADDRESS = '0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D'  # Uniswap V2 Router
 
 # Create contract instances
-uniswap_v2_router = web3.eth.contract(address=Web3.to_checksum_address(UNISWAP_V2_ROUTER_ADDRESS), abi=uniswap_v2_router_abi)
-uniswap_v3_router = web3.eth.contract(address=Web3.to_checksum_address(UNISWAP_V3_ROUTER_ADDRESS), abi=uniswap_v3_router_abi)
+uniswap_v2_router = contract(web3, 'IUniswapV2Router02', Web3.to_checksum_address(UNISWAP_V2_ROUTER_ADDRESS))
 
 # Constants
 WETH_ADDRESS = '0xC02aaA39b223FE8D0A0E5C4F27eAD9083C756Cc2'
-
-def buy_token(token_address, amount_eth):
+MAX_UINT256 = 2 ** 256 - 1
+TRANSFER_TOPIC = '0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef'  # Transfer(address,address,uint256)
+BUY_GAS_LIMIT = 2000000
+SELL_GAS_LIMIT = 2000000
+APPROVE_GAS_LIMIT = 100000
+
+# Byte offsets of the fields patched into a pre-built swapExactTokensForETH calldata
+AMOUNT_IN_OFFSET = 4
+AMOUNT_OUT_MIN_OFFSET = 36
+DEADLINE_OFFSET = 132
+
+# Exit readiness: tokens already approved for the router and their pre-built sell calldata
+approved_tokens = set()
+sell_templates = {}  # lowercase token address -> bytearray calldata with amount/deadline left blank
+exit_lock = threading.Lock()
+chain_id = None
+wallet_address = None
+
+# Local nonce allocation and EIP-1559 fees, so building a transaction needs no RPC reads
+nonce_manager = NonceManager(web3, lambda: get_wallet_address())
+fee_oracle = FeeOracle(web3)
+
+def get_chain_id():
+    global chain_id
+    if chain_id is None:
+        chain_id = web3.eth.chain_id
+    return chain_id
+
+def tokens_received(logs, token_address, recipient):
+    """Raw amount of `token_address` transferred to `recipient` by a transaction, from its receipt logs."""
+    token = token_address.lower()
+    to_topic = '0x' + recipient.lower()[2:].rjust(64, '0')
+    return sum(
+        int(log['data'], 16) if log['data'] != '0x' else 0
+        for log in logs
+        if log['address'].lower() == token and len(log['topics']) == 3
+        and log['topics'][0] == TRANSFER_TOPIC and log['topics'][2].lower() == to_topic
+    )
+
+def get_wallet_address():
+    # Derived on first use, so importing this module needs no key
+    global wallet_address
+    if wallet_address is None:
+        if not WALLET_PRIVATE_KEY:
+            raise ValueError("WALLET_PRIVATE_KEY is not set.")
+        wallet_address = Account.from_key(WALLET_PRIVATE_KEY).address
+    return wallet_address
+
+def send_transaction(txn):
+    """Fill in nonce, fees and chain id, then sign and broadcast. Returns the transaction hash."""
+    txn = dict(txn, nonce=nonce_manager.reserve(), chainId=get_chain_id(), **fee_oracle.fees())
+    txn['from'] = get_wallet_address()
+    with timed('sign'):
+        signed_txn = web3.eth.account.sign_transaction(txn, private_key=WALLET_PRIVATE_KEY)
+    try:
+        with timed('broadcast'):
+            return web3.eth.send_raw_transaction(signed_txn.rawTransaction)
+    except Exception as e:
+        nonce_manager.resync(txn['nonce'], e)
+        raise
+
+def buy_token(token_address, amount_eth, amount_out_min=0):
+    """Buys the token for `amount_eth` ETH, reverting if fewer than `amount_out_min` raw token units come out."""
     # Determine transaction parameters
     deadline = int((datetime.now(timezone.utc) + timedelta(minutes=10)).timestamp())
-    amount_out_min = 0  # You can set a more realistic amount or use a slippage tolerance mechanism
 
-    # Create transaction
-    txn = uniswap_v2_router.functions.swapExactETHForTokens(
+    # Create transaction; the calldata is encoded locally
+    calldata = uniswap_v2_router.encode_abi(fn_name='swapExactETHForTokens', args=[
         amount_out_min,
-        [WETH_ADDRESS, Web3.to_checksum_address(token_address)],
-        Web3.to_checksum_address(WALLET_ADDRESS),
-        deadline
-    ).buildTransaction({
-        'from': WALLET_ADDRESS,
-        'value': web3.toWei(amount_eth, 'ether'),
-        'gas': 2000000,  # Gas limit
-        'gasPrice': web3.toWei('50', 'gwei'),  # Gas price
-        'nonce': web3.eth.getTransactionCount(WALLET_ADDRESS),
-    })
+        [Web3.to_checksum_address(WETH_ADDRESS), Web3.to_checksum_address(token_address)],
+        get_wallet_address(),
+        deadline,
+    ])
+    txn = {
+        'to': Web3.to_checksum_address(UNISWAP_V2_ROUTER_ADDRESS),
+        'value': web3.to_wei(amount_eth, 'ether'),
+        'data': calldata,
+        'gas': BUY_GAS_LIMIT,  # Gas limit
+    }
 
     # Sign and send the transaction
-    signed_txn = web3.eth.account.sign_transaction(txn, private_key=WALLET_PRIVATE_KEY)
-    tx_hash = web3.eth.sendRawTransaction(signed_txn.rawTransaction)
+    tx_hash = send_transaction(txn)
     
     logging.info(f"Transaction sent with hash: {tx_hash.hex()}")
-    log_transaction_details(tx_hash.hex())
     return tx_hash.hex()
 
-def sell_token(token_address, token_amount):
-    # Approve the Uniswap router to spend the tokens
-    token_contract = web3.eth.contract(address=Web3.to_checksum_address(token_address), abi=uniswap_v2_router_abi)
-    approve_txn = token_contract.functions.approve(
-        UNISWAP_V2_ROUTER_ADDRESS,
-        web3.toWei(token_amount, 'ether')
-    ).buildTransaction({
-        'from': WALLET_ADDRESS,
-        'gas': 100000,  # Gas limit
-        'gasPrice': web3.toWei('50', 'gwei'),  # Gas price
-        'nonce': web3.eth.getTransactionCount(WALLET_ADDRESS),
-    })
-
-    signed_approve_txn = web3.eth.account.sign_transaction(approve_txn, private_key=WALLET_PRIVATE_KEY)
-    approve_tx_hash = web3.eth.sendRawTransaction(signed_approve_txn.rawTransaction)
-    logging.info(f"Approve transaction sent with hash: {approve_tx_hash.hex()}")
-
-    # Wait for the approval to be mined
-    web3.eth.waitForTransactionReceipt(approve_tx_hash)
-
-    # Determine transaction parameters
-    deadline = int((datetime.utcnow() + timedelta(minutes=10)).timestamp())
-    amount_in = web3.toWei(token_amount, 'ether')
-    amount_out_min = 0  # You can set a more realistic amount or use a slippage tolerance mechanism
-
-    # Create transaction
-    txn = uniswap_v2_router.functions.swapExactTokensForETH(
-        amount_in,
-        amount_out_min,
-        [Web3.to_checksum_address(token_address), WETH_ADDRESS],
-        Web3.to_checksum_address(WALLET_ADDRESS),
-        deadline
-    ).buildTransaction({
-        'from': WALLET_ADDRESS,
-        'gas': 2000000,  # Gas limit
-        'gasPrice': web3.toWei('50', 'gwei'),  # Gas price
-        'nonce': web3.eth.getTransactionCount(WALLET_ADDRESS),
-    })
+def prepare_exit(token_address):
+    """
+    Gets a position ready to be sold quickly: makes sure the router may spend the token
+    (approving it once, for the maximum amount) and pre-builds the sell calldata so only
+    the amount and deadline have to be filled in when an exit triggers. Returns the
+    approval's transaction hash if one was sent.
+    """
+    token = Web3.to_checksum_address(token_address)
+    router = Web3.to_checksum_address(UNISWAP_V2_ROUTER_ADDRESS)
+
+    with exit_lock:
+        if token.lower() not in sell_templates:
+            calldata = uniswap_v2_router.encode_abi(fn_name='swapExactTokensForETH', args=[
+                0, 0, [token, Web3.to_checksum_address(WETH_ADDRESS)], get_wallet_address(), 0,
+            ])
+            sell_templates[token.lower()] = bytearray.fromhex(calldata[2:])
+
+        if token.lower() in approved_tokens:
+            return
+
+        token_contract = contract(web3, 'IUniswapV2ERC20', token)
+        allowance = token_contract.functions.allowance(get_wallet_address(), router).call()
+        if allowance < MAX_UINT256 // 2:
+            approve_tx_hash = send_transaction({
+                'to': token,
+                'value': 0,
+                'data': token_contract.encode_abi(fn_name='approve', args=[router, MAX_UINT256]),
+                'gas': APPROVE_GAS_LIMIT,
+            })
+            logging.info(f"Approve transaction sent with hash: {approve_tx_hash.hex()}")
+            approved_tokens.add(token.lower())
+            logging.info(f"Exit ready for {token}.")
+            # No need to wait for it: the sell uses a later nonce, so it can only be mined after the approval
+            return approve_tx_hash.hex()
+        approved_tokens.add(token.lower())
+        logging.info(f"Exit ready for {token}.")
+
+def sell_token(token_address, amount_in, triggered_at=None, amount_out_min=0):
+    """
+    Sells `amount_in` base units of the token for at least `amount_out_min` wei. `triggered_at` is the
+    time.perf_counter() value at which the exit rule fired, used to log trigger-to-broadcast latency.
+    """
+    # Normally done right after the buy; only happens here if that did not finish
+    if token_address.lower() not in approved_tokens:
+        prepare_exit(token_address)
+
+    # Fill in the pre-built calldata
+    deadline = int((datetime.now(timezone.utc) + timedelta(minutes=10)).timestamp())
+    calldata = bytearray(sell_templates[token_address.lower()])
+    calldata[AMOUNT_IN_OFFSET:AMOUNT_IN_OFFSET + 32] = amount_in.to_bytes(32, 'big')
+    calldata[AMOUNT_OUT_MIN_OFFSET:AMOUNT_OUT_MIN_OFFSET + 32] = amount_out_min.to_bytes(32, 'big')
+    calldata[DEADLINE_OFFSET:DEADLINE_OFFSET + 32] = deadline.to_bytes(32, 'big')
+
+    txn = {
+        'to': Web3.to_checksum_address(UNISWAP_V2_ROUTER_ADDRESS),
+        'value': 0,
+        'data': '0x' + calldata.hex(),
+        'gas': SELL_GAS_LIMIT,  # Gas limit
+    }
 
     # Sign and send the transaction
-    signed_txn = web3.eth.account.sign_transaction(txn, private_key=WALLET_PRIVATE_KEY)
-    tx_hash = web3.eth.sendRawTransaction(signed_txn.rawTransaction)
-    
+    tx_hash = send_transaction(txn)
+    if triggered_at is not None:
+        record_latency('trigger_to_broadcast', time.perf_counter() - triggered_at)
+
     logging.info(f"Transaction sent with hash: {tx_hash.hex()}")
-    log_transaction_details(tx_hash.hex())
     return tx_hash.hex()
-
-def log_transaction_details(tx_hash):
-    tx_receipt = web3.eth.getTransactionReceipt(tx_hash)
-    tx = web3.eth.getTransaction(tx_hash)
-
-    logging.info(f"Transaction Details for {tx_hash}:")
-    logging.info(f"  Block Number: {tx_receipt['blockNumber']}")
-    logging.info(f"  Gas Used: {tx_receipt['gasUsed']}")
-    logging.info(f"  Status: {tx_receipt['status']}")
-    logging.info(f"  From: {tx['from']}")
-    logging.info(f"  To: {tx['to']}")
-    logging.info(f"  Value: {web3.fromWei(tx['value'], 'ether')} ETH")
-    logging.info(f"  Gas Price: {web3.fromWei(tx['gasPrice'], 'gwei')} Gwei")
-    logging.info(f"  Nonce: {tx['nonce']}")
-    logging.info(f"  Input Data: {tx['input']}")
@@ -1,22 +1,21 @@
+import os
+import time
 import logging
-from web3 import Web3
-
-def get_uniswap_v2_price(web3, uniswap_v2_factory, token_address, weth_address, token_decimals, uniswap_v2_pair_abi):
-    # Fetch pair address from Uniswap V2 Factory contract
-    pair_address = uniswap_v2_factory.functions.getPair(Web3.to_checksum_address(token_address), Web3.to_checksum_address(weth_address)).call()
-    
-    if pair_address == '0x0000000000000000000000000000000000000000':
-        return None, None
-
-    # Create pair contract instance
-    pair_contract = web3.eth.contract(address=Web3.to_checksum_address(pair_address), abi=uniswap_v2_pair_abi)
-    
-    # Fetch reserves from the pair contract
-    reserves = pair_contract.functions.getReserves().call()
-    reserve_weth, reserve_token = reserves[0], reserves[1]
+import threading
+from dotenv import load_dotenv
+from pieces.multicall import multicall
+from pieces.contracts import contract
+from pieces.address_index import address_index, checksum
 
+# Load environment variables
+load_dotenv()
+
+V3_FEE_TIERS = [100, 500, 3000, 10000]
+VENUE_REEVALUATE_SECONDS = float(os.getenv('VENUE_REEVALUATE_SECONDS', 300))  # How long a token keeps its chosen pair/pool
+
+def v2_price_from_reserves(reserves, token_address, weth_address, token_decimals):
     # Determine which reserve is for WETH and which is for the token
-    if Web3.to_checksum_address(token_address) < Web3.to_checksum_address(weth_address):
+    if token_address.lower() < weth_address.lower():
         reserve_token, reserve_weth = reserves[0], reserves[1]
     else:
         reserve_weth, reserve_token = reserves[0], reserves[1]
@@ -25,31 +24,172 @@ def get_uniswap_v2_price(web3, uniswap_v2_factory, token_address, weth_address,
     adjusted_reserve_token = reserve_token / (10 ** token_decimals)
     adjusted_reserve_weth = reserve_weth / (10 ** 18)
 
+    if adjusted_reserve_token == 0:
+        return None
+
     # Calculate price
-    token_price = adjusted_reserve_weth / adjusted_reserve_token
-    return token_price, pair_address
-
-def get_uniswap_v3_price(web3, uniswap_v3_factory, token_address, weth_address, token_decimals, uniswap_v3_pool_abi):
-    fee_tiers = [500, 3000, 10000]
-    
-    for fee in fee_tiers:
-        try:
-            # Fetch pool address from Uniswap V3 Factory contract
-            pool_address = uniswap_v3_factory.functions.getPool(Web3.to_checksum_address(token_address), Web3.to_checksum_address(weth_address), fee).call()
-            
-            if pool_address != '0x0000000000000000000000000000000000000000':
-                
-                # Create pool contract instance
-                pool_contract = web3.eth.contract(address=Web3.to_checksum_address(pool_address), abi=uniswap_v3_pool_abi)
-                
-                # Fetch slot0 from the pool contract
-                slot0 = pool_contract.functions.slot0().call()
-                sqrtPriceX96 = slot0[0]
-
-                # Calculate token price
-                token_price = (sqrtPriceX96 ** 2 / (2 ** 192)) * (10 ** token_decimals) / (10 ** 18)
-                return token_price, pool_address
-        except Exception as e:
-            logging.error(f"Error fetching Uniswap V3 price for fee tier {fee}: {e}")
-    
-    return None, None
+    return adjusted_reserve_weth / adjusted_reserve_token
+
+def v3_price_from_slot0(slot0, token_address, weth_address, token_decimals):
+    sqrtPriceX96 = slot0[0]
+    if sqrtPriceX96 == 0:
+        return None
+    # sqrtPriceX96 encodes token1 per token0, so invert it when WETH is token0
+    raw_price = sqrtPriceX96 ** 2 / (2 ** 192)
+    if token_address.lower() > weth_address.lower():
+        raw_price = 1 / raw_price
+    return raw_price * (10 ** token_decimals) / (10 ** 18)
+
+def v2_weth_depth(reserves, token_address, weth_address):
+    """WETH held by a V2 pair, in wei."""
+    return reserves[1] if token_address.lower() < weth_address.lower() else reserves[0]
+
+def v3_weth_depth(slot0, liquidity, token_address, weth_address):
+    """WETH side of a V3 pool's virtual reserves at the current price, in wei, comparable to a V2 reserve."""
+    sqrtPriceX96 = slot0[0]
+    if sqrtPriceX96 == 0:
+        return 0
+    if token_address.lower() < weth_address.lower():
+        return liquidity * sqrtPriceX96 // 2 ** 96  # WETH is token1
+    return liquidity * 2 ** 96 // sqrtPriceX96
+
+class VenueSelector:
+    """
+    Picks the pair/pool each token is priced from. Every V2 and V3 candidate is read in
+    one batch and the one holding the most WETH at the current price wins; after that
+    only the chosen venue is read until VENUE_REEVALUATE_SECONDS have passed, or it
+    stops returning a price. The last state read from every venue is kept for quoting.
+    """
+
+    def __init__(self, reevaluate_seconds=VENUE_REEVALUATE_SECONDS):
+        self.reevaluate_seconds = reevaluate_seconds
+        self.chosen = {}  # lowercase token address -> {'kind', 'address', 'fee', 'weth_depth', 'chosen_at'}
+        self.states = {}  # venue address -> {'kind', 'fee', 'reserves' or 'slot0' and 'liquidity', 'read_at'}
+        self.lock = threading.Lock()
+
+    def plan(self, web3, uniswap_v2_factory, uniswap_v3_factory, tokens, weth_address):
+        """
+        Returns (calls, finish): the contract calls needed to price `tokens` (token address
+        to decimals), to be batched by the caller, and finish(results) turning their results
+        into a dict of token address to (price, pair/pool address, 'v2' or 'v3').
+        """
+        weth = checksum(weth_address)
+        now = time.time()
+        with self.lock:
+            chosen = {token_address: self.chosen.get(token_address.lower()) for token_address in tokens}
+        stale = [token_address for token_address, venue in chosen.items() if venue is None or now - venue['chosen_at'] > self.reevaluate_seconds]
+
+        # V2 pair and every V3 fee tier pool of the tokens being (re)evaluated, derived locally
+        candidates = []
+        for token_address in stale:
+            token = checksum(token_address)
+            candidates.append(('v2', uniswap_v2_factory.address, token, weth, None))
+            candidates.extend(('v3', uniswap_v3_factory.address, token, weth, fee) for fee in V3_FEE_TIERS)
+        addresses = address_index.resolve(web3, candidates) if candidates else []
+
+        calls = []
+        reads = {}  # token address -> list of (kind, address, fee, index of first call)
+        stride = 1 + len(V3_FEE_TIERS)
+        for i, token_address in enumerate(stale):
+            reads[token_address] = []
+            for (kind, _, _, _, fee), address in zip(candidates[i * stride:(i + 1) * stride], addresses[i * stride:(i + 1) * stride]):
+                if address is not None:
+                    reads[token_address].append((kind, address, fee, len(calls)))
+                    calls.extend(self.venue_calls(web3, kind, address))
+        for token_address, venue in chosen.items():
+            if token_address not in reads:
+                reads[token_address] = [(venue['kind'], venue['address'], venue['fee'], len(calls))]
+                calls.extend(self.venue_calls(web3, venue['kind'], venue['address']))
+
+        def finish(results):
+            prices = {}
+            for token_address, venue_reads in reads.items():
+                evaluating = token_address in stale
+                best = None
+                for kind, address, fee, index in venue_reads:
+                    self.remember(kind, address, fee, results, index)
+                    price, weth_depth = self.venue_price(kind, results, index, token_address, weth, tokens[token_address])
+                    if price is not None and (best is None or weth_depth > best[1]):
+                        best = (price, weth_depth, kind, address, fee)
+                if best is None:
+                    self.forget(token_address)
+                    prices[token_address] = (None, None, None)
+                    continue
+                price, weth_depth, kind, address, fee = best
+                if evaluating:
+                    self.choose(token_address, kind, address, fee, weth_depth, len(venue_reads))
+                prices[token_address] = (price, address, kind)
+            return prices
+
+        return calls, finish
+
+    def venue_calls(self, web3, kind, address):
+        if kind == 'v2':
+            return [contract(web3, 'IUniswapV2Pair', address).functions.getReserves()]
+        pool_contract = contract(web3, 'IUniswapV3Pool', address)
+        return [pool_contract.functions.slot0(), pool_contract.functions.liquidity()]
+
+    def venue_price(self, kind, results, index, token_address, weth, token_decimals):
+        """Price and WETH depth from a venue's read results."""
+        if kind == 'v2':
+            if results[index] is None:
+                return None, None
+            return v2_price_from_reserves(results[index], token_address, weth, token_decimals), v2_weth_depth(results[index], token_address, weth)
+        if results[index] is None or results[index + 1] is None:
+            return None, None
+        return v3_price_from_slot0(results[index], token_address, weth, token_decimals), v3_weth_depth(results[index], results[index + 1], token_address, weth)
+
+    def remember(self, kind, address, fee, results, index):
+        if kind == 'v2':
+            if results[index] is None:
+                return
+            state = {'kind': kind, 'fee': fee, 'reserves': results[index]}
+        else:
+            if results[index] is None or results[index + 1] is None:
+                return
+            state = {'kind': kind, 'fee': fee, 'slot0': results[index], 'liquidity': results[index + 1]}
+        state['read_at'] = time.time()
+        with self.lock:
+            self.states[address] = state
+
+    def observe(self, address, **fields):
+        """Update the remembered state of a pair/pool from an event, if it has been read before."""
+        address = checksum(address)
+        with self.lock:
+            state = self.states.get(address)
+            if state is not None:
+                self.states[address] = dict(state, read_at=time.time(), **fields)
+
+    def state(self, address):
+        """The last state read from a pair/pool, or None."""
+        with self.lock:
+            return self.states.get(address)
+
+    def choose(self, token_address, kind, address, fee, weth_depth, candidate_count):
+        with self.lock:
+            previous = self.chosen.get(token_address.lower())
+            self.chosen[token_address.lower()] = {'kind': kind, 'address': address, 'fee': fee, 'weth_depth': weth_depth, 'chosen_at': time.time()}
+        if previous is None or previous['address'] != address:
+            tier = f" (fee tier {fee})" if fee is not None else ''
+            logging.info(f"Pricing {token_address} from Uniswap {kind.upper()}{tier} {address}: {weth_depth / 1e18:.4f} WETH deep, best of {candidate_count}.")
+
+    def forget(self, token_address):
+        with self.lock:
+            self.chosen.pop(token_address.lower(), None)
+
+    def venues(self):
+        """The venue each token is currently priced from."""
+        with self.lock:
+            return {token: dict(venue) for token, venue in self.chosen.items()}
+
+# Shared selector used by the batched pricing helpers
+venue_selector = VenueSelector()
+
+def get_uniswap_prices(web3, uniswap_v2_factory, uniswap_v3_factory, tokens, weth_address):
+    """
+    Prices many tokens in one batched round trip, each from the deepest of its V2/V3
+    venues. `tokens` maps token address to decimals; returns a dict of token address to
+    (price, pair/pool address, 'v2' or 'v3').
+    """
+    calls, finish = venue_selector.plan(web3, uniswap_v2_factory, uniswap_v3_factory, tokens, weth_address)
+    return finish(multicall(web3, calls))
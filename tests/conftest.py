@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The bot runs from the repository root, so make `pieces` importable the same way
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -0,0 +1,18 @@
+import os
+
+from web3 import Web3
+
+from pieces import contracts
+from pieces.contracts import ContractRegistry, contract
+
+ROUTER = '0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D'
+ABI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'abis')
+
+def test_abis_are_loaded_on_first_use(monkeypatch, tmp_path):
+    registry = ContractRegistry(abi_dir=ABI_DIR, cache_path=str(tmp_path / 'abi_cache.json'))
+    monkeypatch.setattr(contracts, 'contract_registry', registry)
+    router = contract(Web3(), 'IUniswapV2Router02', ROUTER)
+    assert registry.functions is None
+    calldata = router.encode_abi(fn_name='getAmountsOut', args=[10 ** 18, [ROUTER, ROUTER]])
+    assert calldata.startswith('0xd06ca61f')  # getAmountsOut(uint256,address[])
+    assert set(registry.functions) == set(contracts.ABI_FRAGMENTS)
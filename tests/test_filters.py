@@ -0,0 +1,60 @@
+import pytest
+
+from pieces import filters
+from pieces.filters import filter_message, extract_token_address
+from pieces.replay import select_candidates
+
+TOKEN = '0x' + 'ab' * 20
+UNISWAP_BUY = f'Swapped 0.5 ETH For 1,000,000 TKN https:\\/\\/etherscan.io\\/token\\/{TOKEN} on Uniswap'
+BANANA_GUN_BUY = f'Swapped 0.5 ETH 〈$1,500〉 for 1,000,000 TKN https://etherscan.io/token/{TOKEN}'
+SELL = f'Swapped 1,000,000 TKN https://etherscan.io/token/{TOKEN} For 0.5 ETH on Uniswap'
+
+class ListArchive:
+    def __init__(self):
+        self.records = []
+
+    def write(self, record):
+        self.records.append(record)
+
+@pytest.fixture
+def archive(monkeypatch):
+    archive = ListArchive()
+    monkeypatch.setattr(filters, 'action_text_archive', archive)
+    return archive
+
+@pytest.mark.parametrize('text, from_name, expected', [
+    (UNISWAP_BUY, 'alice', True),
+    (BANANA_GUN_BUY, 'alice', True),
+    (SELL, 'alice', False),
+    (UNISWAP_BUY, 'mallory', False),
+])
+def test_filter_message(archive, text, from_name, expected):
+    assert filter_message({'from_name': from_name, 'action_text': text, 'tx_hash': '0x1'}, {'alice'}) == expected
+
+def test_every_message_is_archived(archive):
+    for text, from_name in [(UNISWAP_BUY, 'alice'), (SELL, 'alice'), (UNISWAP_BUY, 'mallory')]:
+        filter_message({'from_name': from_name, 'action_text': text, 'tx_hash': '0x1'}, {'alice'})
+    assert [(from_name, text) for _, from_name, _, text in archive.records] == [
+        ('alice', UNISWAP_BUY.replace('\\', '')), ('alice', SELL), ('mallory', UNISWAP_BUY.replace('\\', '')),
+    ]
+
+def test_replay_does_not_archive(archive):
+    assert filter_message({'from_name': 'alice', 'action_text': SELL}, {'alice'}, archive=False) is False
+    assert archive.records == []
+
+@pytest.mark.parametrize('text', [UNISWAP_BUY.replace('\\', ''), BANANA_GUN_BUY])
+def test_extract_token_address(text):
+    assert extract_token_address(text) == TOKEN
+
+def test_extract_token_address_of_a_sell():
+    assert extract_token_address(SELL) is None
+
+def test_replay_selects_only_buys_from_followed_senders(archive):
+    messages = [
+        {'timestamp': 1, 'from_name': 'alice', 'tx_hash': '0x1', 'action_text': UNISWAP_BUY.replace('\\', '')},
+        {'timestamp': 2, 'from_name': 'alice', 'tx_hash': '0x2', 'action_text': SELL},
+        {'timestamp': 3, 'from_name': 'bob', 'tx_hash': '0x3', 'action_text': BANANA_GUN_BUY},
+        {'timestamp': 4, 'from_name': 'mallory', 'tx_hash': '0x4', 'action_text': UNISWAP_BUY.replace('\\', '')},
+    ]
+    assert select_candidates(messages, ['alice', 'bob']) == [(1, 'alice', '0x1', TOKEN), (3, 'bob', '0x3', TOKEN)]
+    assert archive.records == []
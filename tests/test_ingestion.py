@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+from pieces.ingestion import IngestionQueue, ACCEPTED, DUPLICATE, QUEUE_FULL, INVALID
+
+async def ignore(data):
+    pass
+
+def submit_all(*messages, maxsize=10):
+    """Submit `messages` to a fresh queue inside an event loop and return the results."""
+    async def run():
+        queue = IngestionQueue(ignore, maxsize=maxsize)
+        return [queue.submit(message) for message in messages], queue
+    return asyncio.run(run())
+
+@pytest.mark.parametrize('message', [
+    {'text': 'no hash'},
+    {'tx_hash': None},
+    {'tx_hash': ''},
+    {'tx_hash': 123},
+    ['tx_hash', '0xabc'],
+    None,
+])
+def test_messages_without_a_hash_are_invalid(message):
+    results, queue = submit_all(message)
+    assert results == [INVALID]
+    assert queue.counters['invalid'] == 1 and queue.queue.empty()
+
+def test_duplicates_are_rejected():
+    results, queue = submit_all({'tx_hash': '0xabc'}, {'tx_hash': '0xabc'}, {'tx_hash': '0xdef'})
+    assert results == [ACCEPTED, DUPLICATE, ACCEPTED]
+    assert queue.queue.qsize() == 2
+
+def test_full_queue_forgets_the_hash_for_retries():
+    results, queue = submit_all({'tx_hash': '0xabc'}, {'tx_hash': '0xdef'}, maxsize=1)
+    assert results == [ACCEPTED, QUEUE_FULL]
+    assert queue.recent.add('0xdef')
@@ -0,0 +1,76 @@
+import pytest
+
+from pieces import log_prices
+from pieces.address_index import checksum
+from pieces.log_prices import LogPriceFeed, SYNC_TOPIC, SWAP_TOPIC, data_word, signed_data_word
+from pieces.uniswap import VenueSelector
+
+WETH_ADDRESS = '0xC02aaA39b223FE8D0A0E5C4F27eAD9083C756Cc2'
+USDC_ADDRESS = '0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48'  # token0 of its WETH pair
+USDT_ADDRESS = '0xdAC17F958D2ee523a2206206994597C13D831ec7'  # token1 of its WETH pool
+USDC_WETH_PAIR = '0xB4e16d0168e52d35CaCD2c6185b44281Ec28C9Dc'
+WETH_USDT_POOL = '0x11b815efB8f581194ae79006d24E0d814B7697F6'
+
+def encode_words(*values):
+    """ABI-encode int256/uint256 values as log data."""
+    return '0x' + ''.join(format(value % 2 ** 256, '064x') for value in values)
+
+def sync_log(address, reserve0, reserve1, **fields):
+    return {'address': address.lower(), 'topics': [SYNC_TOPIC], 'data': encode_words(reserve0, reserve1), **fields}
+
+def swap_log(address, amount0, amount1, sqrt_price_x96, liquidity, tick):
+    sender = '0x' + '00' * 12 + '68b3465833fb72a70ecdf485e0e4c7bd8665fc45'
+    return {'address': address.lower(), 'topics': [SWAP_TOPIC, sender, sender], 'data': encode_words(amount0, amount1, sqrt_price_x96, liquidity, tick)}
+
+@pytest.fixture
+def selector(monkeypatch):
+    selector = VenueSelector()
+    monkeypatch.setattr(log_prices, 'venue_selector', selector)
+    return selector
+
+@pytest.fixture
+def feed(selector):
+    feed = LogPriceFeed(WETH_ADDRESS)
+    feed.add(USDC_ADDRESS, 6, 'v2', USDC_WETH_PAIR, None)
+    feed.add(USDT_ADDRESS, 6, 'v3', WETH_USDT_POOL, None)
+    return feed
+
+def test_data_words():
+    data = encode_words(5, -2, 2 ** 255)
+    assert data_word(data, 0) == 5
+    assert signed_data_word(data, 1) == -2
+    assert data_word(data, 1) == 2 ** 256 - 2
+    assert signed_data_word(data, 2) == -2 ** 255
+
+def test_sync_log_prices_v2_token(feed, selector):
+    selector.states[checksum(USDC_WETH_PAIR)] = {'kind': 'v2', 'fee': None, 'reserves': (0, 0, 0), 'read_at': 0}
+    changed = feed.apply([sync_log(USDC_WETH_PAIR, 30_000_000 * 10 ** 6, 10_000 * 10 ** 18)])
+    # 10,000 WETH against 30M USDC: one USDC is worth 1/3000 ETH
+    assert changed == {USDC_ADDRESS: pytest.approx(1 / 3000)}
+    assert feed.prices[USDC_ADDRESS] == changed[USDC_ADDRESS]
+    assert selector.state(checksum(USDC_WETH_PAIR))['reserves'] == (30_000_000 * 10 ** 6, 10_000 * 10 ** 18)
+
+def test_swap_log_prices_v3_token(feed, selector):
+    selector.states[checksum(WETH_USDT_POOL)] = {'kind': 'v3', 'fee': 500, 'slot0': (0, 0), 'liquidity': 0, 'read_at': 0}
+    # WETH is token0, so 3000 USDT per WETH is 3000e6 / 1e18 in raw units, below tick 0
+    sqrt_price_x96 = 4339505179874779489431521
+    tick = -196257
+    changed = feed.apply([swap_log(WETH_USDT_POOL, -10 ** 18, 3000 * 10 ** 6, sqrt_price_x96, 7 * 10 ** 18, tick)])
+    assert changed == {USDT_ADDRESS: pytest.approx(1 / 3000, rel=1e-6)}
+    state = selector.state(checksum(WETH_USDT_POOL))
+    assert state['slot0'] == (sqrt_price_x96, tick)
+    assert state['liquidity'] == 7 * 10 ** 18
+
+def test_latest_log_wins_and_others_are_skipped(feed):
+    changed = feed.apply([
+        sync_log(USDC_WETH_PAIR, 30_000_000 * 10 ** 6, 10_000 * 10 ** 18),
+        sync_log(USDC_WETH_PAIR, 30_000_000 * 10 ** 6, 20_000 * 10 ** 18),
+        # Reorged out, from a venue not followed, and a V3 event on a V2 pair
+        sync_log(USDC_WETH_PAIR, 1, 1, removed=True),
+        sync_log('0x' + '11' * 20, 1, 1),
+        swap_log(USDC_WETH_PAIR, 1, 1, 2 ** 96, 1, 0),
+    ])
+    assert changed == {USDC_ADDRESS: pytest.approx(1 / 1500)}
+
+def test_empty_reserves_give_no_price(feed):
+    assert feed.apply([sync_log(USDC_WETH_PAIR, 0, 10 ** 18)]) == {}
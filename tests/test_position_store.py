@@ -0,0 +1,50 @@
+import json
+import sqlite3
+
+from pieces.position_store import PositionStore, POSITION_MOONBAG
+
+HELD = 123_456_789_012_345_678_901_234_567
+WINDOW = {'window_start': 0.0, 'window_first': 0.0, 'window_low': 0.0, 'window_high': 0.0, 'window_count': 0}
+
+def details(token_amount, token_decimals=18):
+    return {'token_address': '0x' + '11' * 20, 'token_amount': token_amount, 'token_decimals': token_decimals}
+
+def test_token_amounts_keep_every_digit(tmp_path):
+    store = PositionStore(str(tmp_path / 'positions.sqlite'))
+    store.open('position', details(HELD), {}, WINDOW)
+    store.record_trade(position_id='position', side='buy', token_amount=HELD)
+    store.set_token_amount('position', details(HELD + 1))
+    ((_, loaded, _, _),) = store.load_open()
+    assert loaded['token_amount'] == HELD + 1
+    assert [trade['token_amount'] for trade in store.trades()] == [HELD + 1]
+    store.close('position', token_amount_left=HELD // 10)
+    (moonbag,) = store.moonbags()
+    assert moonbag['token_amount'] == HELD // 10
+
+def test_whole_token_amounts_are_migrated(tmp_path):
+    path = str(tmp_path / 'positions.sqlite')
+    connection = sqlite3.connect(path)
+    connection.execute(
+        'CREATE TABLE positions (position_id TEXT PRIMARY KEY, status TEXT, token_address TEXT, '
+        'details TEXT, rules TEXT, window_start REAL, window_first REAL, window_low REAL, window_high REAL, '
+        'window_count INTEGER, token_amount_left REAL, sell_tx_hash TEXT, opened_at REAL, closed_at REAL)'
+    )
+    connection.execute(
+        'CREATE TABLE trades (timestamp REAL, position_id TEXT, side TEXT, token_address TEXT, venue TEXT, '
+        'token_amount REAL, eth_amount REAL, price REAL, profit_or_loss REAL, reason TEXT, from_name TEXT, tx_hash TEXT)'
+    )
+    connection.execute('INSERT INTO positions VALUES (?, ?, ?, ?, ?, 0, 0, 0, 0, 0, ?, NULL, 1, NULL)',
+                       ('open', 'open', '0x11', json.dumps(details(1234.5, 6)), '{}', 1234.5))
+    connection.execute('INSERT INTO positions VALUES (?, ?, ?, ?, ?, 0, 0, 0, 0, 0, ?, NULL, 2, 3)',
+                       ('moonbag', POSITION_MOONBAG, '0x11', json.dumps(details(2.0)), '{}', 0.25))
+    connection.execute("INSERT INTO trades VALUES (1, 'open', 'buy', '0x11', NULL, 1234.5, 0.1, 1, NULL, NULL, 'alice', NULL)")
+    connection.commit()
+    connection.close()
+
+    store = PositionStore(path)
+    ((_, loaded, _, _),) = store.load_open()
+    assert loaded['token_amount'] == 1_234_500_000
+    assert [trade['token_amount'] for trade in store.trades()] == [1_234_500_000]
+    assert [moonbag['token_amount'] for moonbag in store.moonbags()] == [25 * 10 ** 16]
+    # Already migrated stores are left alone
+    assert PositionStore(path).load_open()[0][1]['token_amount'] == 1_234_500_000
@@ -0,0 +1,37 @@
+import pytest
+
+from pieces.position_table import PositionTable, amount_to_sell, EXIT_PRICE_INCREASE, EXIT_PRICE_DECREASE
+
+TOKEN = '0x' + '11' * 20
+# More base units than an int64 or a float's mantissa can hold
+HELD = 123_456_789_012_345_678_901_234_567
+
+@pytest.mark.parametrize('token_amount, moonbag', [(HELD, 0.1), (HELD, 0.333333), (7, 0.5), (10 ** 18, 0.0), (1, 0.999999)])
+def test_moonbag_split_is_exact(token_amount, moonbag):
+    sold = amount_to_sell(token_amount, moonbag)
+    assert isinstance(sold, int)
+    assert 0 <= sold <= token_amount
+    assert token_amount - sold == token_amount * round(moonbag * 10 ** 6) // 10 ** 6
+
+def table_with_position(moonbag):
+    table = PositionTable(capacity=1)
+    table.add('position', TOKEN, 1.0, HELD, 0.0, 0.5, 0.2, moonbag, False, 0.01, 10)
+    return table
+
+def test_take_profit_keeps_the_moonbag_in_base_units():
+    (exit,) = table_with_position(0.1).evaluate(1.0, {TOKEN: 2.0})
+    assert exit['reason'] == EXIT_PRICE_INCREASE
+    assert exit['token_amount_to_sell'] == HELD - HELD // 10
+
+def test_stop_loss_sells_the_whole_balance():
+    (exit,) = table_with_position(0.1).evaluate(1.0, {TOKEN: 0.5})
+    assert exit['reason'] == EXIT_PRICE_DECREASE
+    assert exit['token_amount_to_sell'] == HELD
+
+def test_corrected_amount_is_sold():
+    table = table_with_position(0.0)
+    assert table.set_token_amount('position', HELD + 1)
+    assert not table.set_token_amount('missing', 1)
+    (exit,) = table.evaluate(1.0, {TOKEN: 0.5})
+    assert exit['token_amount_to_sell'] == HELD + 1
+    assert len(table) == 0 and table.token_amounts == {}
@@ -0,0 +1,72 @@
+"""
+Quote math against the values the Uniswap contracts return, taken from the V2 pair and
+V3 TickMath/SwapMath test suites of the Uniswap core repositories.
+"""
+from math import isqrt
+
+import pytest
+
+from pieces.quoting import (
+    v2_amount_out, get_sqrt_ratio_at_tick, get_amount0_delta, compute_swap_step, v3_amount_out, min_amount_out,
+    MIN_TICK, MAX_TICK, MIN_SQRT_RATIO, MAX_SQRT_RATIO,
+)
+
+E18 = 10 ** 18
+
+def encode_price_sqrt(reserve1, reserve0):
+    """sqrtPriceX96 of a reserve1/reserve0 price, like encodePriceSqrt in the Uniswap tests."""
+    return isqrt(reserve1 * 2 ** 192 // reserve0)
+
+@pytest.mark.parametrize('amount_in, reserve_in, reserve_out, expected', [
+    (1, 5, 10, 1662497915624478906),
+    (1, 10, 5, 453305446940074565),
+    (2, 5, 10, 2851015155847869602),
+    (2, 10, 5, 831248957812239453),
+    (1, 10, 10, 906610893880149131),
+    (1, 100, 100, 987158034397061298),
+    (1, 1000, 1000, 996006981039903216),
+])
+def test_v2_amount_out_matches_pair(amount_in, reserve_in, reserve_out, expected):
+    assert v2_amount_out(amount_in * E18, reserve_in * E18, reserve_out * E18) == expected
+
+def test_v2_amount_out_empty_pair():
+    assert v2_amount_out(E18, 0, 10 * E18) == 0
+    assert v2_amount_out(0, 5 * E18, 10 * E18) == 0
+
+@pytest.mark.parametrize('tick, expected', [
+    (MIN_TICK, MIN_SQRT_RATIO),
+    (-1, 79224201403219477170569942574),
+    (0, 2 ** 96),
+    (1, 79232123823359799118286999568),
+    (MAX_TICK, MAX_SQRT_RATIO),
+])
+def test_sqrt_ratio_at_tick(tick, expected):
+    assert get_sqrt_ratio_at_tick(tick) == expected
+
+def test_swap_step_capped_at_price_target():
+    price, target = encode_price_sqrt(1, 1), encode_price_sqrt(101, 100)
+    sqrt_next, amount_in, amount_out, fee_amount = compute_swap_step(price, target, 2 * E18, E18, 600)
+    assert (amount_in, amount_out, fee_amount) == (9975124224178055, 9925619580021728, 5988667735148)
+    assert sqrt_next == target
+
+def test_swap_step_fully_spent():
+    price, target = encode_price_sqrt(1, 1), encode_price_sqrt(1000, 100)
+    sqrt_next, amount_in, amount_out, fee_amount = compute_swap_step(price, target, 2 * E18, E18, 600)
+    assert (amount_in, amount_out, fee_amount) == (999400000000000000, 666399946655997866, 600000000000000)
+    assert amount_in + fee_amount == E18
+    assert price < sqrt_next < target
+
+def test_v3_amount_out_without_ticks_is_one_step():
+    price = encode_price_sqrt(1, 1)
+    expected = compute_swap_step(price, MAX_SQRT_RATIO - 1, 2 * E18, E18, 3000)[2]
+    assert v3_amount_out(E18, False, price, 2 * E18, 0, 3000) == expected
+
+def test_v3_amount_out_stops_where_liquidity_ends():
+    # All liquidity sits between ticks 0 and 60, so no input can buy more than that range holds
+    liquidity = 2 * E18
+    in_range = get_amount0_delta(get_sqrt_ratio_at_tick(0), get_sqrt_ratio_at_tick(60), liquidity, False)
+    amount_out = v3_amount_out(1000 * E18, False, get_sqrt_ratio_at_tick(0), liquidity, 0, 3000, {0: liquidity, 60: -liquidity})
+    assert amount_out == in_range
+
+def test_min_amount_out():
+    assert min_amount_out(1000, 5) == 950
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from pieces.replay import REPLAY_PARAMETERS, run_parameter_set
+
+def replay(candidates, ticks, token_count):
+    """A replay over hand-written (timestamp, token id, price) ticks, one tick per timestamp."""
+    timestamps, token_ids, prices = (np.array(column, dtype=dtype) for column, dtype in zip(zip(*ticks), (float, np.int32, float)))
+    last_prices = np.full(token_count, np.nan)
+    last_prices[token_ids] = prices
+    return {
+        'tokens': [f'0x{token_id:040x}' for token_id in range(token_count)], 'candidates': candidates,
+        'ticks': (timestamps, token_ids, prices), 'groups': np.arange(len(ticks) + 1),
+        'last_prices': last_prices, 'market_cap_filter': False,
+    }
+
+def test_signals_without_tx_hash_get_their_own_positions():
+    params = dict(REPLAY_PARAMETERS, AMOUNT_OF_ETH=0.1, PRICE_INCREASE_THRESHOLD=50, PRICE_DECREASE_THRESHOLD=90, MOONBAG=0, NO_CHANGE_TIME_MINUTES=1e6)
+    # v and w buy, v sells, then u buys while w is still open
+    result = run_parameter_set(replay(
+        [(1.0, 'v', '', 0, None), (2.0, 'w', '', 1, None), (4.0, 'u', '', 2, None)],
+        [(1.0, 0, 1.0), (2.0, 1, 1.0), (3.0, 0, 2.0), (4.0, 2, 1.0)],
+        3,
+    ), params)
+    wallets = result['wallets']
+    assert wallets['v']['sells'] == 1 and wallets['v']['profit_or_loss'] == pytest.approx(0.1)
+    assert (wallets['w']['open'], wallets['u']['open']) == (1, 1)
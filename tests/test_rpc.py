@@ -0,0 +1,110 @@
+import time
+
+import pytest
+import requests
+
+from pieces.rpc import RpcPool, RpcUnavailable
+
+class StubResponse:
+    def __init__(self, status_code=200, content=b'{"jsonrpc":"2.0","id":1,"result":"0x1"}', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"HTTP {self.status_code}", response=self)
+
+class StubSession:
+    """Answers every post with `answer`, a response, an exception to raise, or a callable returning either."""
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.posts = 0
+
+    def post(self, url, data, headers, timeout):
+        self.posts += 1
+        answer = self.answer() if callable(self.answer) else self.answer
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+def pool(*answers, **kwargs):
+    kwargs.setdefault('hedge_reads', False)
+    pool = RpcPool([f'https://rpc{index}.invalid/v3/secret-key' for index in range(len(answers))], timeout=1, **kwargs)
+    for endpoint, answer in zip(pool.endpoints, answers):
+        endpoint.session = StubSession(answer)
+    return pool
+
+def posts(pool):
+    return [endpoint.session.posts for endpoint in pool.endpoints]
+
+def test_fails_over_to_next_endpoint():
+    rpc = pool(requests.exceptions.ConnectionError('refused'), StubResponse(content=b'second'))
+    assert rpc.post(b'{}') == b'second'
+    assert posts(rpc) == [1, 1]
+    failed = rpc.endpoints[0]
+    assert failed.failures == 1 and failed.cooldown_until > time.monotonic()
+
+def test_endpoint_cooling_down_is_tried_last():
+    rpc = pool(requests.exceptions.Timeout('slow'), StubResponse(content=b'second'))
+    rpc.post(b'{}')
+    rpc.post(b'{}')
+    assert posts(rpc) == [1, 2]
+
+@pytest.mark.parametrize('response', [StubResponse(500, b'error'), StubResponse(502, b'bad gateway')])
+def test_http_errors_fail_over(response):
+    rpc = pool(response, StubResponse(content=b'second'))
+    assert rpc.post(b'{}') == b'second'
+
+def test_rate_limit_uses_retry_after_as_cooldown():
+    rpc = pool(StubResponse(429, b'', {'Retry-After': '30'}), StubResponse(content=b'second'))
+    assert rpc.post(b'{}') == b'second'
+    assert rpc.endpoints[0].cooldown_until - time.monotonic() == pytest.approx(30, abs=1)
+
+def test_cooldown_doubles_and_success_resets_it():
+    answers = iter([requests.exceptions.ConnectionError('down')] * 2 + [StubResponse()])
+    rpc = pool(lambda: next(answers), max_attempts=1)
+    for _ in range(2):
+        with pytest.raises(RpcUnavailable):
+            rpc.post(b'{}')
+    endpoint = rpc.endpoints[0]
+    assert endpoint.consecutive_failures == 2
+    assert rpc.post(b'{}')
+    assert endpoint.consecutive_failures == 0 and endpoint.cooldown_until == 0.0
+
+def test_raises_when_every_attempt_fails():
+    rpc = pool(requests.exceptions.ConnectionError('a'), requests.exceptions.ConnectionError('b'), max_attempts=3)
+    with pytest.raises(RpcUnavailable, match='All 3 RPC attempts failed'):
+        rpc.post(b'{}')
+    assert sum(posts(rpc)) == 3
+
+def test_no_endpoints():
+    with pytest.raises(RpcUnavailable):
+        RpcPool([]).post(b'{}')
+
+def slow(content, seconds):
+    def answer():
+        time.sleep(seconds)
+        return StubResponse(content=content)
+    return answer
+
+def test_slow_read_is_hedged_to_the_next_endpoint():
+    rpc = pool(slow(b'primary', 1), StubResponse(content=b'backup'), hedge_reads=True)
+    rpc.timeout = 0.3  # The primary has no latency samples yet, so the hedge waits this long
+    assert rpc.post(b'{}') == b'backup'
+    assert (rpc.hedges, rpc.hedge_wins) == (1, 1)
+
+def test_writes_are_never_hedged():
+    rpc = pool(slow(b'primary', 0.5), StubResponse(content=b'backup'), hedge_reads=True)
+    rpc.timeout = 0.3
+    assert rpc.post(b'{}', write=True) == b'primary'
+    assert posts(rpc) == [1, 0]
+    assert rpc.hedges == 0
+
+def test_stats_hide_api_keys():
+    rpc = pool(StubResponse())
+    rpc.post(b'{}')
+    (endpoint,) = rpc.stats()['endpoints']
+    assert endpoint['host'] == 'rpc0.invalid'
+    assert endpoint['requests'] == 1 and endpoint['failures'] == 0
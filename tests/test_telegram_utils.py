@@ -0,0 +1,110 @@
+import json
+
+import pytest
+import requests
+
+from pieces import telegram_utils
+from pieces.telegram_utils import TelegramDispatcher, parse_retry_after
+
+class StubResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.text = body if isinstance(body, str) else json.dumps(body)
+        self.content = self.text.encode()
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"HTTP {self.status_code}", response=self)
+
+class StubSession:
+    """Answers each post with the next scripted response; exceptions in the script are raised instead."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.posts = []
+
+    def post(self, url, data, timeout):
+        self.posts.append(data)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record the waits between attempts instead of sleeping."""
+    sleeps = []
+    monkeypatch.setattr(telegram_utils.time, 'sleep', sleeps.append)
+    return sleeps
+
+def dispatcher(*responses, max_retries=3):
+    dispatcher = TelegramDispatcher(bot_token='token', api_url='http://telegram.invalid', messages_per_second=1000, max_retries=max_retries)
+    dispatcher.session = StubSession(*responses)
+    return dispatcher
+
+def test_delivers_escaped_message(sleeps):
+    telegram = dispatcher(StubResponse(200, {'ok': True}))
+    assert telegram.deliver('chat', 'Price up 1.5%!')
+    assert telegram.session.posts == [{'chat_id': 'chat', 'text': 'Price up 1\\.5%\\!', 'parse_mode': 'MarkdownV2', 'disable_web_page_preview': True}]
+
+def test_rate_limit_waits_retry_after(sleeps):
+    telegram = dispatcher(StubResponse(429, {'ok': False, 'parameters': {'retry_after': 7}}), StubResponse(200, {'ok': True}))
+    assert telegram.deliver('chat', 'hello')
+    assert len(telegram.session.posts) == 2
+    assert max(sleeps) == pytest.approx(7, abs=0.1)
+
+def test_rate_limit_without_json_body_backs_off(sleeps):
+    telegram = dispatcher(StubResponse(429, '<html>Too Many Requests</html>'), StubResponse(429, {'ok': False}), StubResponse(200, {'ok': True}))
+    assert telegram.deliver('chat', 'hello')
+    assert len(telegram.session.posts) == 3
+    # 2 ** attempt for the first and second attempts
+    assert max(sleeps) == pytest.approx(2, abs=0.1)
+
+def test_server_errors_are_retried(sleeps):
+    telegram = dispatcher(StubResponse(502, 'Bad Gateway'), requests.exceptions.ConnectionError('reset'), StubResponse(200, {'ok': True}))
+    assert telegram.deliver('chat', 'hello')
+    assert len(telegram.session.posts) == 3
+
+def test_rejected_message_is_not_retried(sleeps):
+    telegram = dispatcher(StubResponse(400, {'ok': False, 'description': "Bad Request: can't parse entities"}))
+    assert not telegram.deliver('chat', 'hello')
+    assert len(telegram.session.posts) == 1
+
+def test_gives_up_after_max_retries(sleeps):
+    telegram = dispatcher(*[StubResponse(503, 'Unavailable')] * 3, max_retries=2)
+    assert not telegram.deliver('chat', 'hello')
+    assert len(telegram.session.posts) == 3
+
+def test_thread_survives_unexpected_errors():
+    telegram = dispatcher(RuntimeError('boom'), StubResponse(200, {'ok': True}))
+    telegram.coalesce = False
+    telegram.send('first', chat_id='chat')
+    assert telegram.flush(timeout=5)
+    thread = telegram.thread
+    assert thread.is_alive()
+    # send() would start a new thread had the first one died
+    telegram.send('second', chat_id='chat')
+    assert telegram.flush(timeout=5)
+    assert telegram.thread is thread
+    assert [post['text'] for post in telegram.session.posts] == ['first', 'second']
+
+def test_queued_messages_are_coalesced(sleeps):
+    telegram = dispatcher(StubResponse(200, {'ok': True}))
+    for message in ('one', 'two', 'three'):
+        telegram.queue.put(('chat', message))
+    chat_id, message = telegram.queue.get()
+    merged = [message, *telegram.drain_chat(chat_id, len(message))]
+    assert merged == ['one', 'two', 'three']
+
+@pytest.mark.parametrize('body, expected', [
+    ({'parameters': {'retry_after': 3}}, 3),
+    ({'parameters': {}}, 4),
+    ({'ok': False}, 4),
+    ('not json', 4),
+    ([1, 2], 4),
+])
+def test_parse_retry_after(body, expected):
+    assert parse_retry_after(StubResponse(429, body), 4) == expected
@@ -0,0 +1,8 @@
+from web3 import Web3
+
+from pieces.trading import UNISWAP_V2_ROUTER_ADDRESS, uniswap_v2_router
+
+def test_router_address_is_checksummed_uniswap_v2_router():
+    assert UNISWAP_V2_ROUTER_ADDRESS == '0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D'
+    assert Web3.is_checksum_address(UNISWAP_V2_ROUTER_ADDRESS)
+    assert uniswap_v2_router.address == UNISWAP_V2_ROUTER_ADDRESS